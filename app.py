@@ -1,945 +1,144 @@
-from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, flash, abort, send_file, session
+from flask import Flask, request, session, abort, g
 import os
-import pandas as pd
-import requests
-import io
-import logging
-import glob
 import secrets
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from functools import wraps
+import threading
 
 # Import Services
-from services.library_service import (
-    init_db,
-    save_user_upload_with_db,
-    get_materials,
-    get_all_categories,
-    delete_material_by_id,
-    create_user,
-    verify_user,
-    get_user_by_id,
-    get_all_users,
-    delete_user_by_id,
-    update_user_role,
-    admin_reset_password
-)
-app = Flask(__name__)
-app.secret_key = os.environ.get("BANG_SECRET_KEY") or secrets.token_hex(32)
-app.config.update(
-    SESSION_COOKIE_HTTPONLY=True,
-    SESSION_COOKIE_SAMESITE="Lax",
-)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+from services.library_service import init_db, ensure_db
+from services.performance_payload import compress_response
+from services import instrumentation
+from services.storage_sweeper import start_sweeper
+from blueprints import parse_modules, load_blueprint
+from blueprints.common import login_manager, get_csrf_token
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 LIBRARY_PATH = os.path.join(BASE_DIR, "library")
 PERFORMANCE_DIR = os.path.join(BASE_DIR, 'performance_data')
 CORRECTION_EXAMPLE_DIR = os.path.join(BASE_DIR, "test_sheet", "correction")
-CORRECTION_EXAMPLE_STATIC_DIR = os.path.join(CORRECTION_EXAMPLE_DIR, "static")
-os.makedirs(LIBRARY_PATH, exist_ok=True)
-os.makedirs(PERFORMANCE_DIR, exist_ok=True)
+GRADING_SESSION_DIR = os.path.join(BASE_DIR, "grading_sessions")
+PREVIEW_CACHE_DIR = os.path.join(BASE_DIR, "preview_cache")
+
+
+def create_app(modules=None, config=None):
+    """
+    应用工厂。modules 为要启用的功能模块 (列表或逗号分隔字符串)，默认读取 BANG_MODULES，
+    都没有时启用全部模块；core (登录 / 首页 / metrics) 总会注册。
+    所有模块共用 services/ 下同一套批改与成绩分析引擎。
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("BANG_SECRET_KEY") or secrets.token_hex(32)
+    app.config.update(
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE="Lax",
+        LIBRARY_PATH=LIBRARY_PATH,
+        PERFORMANCE_DIR=PERFORMANCE_DIR,
+        CORRECTION_EXAMPLE_DIR=CORRECTION_EXAMPLE_DIR,
+        GRADING_SESSION_DIR=GRADING_SESSION_DIR,
+        PREVIEW_CACHE_DIR=PREVIEW_CACHE_DIR,
+        TTS_API_URL=os.environ.get("BANG_TTS_URL", "http://127.0.0.1:8000"),
+    )
+    if config:
+        app.config.update(config)
+    login_manager.init_app(app)
+
+    app.config['BANG_MODULES'] = parse_modules(modules if modules is not None else os.environ.get("BANG_MODULES"))
+    for name in app.config['BANG_MODULES']:
+        app.register_blueprint(load_blueprint(name))
+
+    register_hooks(app)
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """发布时执行一次：flask --app app init-db"""
+        init_storage(app)
+        init_db()
+        print(">>> Database schema and storage folders are ready.")
+
+    @app.cli.command("sweep-storage")
+    def sweep_storage_command():
+        """立即清理一轮资料库磁盘 (孤立文件 / 过期音频 / 空间统计)：flask --app app sweep-storage"""
+        from services.storage_sweeper import run_sweep
+        report = run_sweep(app.config['LIBRARY_PATH'], force=True)
+        print(f">>> Checked {report['materials']['checked']} material(s), freed {report['freed_bytes']} byte(s).")
+
+    @app.cli.command("precompress")
+    def precompress_command():
+        """为资料库里较大的文本文件 (单词表等) 生成 .gz，下载时直接发送：flask --app app precompress"""
+        from services.media_service import precompress_tree
+        print(f">>> Wrote {precompress_tree(app.config['LIBRARY_PATH'])} precompressed file(s).")
+
+    # 表结构已是最新时只有一次 PRAGMA 查询；后台线程不在这里启动，见 start_background_tasks
+    ensure_db()
+    init_storage(app)
+    return app
+
+
+def start_background_tasks(app):
+    """
+    只由真正对外服务的进程调用 (`python app.py`、gunicorn.conf.py 的 post_worker_init)：
+    flask 命令、基准脚本、测试导入 app 时不会启动后台清理线程。
+    """
+    start_sweeper(app.config['LIBRARY_PATH'])
+
+
+def register_hooks(app):
+    @app.before_request
+    def csrf_protect():
+        if request.method in {"POST", "PUT", "PATCH", "DELETE"}:
+            session_token = session.get("_csrf_token")
+            request_token = request.headers.get("X-CSRF-Token") or request.form.get("csrf_token")
+            if not session_token or not request_token or not secrets.compare_digest(session_token, request_token):
+                abort(403)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = instrumentation.begin_request()
+
+    @app.after_request
+    def record_request_metrics(response):
+        # 先注册、后执行：计时包含后面的压缩
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            server_timing = instrumentation.end_request(started, route, request.method, response.status_code)
+            if server_timing:
+                response.headers['Server-Timing'] = server_timing
+        return response
+
+    @app.after_request
+    def compress_large_responses(response):
+        return compress_response(response, request.headers.get('Accept-Encoding'))
+
+    @app.context_processor
+    def inject_template_globals():
+        return {"csrf_token": get_csrf_token()}
+
+
+def init_storage(app):
+    os.makedirs(app.config['LIBRARY_PATH'], exist_ok=True)
+    os.makedirs(app.config['PERFORMANCE_DIR'], exist_ok=True)
+    os.makedirs(app.config['GRADING_SESSION_DIR'], exist_ok=True)
+    os.makedirs(app.config['PREVIEW_CACHE_DIR'], exist_ok=True)
+
+
+# `python app.py` / `flask --app app` / `gunicorn app:app` 使用的默认实例。
+# 第一次访问 app.app 时才创建 (PEP 562)：只 `import app` 拿 create_app 的基准脚本、
+# 多进程子进程不会在仓库目录里建库建文件夹。
+_default_app = None
+_default_app_guard = threading.Lock()
+
+
+def __getattr__(name):
+    global _default_app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_guard:
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
 
-correction_storage = {
-    "error_records": {},
-    "question_bank": None,
-    "paper_total_score": 0,
-    "col_map": {},
-    "all_questions_info": [],
-    "question_error_counts": {}
-}
-
-class User(UserMixin):
-    def __init__(self, id, username, is_admin=0):
-        self.id = id
-        self.username = username
-        self.is_admin = bool(is_admin)
-
-@login_manager.user_loader
-def load_user(user_id):
-    row = get_user_by_id(user_id)
-    return User(row[0], row[1], row[2]) if row else None
-
-def admin_required(f):
-    @wraps(f)
-    @login_required
-    def decorated_function(*args, **kwargs):
-        if not getattr(current_user, 'is_admin', False):
-            flash("Permission Denied: Admins only.", "error")
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-
-def clean_ans(val):
-    if pd.isna(val):
-        return ""
-    s = str(val).strip()
-    if s.endswith('.0'):
-        s = s[:-2]
-    return s.upper()
-
-
-def normalize_header(value):
-    return str(value).strip().lower()
-
-
-def pick_best_column(columns, preferred_keywords, fallback_keywords):
-    normalized = [(col, normalize_header(col)) for col in columns]
-    for keyword in preferred_keywords:
-        for col, lowered in normalized:
-            if keyword in lowered:
-                return col
-    for keyword in fallback_keywords:
-        for col, lowered in normalized:
-            if keyword in lowered:
-                return col
-    return None
-
-
-CLASS_ID_SEPARATOR = "__"
-
-
-def sanitize_class_component(value):
-    cleaned = "".join([c for c in str(value).strip() if c.isalpha() or c.isdigit() or c in {' ', '_', '-'}]).strip()
-    return cleaned or "Unnamed"
-
-
-def build_class_id(grade, class_name):
-    safe_grade = sanitize_class_component(grade)
-    safe_class = sanitize_class_component(class_name)
-    if not grade:
-        return safe_class
-    return f"{safe_grade}{CLASS_ID_SEPARATOR}{safe_class}"
-
-
-def parse_class_id(class_id):
-    class_id = str(class_id).strip()
-    if CLASS_ID_SEPARATOR in class_id:
-        grade, class_name = class_id.split(CLASS_ID_SEPARATOR, 1)
-        return {
-            "id": class_id,
-            "grade": grade.strip(),
-            "class_name": class_name.strip(),
-            "display_name": f"{grade.strip()} / {class_name.strip()}"
-        }
-    return {
-        "id": class_id,
-        "grade": "Ungrouped",
-        "class_name": class_id,
-        "display_name": class_id
-    }
-
-
-def get_csrf_token():
-    token = session.get("_csrf_token")
-    if not token:
-        token = secrets.token_urlsafe(32)
-        session["_csrf_token"] = token
-    return token
-
-
-@app.before_request
-def csrf_protect():
-    if request.method in {"POST", "PUT", "PATCH", "DELETE"}:
-        session_token = session.get("_csrf_token")
-        request_token = request.headers.get("X-CSRF-Token") or request.form.get("csrf_token")
-        if not session_token or not request_token or not secrets.compare_digest(session_token, request_token):
-            abort(403)
-
-
-@app.context_processor
-def inject_template_globals():
-    return {"csrf_token": get_csrf_token()}
-
-
-init_db()
-# ===========================
-# 📊 Performance Analysis Logic (Enhanced & User-Isolated)
-# ===========================
-def get_class_file_path(user_id, class_name):
-    """根据 User ID 隔离不同账号的班级数据"""
-    user_dir = os.path.join(PERFORMANCE_DIR, f"user_{user_id}")
-    if not os.path.exists(user_dir):
-        os.makedirs(user_dir)
-    safe_name = sanitize_class_component(class_name)
-    return os.path.join(user_dir, f"{safe_name}.csv")
-
-def generate_unified_performance_response(history_df, selected_exams):
-    """Core Engine: 生成可视化对比数据"""
-    if history_df.empty: return {'error': 'No data'}
-    
-    # 🔥 获取该班级所有登记过的学生（包括初始名单的，防止缺考没名字）
-    students = history_df['Name'].dropna().unique().tolist()
-    
-    # 过滤选中的考试，并且排除掉初始化的占位符 __ROSTER__
-    df_selected = history_df[history_df['Exam'].isin(selected_exams) & (history_df['Exam'] != '__ROSTER__')]
-    if df_selected.empty: return {'error': 'Selected exams not found or empty'}
-    
-    exclude_cols = ['Name', 'Exam', 'Total']
-    all_subjects = [c for c in history_df.columns if c not in exclude_cols]
-    valid_subjects = [sub for sub in all_subjects if sub in df_selected.columns and (pd.to_numeric(df_selected[sub], errors='coerce').fillna(0) != 0).any()]
-
-    max_scores = {}
-    for sub in valid_subjects:
-        try: max_scores[sub] = float(pd.to_numeric(history_df[sub], errors='coerce').max())
-        except: max_scores[sub] = 100
-
-    bar_series = []
-    radar_series = []
-    student_details = {stu: {} for stu in students}
-    class_averages = {}
-
-    # 按最后一场考试排序
-    if selected_exams:
-        last_exam = selected_exams[-1]
-        df_last = df_selected[df_selected['Exam'] == last_exam]
-        sorting_totals = []
-        for stu in students:
-            row = df_last[df_last['Name'] == stu]
-            sorting_totals.append(sum(float(row.iloc[0][sub]) for sub in valid_subjects if sub in row.columns) if not row.empty else 0)
-        sorted_pairs = sorted(zip(students, sorting_totals), key=lambda x: x[1], reverse=True)
-        students = [p[0] for p in sorted_pairs]
-
-    for exam in selected_exams:
-        df_exam = df_selected[df_selected['Exam'] == exam]
-        if df_exam.empty: continue
-
-        avgs = []
-        for sub in valid_subjects:
-            if sub in df_exam.columns:
-                val = pd.to_numeric(df_exam[sub], errors='coerce').mean()
-                avgs.append(round(float(val), 2) if pd.notna(val) else 0)
-            else:
-                avgs.append(0)
-                
-        class_averages[exam] = avgs
-        radar_series.append({'value': avgs, 'name': f"{exam} Avg"})
-
-        totals = []
-        for stu in students:
-            row = df_exam[df_exam['Name'] == stu]
-            if not row.empty:
-                t = sum(float(row.iloc[0][sub]) for sub in valid_subjects if sub in row.columns)
-                totals.append(round(t, 2))
-                student_details[stu][exam] = {sub: float(row.iloc[0][sub]) for sub in valid_subjects if sub in row.columns}
-            else:
-                totals.append(0)
-                student_details[stu][exam] = {sub: 0 for sub in valid_subjects}
-
-        bar_series.append({
-            'name': exam, 'type': 'bar', 'data': totals,
-            'label': {'show': True, 'position': 'top'}
-        })
-
-    return {
-        'success': True, 'exam_names': selected_exams, 'students': students,
-        'valid_subjects': valid_subjects, 'max_scores': max_scores,
-        'bar_series': bar_series, 'radar_series': radar_series,
-        'student_details': student_details, 'class_averages': class_averages
-    }
-
-# ===========================
-# 📊 Performance Routes
-# ===========================
-@app.route("/performance")
-@login_required
-def performance_page():
-    return render_template("performance.html")
-
-# --- Class Management ---
-@app.route('/api/performance/classes', methods=['GET'])
-@login_required
-def get_classes():
-    user_dir = os.path.join(PERFORMANCE_DIR, f"user_{current_user.id}")
-    if not os.path.exists(user_dir):
-        return jsonify({'classes': []})
-    files = glob.glob(os.path.join(user_dir, "*.csv"))
-    classes = [parse_class_id(os.path.basename(f).replace('.csv', '')) for f in files]
-    classes.sort(key=lambda item: (item['grade'], item['class_name']))
-    return jsonify({'classes': classes})
-
-@app.route('/api/performance/classes', methods=['POST'])
-@login_required
-def create_class():
-    data = request.json
-    grade = data.get('grade', '').strip()
-    class_name = data.get('class_name', '').strip()
-    students = data.get('students', [])
-    if not class_name: return jsonify({'error': 'Invalid name'})
-
-    class_id = build_class_id(grade, class_name)
-    path = get_class_file_path(current_user.id, class_id)
-    if os.path.exists(path): return jsonify({'error': 'Class already exists'})
-    
-    # 如果创建时提供了名单，存入一个隐藏的 __ROSTER__ 标记
-    if students:
-        df = pd.DataFrame({'Name': students})
-        df['Exam'] = '__ROSTER__'
-        df.to_csv(path, index=False)
-    else:
-        pd.DataFrame(columns=['Name', 'Exam']).to_csv(path, index=False)
-    return jsonify({'success': True, 'class_id': class_id})
-
-@app.route('/api/performance/classes/<class_name>', methods=['DELETE'])
-@login_required
-def delete_class(class_name):
-    path = get_class_file_path(current_user.id, class_name)
-    if os.path.exists(path):
-        os.remove(path)
-        return jsonify({'success': True})
-    return jsonify({'error': 'Class not found'})
-
-# --- Exam Management ---
-@app.route('/api/performance/exams', methods=['GET'])
-@login_required
-def get_performance_exams():
-    class_name = request.args.get('class_name')
-    if not class_name: return jsonify({'error': 'Class name required'})
-    
-    path = get_class_file_path(current_user.id, class_name)
-    if os.path.exists(path):
-        try:
-            df = pd.read_csv(path)
-            if df.empty or 'Exam' not in df.columns: return jsonify({'success': True, 'exams': []})
-            
-            # 过滤掉名单占位符
-            exams = [e for e in df['Exam'].dropna().unique().tolist() if e != '__ROSTER__']
-            if not exams: return jsonify({'success': True, 'exams': []})
-            
-            exclude_cols = ['Name', 'Exam', 'Total']
-            all_subjects = [c for c in df.columns if c not in exclude_cols]
-            trend_data = {'exams': exams, 'averages': {}}
-            
-            for sub in all_subjects:
-                if pd.to_numeric(df[sub], errors='coerce').notna().any():
-                    # 计算平均分时排除掉 __ROSTER__
-                    avgs = df[df['Exam'] != '__ROSTER__'].groupby('Exam', sort=False)[sub].apply(lambda x: pd.to_numeric(x, errors='coerce').mean()).round(2)
-                    trend_data['averages'][sub] = [avgs.get(e, 0) for e in exams]
-                    
-            return jsonify({'success': True, 'exams': exams, 'trend_data': trend_data})
-        except Exception as e: return jsonify({'success': True, 'exams': [], 'error': str(e)})
-    return jsonify({'success': True, 'exams': []})
-
-@app.route('/api/performance/delete', methods=['POST'])
-@login_required
-def delete_performance_exam():
-    data = request.json
-    class_name = data.get('class_name')
-    exam_name = data.get('exam_name')
-    path = get_class_file_path(current_user.id, class_name)
-    
-    if os.path.exists(path):
-        df = pd.read_csv(path)
-        df = df[df['Exam'] != exam_name]
-        df.to_csv(path, index=False)
-        return jsonify({'success': True})
-    return jsonify({'error': 'File not found'})
-
-@app.route('/api/performance/compare', methods=['POST'])
-@login_required
-def compare_performance_exams():
-    data = request.json
-    class_name = data.get('class_name')
-    exam_names = data.get('exam_names', [])
-    path = get_class_file_path(current_user.id, class_name)
-    
-    if not os.path.exists(path): return jsonify({'error': 'Class data not found'})
-    return jsonify(generate_unified_performance_response(pd.read_csv(path), exam_names))
-
-@app.route('/api/performance/upload', methods=['POST'])
-@login_required
-def upload_performance_file():
-    if 'file' not in request.files: return jsonify({'error': 'No file found'})
-    file = request.files['file']
-    exam_name = request.form.get('exam_name', 'Unnamed Exam').strip()
-    class_name = request.form.get('class_name', '').strip()
-    
-    if not class_name: return jsonify({'error': 'Class not specified'})
-    path = get_class_file_path(current_user.id, class_name)
-    
-    try:
-        if file.filename.endswith('.csv'): df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')): df = pd.read_excel(file, engine='openpyxl')
-        else: return jsonify({'error': 'Unsupported format'})
-        
-        df = df.fillna(0)
-        df.rename(columns={df.columns[0]: 'Name'}, inplace=True)
-        
-        subjects = [col for col in df.columns if col != 'Name']
-        for sub in subjects: 
-            df[sub] = pd.to_numeric(df[sub], errors='coerce').fillna(0)
-
-        df['Exam'] = exam_name
-        
-        if os.path.exists(path):
-            history = pd.read_csv(path)
-            history = history[history['Exam'] != exam_name]
-            history = pd.concat([history, df], ignore_index=True).fillna(0)
-        else: 
-            history = df
-            
-        history.to_csv(path, index=False)
-        return jsonify(generate_unified_performance_response(history, [exam_name]))
-    except Exception as e: return jsonify({'error': f'Error: {str(e)}'})
-
-# --- Grade Dashboard ---
-@app.route('/api/performance/grade_overview', methods=['GET'])
-@login_required
-def get_grade_overview():
-    user_dir = os.path.join(PERFORMANCE_DIR, f"user_{current_user.id}")
-    files = glob.glob(os.path.join(user_dir, "*.csv"))
-    all_exams = set()
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            if 'Exam' in df.columns:
-                exams = [e for e in df['Exam'].dropna().unique() if e != '__ROSTER__']
-                all_exams.update(exams)
-        except: pass
-    return jsonify({'exams': sorted(list(all_exams))})
-
-@app.route('/api/performance/compare_grade', methods=['POST'])
-@login_required
-def compare_grade_performance():
-    exam_name = request.json.get('exam_name')
-    selected_grade = request.json.get('grade', '')
-    selected_classes = request.json.get('class_ids', [])
-    user_dir = os.path.join(PERFORMANCE_DIR, f"user_{current_user.id}")
-    files = glob.glob(os.path.join(user_dir, "*.csv"))
-    
-    class_stats = []
-    for f in files:
-        class_id = os.path.basename(f).replace('.csv', '')
-        meta = parse_class_id(class_id)
-        if selected_grade and meta['grade'] != selected_grade:
-            continue
-        if selected_classes and class_id not in selected_classes:
-            continue
-        class_name = meta['display_name']
-        try:
-            df = pd.read_csv(f)
-            df_exam = df[df['Exam'] == exam_name]
-            
-            if not df_exam.empty:
-                exclude = ['Name', 'Exam', 'Total']
-                subjects = [c for c in df.columns if c not in exclude]
-                
-                if 'Total' not in df_exam.columns:
-                    df_exam['Total'] = df_exam[subjects].apply(pd.to_numeric, errors='coerce').sum(axis=1)
-                else:
-                    df_exam['Total'] = pd.to_numeric(df_exam['Total'], errors='coerce').fillna(0)
-                    
-                avg_total = df_exam['Total'].mean()
-                max_total = df_exam['Total'].max()
-                
-                class_stats.append({
-                    'class_id': class_id,
-                    'class': class_name,
-                    'avg_total': round(avg_total, 2) if pd.notna(avg_total) else 0,
-                    'max_total': round(max_total, 2) if pd.notna(max_total) else 0,
-                    'student_count': len(df_exam)
-                })
-        except: pass
-        
-    return jsonify({'exam': exam_name, 'stats': class_stats})
-
-# ===========================
-# 📝 Grading Routes
-# ===========================
-@app.route('/api/correction/upload', methods=['POST'])
-@login_required
-def correction_upload():
-    try:
-        files = request.files
-        if 'student_ans' not in files or 'combined_bank' not in files:
-            return jsonify({"error": "Missing files"}), 400
-        
-        # 读取文件
-        df_s = pd.read_excel(files['student_ans']).dropna(how='all')
-        df_b = pd.read_excel(files['combined_bank']).dropna(how='all')
-        
-        # 1. 清洗列名 (去除空格，转字符串)
-        df_s.columns = df_s.columns.astype(str).str.strip()
-        df_b.columns = df_b.columns.astype(str).str.strip()
-
-        col_map = {
-            'q_id': pick_best_column(df_b.columns, ['question id', 'q_id', 'question no', 'question number'], ['question', 'id', 'no.']),
-            'ans': pick_best_column(df_b.columns, ['correct answer', 'answer key', 'correct ans'], ['answer', 'ans', 'key']),
-            'score': pick_best_column(df_b.columns, ['score', 'points', 'point value'], ['mark']),
-        }
-        if any(value is None for value in col_map.values()):
-            return jsonify({"error": "Question bank must include Question ID, Correct Answer, and Score columns."}), 400
-
-        correction_storage["col_map"] = col_map
-
-        valid_b = df_b[df_b[col_map['q_id']].notna()].copy()
-        qid_series = valid_b[col_map['q_id']].astype(str).str.strip()
-        valid_b = valid_b[~qid_series.str.lower().isin(['total score', 'total', 'summary', 'statistics', 'nan'])]
-
-        ans_map = dict(zip(valid_b[col_map['q_id']].astype(str), valid_b[col_map['ans']]))
-        score_values = pd.to_numeric(valid_b[col_map['score']], errors='coerce').fillna(0)
-        score_map = dict(zip(valid_b[col_map['q_id']].astype(str), score_values))
-        correction_storage["paper_total_score"] = float(score_values.sum())
-
-        all_info = []
-        q_content_col = pick_best_column(df_b.columns, ['question text', 'question', 'content'], ['text', 'title'])
-        for qid in ans_map:
-            content = "No Content"
-            if q_content_col:
-                match = df_b[df_b[col_map['q_id']].astype(str) == qid]
-                if not match.empty:
-                    content = str(match.iloc[0][q_content_col])
-            all_info.append({"q_id": qid, "content": content})
-        correction_storage["all_questions_info"] = all_info
-
-        err_map = {}
-        q_err_counts = {q: 0 for q in ans_map}
-        name_col = pick_best_column(df_s.columns, ['student name', 'name'], ['student'])
-
-        student_cols_map = {}
-        for col in df_s.columns:
-            digits = ''.join(filter(str.isdigit, col))
-            if digits:
-                student_cols_map[digits] = col
-
-        for _, row in df_s.iterrows():
-            name_value = row[name_col] if name_col else row.iloc[0]
-            name = str(name_value).strip()
-            if not name or name.lower() == 'nan':
-                continue
-
-            wrongs = []
-            score = 0
-
-            for qid_bank, corr_ans in ans_map.items():
-                u_ans = ""
-                if qid_bank in df_s.columns:
-                    u_ans = row[qid_bank]
-                else:
-                    bank_digit = ''.join(filter(str.isdigit, str(qid_bank)))
-                    if bank_digit in student_cols_map:
-                        u_ans = row[student_cols_map[bank_digit]]
-
-                if clean_ans(u_ans) == clean_ans(corr_ans):
-                    score += score_map.get(qid_bank, 0)
-                else:
-                    wrongs.append(qid_bank)
-                    q_err_counts[qid_bank] += 1
-
-            err_map[name] = {"wrongs": wrongs, "score": score}
-
-        correction_storage.update({
-            "error_records": err_map,
-            "question_bank": df_b,
-            "question_error_counts": q_err_counts
-        })
-
-        return jsonify({
-            "status": "success",
-            "students": list(err_map.keys()),
-            "paper_total": correction_storage["paper_total_score"],
-            "question_error_counts": q_err_counts
-        })
-        
-        # 2. 智能映射题库列名 (针对您的文件做了优化)
-        col_map = {}
-        for c in df_b.columns:
-            cl = str(c).strip().lower()
-            # 识别题号
-            if any(k in cl for k in ['题号', 'question', 'q_id', 'no.', 'id']): 
-                col_map['q_id'] = c
-            # 识别答案 (加入 '正确答案')
-            if any(k in cl for k in ['正确答案', '答案', 'answer', 'ans', 'key']): 
-                col_map['ans'] = c
-            # 识别分数 (加入 '得分')
-            if any(k in cl for k in ['分值', '分数', '得分', 'score', 'points']): 
-                col_map['score'] = c
-        
-        # 检查是否缺少关键列
-        if len(col_map) < 3:
-            missing = []
-            if 'q_id' not in col_map: missing.append("题号")
-            if 'ans' not in col_map: missing.append("答案")
-            if 'score' not in col_map: missing.append("得分")
-            return jsonify({"error": f"题库文件缺少关键列: {', '.join(missing)}"}), 400
-            
-        correction_storage["col_map"] = col_map
-        
-        # 3. 提取有效题目数据
-        # 过滤掉总分行或无效行
-        valid_b = df_b[df_b[col_map['q_id']].notna()].copy()
-        
-        # 构建映射字典
-        # ans_map: { 'Q1': 'A', 'Q2': 'B' ... }
-        ans_map = dict(zip(valid_b[col_map['q_id']].astype(str), valid_b[col_map['ans']]))
-        # score_map: { 'Q1': 5, 'Q2': 5 ... }
-        score_map = dict(zip(valid_b[col_map['q_id']].astype(str), valid_b[col_map['score']]))
-        
-        correction_storage["paper_total_score"] = float(valid_b[col_map['score']].sum())
-        
-        # 4. 收集题目内容 (用于前端展示)
-        all_info = []
-        # 尝试寻找题目内容列
-        q_content_col = next((c for c in df_b.columns if any(k in str(c) for k in ['内容', 'content', 'text', 'title'])), None)
-        
-        for qid in ans_map:
-            c = "No Content"
-            if q_content_col:
-                r = df_b[df_b[col_map['q_id']].astype(str) == qid]
-                if not r.empty: 
-                    c = str(r.iloc[0][q_content_col])
-            all_info.append({"q_id": qid, "content": c})
-        correction_storage["all_questions_info"] = all_info
-
-        # 5. 核心批改逻辑 (重点修改了这里的匹配算法)
-        err_map = {}
-        q_err_counts = {q: 0 for q in ans_map}
-        
-        # 预处理：建立 "纯数字 -> 答题卡列名" 的映射
-        # 例如：您的答题卡有 'QQ1', 'QQ2'。我们将建立映射 { '1': 'QQ1', '2': 'QQ2' ... }
-        student_cols_map = {}
-        for col in df_s.columns:
-            # 提取列名中的数字
-            digits = ''.join(filter(str.isdigit, col))
-            if digits:
-                student_cols_map[digits] = col
-
-        for _, row in df_s.iterrows():
-            # 假设第一列始终是学生姓名
-            name = str(row.iloc[0]).strip()
-            if not name or name.lower() == 'nan': continue
-            
-            wrongs = []
-            score = 0
-            
-            for qid_bank, corr_ans in ans_map.items():
-                u_ans = ""
-                
-                # 策略 A: 直接匹配 (如果题库是 Q1，答题卡也是 Q1)
-                if qid_bank in df_s.columns:
-                    u_ans = row[qid_bank]
-                else:
-                    # 策略 B: 纯数字匹配 (解决 Q1 与 QQ1 不对应的问题)
-                    # 提取题库题号的数字 (Q1 -> 1)
-                    bank_digit = ''.join(filter(str.isdigit, str(qid_bank)))
-                    
-                    # 在答题卡中找对应数字的列
-                    if bank_digit in student_cols_map:
-                        target_col = student_cols_map[bank_digit]
-                        u_ans = row[target_col]
-                
-                # 判分
-                if clean_ans(u_ans) == clean_ans(corr_ans):
-                    score += score_map.get(qid_bank, 0)
-                else:
-                    wrongs.append(qid_bank)
-                    q_err_counts[qid_bank] += 1
-            
-            err_map[name] = {"wrongs": wrongs, "score": score}
-        
-        correction_storage.update({
-            "error_records": err_map, 
-            "question_bank": df_b, 
-            "question_error_counts": q_err_counts
-        })
-        
-        return jsonify({
-            "status": "success", 
-            "students": list(err_map.keys()), 
-            "paper_total": correction_storage["paper_total_score"], 
-            "question_error_counts": q_err_counts
-        })
-        
-    except Exception as e:
-        logging.error(f"Upload Error: {str(e)}")
-        return jsonify({"error": f"处理失败: {str(e)}"}), 500
-        
-@app.route('/api/correction/get_student/<name>')
-@login_required
-def correction_get_student(name):
-    rec = correction_storage["error_records"].get(name)
-    if not rec: return jsonify({"error":"Not found"}),404
-    return jsonify({"wrong_questions":rec["wrongs"], "total_score":rec["score"], "paper_total":correction_storage["paper_total_score"]})
-
-@app.route('/api/correction/download/student/<name>')
-@login_required
-def correction_dl_student(name):
-    rec = correction_storage["error_records"].get(name)
-    bank = correction_storage["question_bank"]
-    if not rec or bank is None: return "Error",404
-    col_q = correction_storage["col_map"].get('q_id', bank.columns[0])
-    df = bank[bank[col_q].astype(str).isin(map(str, rec["wrongs"]))]
-    out = io.BytesIO()
-    with pd.ExcelWriter(out, engine='openpyxl') as w: df.to_excel(w, index=False)
-    out.seek(0)
-    return send_file(out, as_attachment=True, download_name=f"{name}_Errors.xlsx")
-
-@app.route('/api/correction/download/all')
-@login_required
-def correction_dl_all():
-    if not correction_storage["error_records"]: return "No data",404
-    data = [{"Name":k, "Score":v["score"]} for k,v in correction_storage["error_records"].items()]
-    df = pd.DataFrame(data).sort_values(by="Score", ascending=False)
-    out = io.BytesIO()
-    with pd.ExcelWriter(out, engine='openpyxl') as w: df.to_excel(w, index=False)
-    out.seek(0)
-    return send_file(out, as_attachment=True, download_name="Class_Scores.xlsx")
-
-# ===========================
-# Standard Routes
-# ===========================
-@app.route("/admin", methods=["GET", "POST"])
-@admin_required
-def admin_dashboard():
-    if request.method=="POST":
-        u, p, r = request.form.get("new_username"), request.form.get("new_password"), request.form.get("role")
-        if create_user(u, p, 1 if r=='admin' else 0): flash("Created!", "success")
-        else: flash("Create failed. Use a unique username and an 8+ character password.", "error")
-        return redirect(url_for('admin_dashboard'))
-    return render_template("admin.html", users=get_all_users(), materials=get_materials(None))
-
-@app.route("/admin/promote/<int:uid>", methods=["POST"])
-@admin_required
-def admin_promote(uid): update_user_role(uid,1); return redirect(url_for('admin_dashboard'))
-
-@app.route("/admin/demote/<int:uid>", methods=["POST"])
-@admin_required
-def admin_demote(uid):
-    if uid==1 or uid==current_user.id: flash("Cannot demote", "error")
-    else: update_user_role(uid,0)
-    return redirect(url_for('admin_dashboard'))
-
-@app.route("/admin/delete_user/<int:uid>", methods=["POST"])
-@admin_required
-def admin_del_u(uid):
-    if uid==1 or uid==current_user.id: flash("Cannot delete", "error")
-    else: delete_user_by_id(uid)
-    return redirect(url_for('admin_dashboard'))
-
-@app.route("/admin/delete_material/<int:material_id>", methods=["POST"])
-@admin_required
-def admin_delete_material(material_id):
-    if delete_material_by_id(material_id): flash("Material permanently deleted.", "success")
-    else: flash("Delete failed.", "error")
-    return redirect(url_for('admin_dashboard'))
-
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    if current_user.is_authenticated: return redirect(url_for('index'))
-    if request.method=="POST":
-        act, u, p = request.form.get('action'), request.form.get('username'), request.form.get('password')
-        if act=='register':
-            if create_user(u,p): flash('Registered!', 'success')
-            else: flash('Registration failed. Use a unique username and an 8+ character password.', 'error')
-        else:
-            data = verify_user(u,p)
-            if data: login_user(User(data['id'], u, data['is_admin'])); return redirect(url_for('index'))
-            else: flash('Invalid credentials', 'error')
-    return render_template("login.html")
-
-@app.route("/logout", methods=["POST"])
-@login_required
-def logout(): logout_user(); return redirect(url_for('login'))
-
-@app.route("/")
-@login_required
-def index(): return render_template("index.html", user=current_user)
-
-@app.route("/library", methods=["GET", "POST"])
-@login_required
-def library():
-    success = None
-    error = None
-    
-    # 1. 处理上传逻辑 (保持不变)
-    if request.method == "POST":
-        files = request.files.getlist("material_file")
-        cover = request.files.get("cover_file")
-        select_mode = request.form.get("category_mode")
-        selected_cat = request.form.get("category_select")
-        new_cat = request.form.get("category_new")
-        final_category = new_cat if (select_mode == "new" and new_cat) else (selected_cat or "General")
-
-        if not files or files[0].filename == "":
-            error = "No file selected."
-        else:
-            uploader_type = 'System' if current_user.is_admin else 'User'
-            success_count = 0
-            for file in files:
-                if file and file.filename:
-                    file.stream.seek(0)
-                    if cover: cover.stream.seek(0)
-                    owner_id = None if current_user.is_admin else current_user.id
-                    if save_user_upload_with_db(file, cover, final_category, LIBRARY_PATH, uploader=uploader_type, user_id=owner_id):
-                        success_count += 1
-            if success_count > 0: success = f"Successfully uploaded {success_count} files!"
-            else: error = "Upload failed."
-
-    # 2. 获取数据 & 🔥 核心修复：将 SQLite Row 转为字典 (Dict)
-    sort_option = request.args.get('sort', 'newest')
-    active_tab = request.args.get('tab', 'official')
-    
-    # 获取原始数据
-    raw_official = get_materials(uploader_type='System', sort_by=sort_option)
-    raw_user = get_materials(uploader_type='User', sort_by=sort_option, user_id=current_user.id)
-    
-    # 🔥 强制转换为字典列表，否则前端 Vue 无法解析 (tojson 会报错)
-    official_materials = [dict(row) for row in raw_official]
-    user_materials = [dict(row) for row in raw_user]
-    
-    categories = get_all_categories()
-    
-    return render_template("library.html", 
-                         official_materials=official_materials, 
-                         user_materials=user_materials, 
-                         categories=categories, 
-                         active_tab=active_tab, 
-                         sort_option=sort_option, 
-                         success=success, 
-                         error=error)
-
-# ===========================
-# 📚 Library 下载功能 (修复版)
-# ===========================
-# ===========================
-# 📚 Library 下载功能 (修复版)
-# ===========================
-@app.route("/library/download/<int:material_id>")
-@login_required
-def download_material(material_id):
-    try:
-        # 1. 获取所有素材并查找目标 ID
-        # 传入 None 表示获取所有类型(Official/User)
-        rows = get_materials(None, user_id=current_user.id, include_all=current_user.is_admin)
-        
-        # 转换为字典并查找
-        target = next((dict(m) for m in rows if m['id'] == material_id), None)
-        
-        if target is None:
-            return "错误：数据库中找不到该文件记录", 404
-            
-        # 2. 获取并修复文件路径
-        file_path = target["file_path"]
-        
-        # 🔥 关键修复：确保路径是绝对路径
-        # 如果数据库存的是相对路径，我们需要把它拼接到项目的根目录下
-        if not os.path.isabs(file_path):
-            base_dir = os.path.abspath(os.path.dirname(__file__))
-            file_path = os.path.join(base_dir, file_path)
-        
-        # 3. 检查服务器上文件是否真的存在
-        if not os.path.exists(file_path):
-            return f"错误：服务器物理文件丢失 (路径: {file_path})", 404
-
-        # 4. 获取文件名并处理
-        filename = os.path.basename(file_path)
-        
-        # 5. 发送文件
-        # 使用 send_file 是最稳妥的方式，它可以自动处理大部分流媒体和下载头
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename,
-            conditional=True  # 支持断点续传，防止大文件下载中断
-        )
-        
-    except Exception as e:
-        logging.error(f"Library Download Error: {e}")
-        return f"下载服务出错: {str(e)}", 500
-        
-@app.route("/planner")
-@login_required
-def planner(): return render_template("planner.html")
-
-@app.route("/vocabulary")
-@login_required
-def vocabulary(): return render_template("vocab.html")
-
-@app.route("/audio")
-@login_required
-def audio_page(): return render_template("audio.html")
-@app.route("/correction")
-@login_required
-def correction_page():
-    example_files = {
-        "student_sheet": {
-            "name": "Example -- student answer.xlsx",
-            "download_url": url_for("correction_example_download", filename="Example -- student answer.xlsx"),
-            "preview_url": url_for("correction_example_image", filename="stu_ref.png"),
-            "label": "Student Answer Example",
-            "description": "Reference layout for the uploaded student answer sheet."
-        },
-        "bank_sheet": {
-            "name": "Example -- standard version.xlsx",
-            "download_url": url_for("correction_example_download", filename="Example -- standard version.xlsx"),
-            "preview_url": url_for("correction_example_image", filename="bank_ref.png"),
-            "label": "Question Bank Example",
-            "description": "Reference layout for the uploaded comprehensive bank."
-        }
-    }
-    return render_template("correction.html", example_files=example_files)
-
-
-@app.route("/correction/examples/download/<path:filename>")
-@login_required
-def correction_example_download(filename):
-    allowed = {
-        "Example -- student answer.xlsx",
-        "Example -- standard version.xlsx",
-    }
-    if filename not in allowed:
-        abort(404)
-    return send_file(os.path.join(CORRECTION_EXAMPLE_DIR, filename), as_attachment=True, download_name=filename)
-
-
-@app.route("/correction/examples/image/<path:filename>")
-@login_required
-def correction_example_image(filename):
-    allowed = {"stu_ref.png", "bank_ref.png"}
-    if filename not in allowed:
-        abort(404)
-    return send_file(os.path.join(CORRECTION_EXAMPLE_STATIC_DIR, filename))
-
-@app.route("/api/generate_audio_json", methods=["POST"])
-@login_required
-def gen_audio_json():
-    d = request.json
-    try:
-        r = requests.post("http://127.0.0.1:8000/generate-audio", json={"items":[{"en":i.get("English"),"zh":i.get("Chinese")} for i in d.get("items",[])], "repeat":d.get("repeat",1), "rate":d.get("rate","+0%"), "voice":d.get("voice")}, stream=True)
-        return Response(r.iter_content(8192), content_type="audio/mpeg", headers={"Content-Disposition": f"attachment; filename={d.get('filename')}.mp3"})
-    except Exception as e: return jsonify({"error":str(e)}),500
-
-@app.route("/generate", methods=["POST"])
-@login_required
-def gen_audio_legacy():
-    file = request.files.get("file")
-    filename = request.form.get("filename", "audio").strip()
-    rate = request.form.get("rate", "+0%")
-    voice = request.form.get("voice", "zh-CN-XiaoxiaoNeural")
-    repeat = int(request.form.get("repeat", 1))
-    df = pd.read_excel(file)
-    items = [{"en": str(row["English"]), "zh": str(row.get("Chinese", ""))} for _, row in df.iterrows()]
-    try:
-        response = requests.post("http://127.0.0.1:8000/generate-audio", json={"items": items, "repeat": repeat, "rate": rate, "voice": voice}, stream=True)
-        if response.status_code != 200: return f"Error: {response.text}", 500
-        return Response(response.iter_content(chunk_size=8192), content_type="audio/mpeg", headers={"Content-Disposition": f"attachment; filename={filename}.mp3"})
-    except Exception as e: return f"System Error: {str(e)}", 500
-
-@app.route("/change_password", methods=["GET","POST"])
-@login_required
-def change_password():
-    if request.method=="POST":
-        np, cp = request.form.get("new_password"), request.form.get("confirm_password")
-        if len(np)<8 or np!=cp: flash("Invalid password", "error")
-        else: 
-            admin_reset_password(current_user.id, np)
-            logout_user()
-            flash("Password changed", "success")
-            return redirect(url_for("login"))
-    return render_template("change_password.html")
 
 if __name__ == "__main__":
+    app = create_app()
+    start_background_tasks(app)
     app.run(debug=False, port=5000)
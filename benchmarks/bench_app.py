@@ -0,0 +1,196 @@
+"""
+End-to-end benchmark suite driven through the Flask test client.
+
+Builds a synthetic school (see datagen.py) in a temporary working directory,
+then times grading, performance comparison, grade comparison, export,
+library listing and download. Results are written as JSON so runs can be
+diffed for regressions.
+
+    python benchmarks/bench_app.py --scale 1 --repeat 5 --out bench_scale1.json
+    python benchmarks/bench_app.py --scale 10 --only grading_upload performance_compare
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+USERNAME, PASSWORD, CSRF = "bench_teacher", "bench-password", "bench-csrf"
+
+
+def setup_environment(scale, workdir):
+    """在临时目录里初始化数据库、performance 数据和资料库，返回 (client, context)"""
+    os.chdir(workdir)  # platform.db 使用相对路径
+    os.environ.setdefault("BANG_SECRET_KEY", "bench")
+    from app import create_app
+    from services.library_service import add_file_to_db, create_user, get_materials, update_user_role, verify_user
+
+    # 所有落盘路径都指向临时目录，跑完不会在仓库里留下批改会话 / 预览缓存
+    app = create_app(config={
+        "TESTING": True,
+        "PERFORMANCE_DIR": os.path.join(workdir, "performance_data"),
+        "LIBRARY_PATH": os.path.join(workdir, "library"),
+        "GRADING_SESSION_DIR": os.path.join(workdir, "grading_sessions"),
+        "PREVIEW_CACHE_DIR": os.path.join(workdir, "preview_cache"),
+    })
+
+    create_user(USERNAME, PASSWORD)
+    user_id = verify_user(USERNAME, PASSWORD)["id"]
+    update_user_role(user_id, 1)
+
+    class_ids = datagen.write_class_histories(os.path.join(app.config["PERFORMANCE_DIR"], f"user_{user_id}"), scale)
+    for filename, category, path in datagen.write_materials(app.config["LIBRARY_PATH"], datagen.MATERIALS * scale):
+        add_file_to_db(filename, category, path, uploader="System")
+
+    bank = datagen.make_question_bank()
+    students = datagen.CLASSES_PER_GRADE * datagen.STUDENTS_PER_CLASS * scale
+    context = {
+        "app": app,
+        "class_ids": class_ids,
+        "bank_xlsx": datagen.to_xlsx_bytes(bank),
+        "sheet_xlsx": datagen.to_xlsx_bytes(datagen.make_answer_sheet(bank, students)),
+        "material_id": get_materials("System")[0]["id"],
+        "sizes": {
+            "answer_sheet_rows": students,
+            "questions": len(bank),
+            "classes": len(class_ids),
+            "history_rows_per_class": datagen.STUDENTS_PER_CLASS * (len(datagen.EXAMS) + 1),
+            "materials": datagen.MATERIALS * scale,
+        },
+    }
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_csrf_token"] = CSRF
+    client.post("/login", data={"username": USERNAME, "password": PASSWORD, "action": "login", "csrf_token": CSRF})
+    return client, context
+
+
+def build_cases(client, ctx):
+    headers = {"X-CSRF-Token": CSRF}
+    first_class = ctx["class_ids"][0]
+    grade = first_class.split("__")[0]
+
+    def check(response):
+        assert response.status_code == 200, f"{response.status_code}: {response.get_data(as_text=True)[:200]}"
+        return response
+
+    def grading_upload():
+        check(client.post("/api/correction/upload", headers=headers, content_type="multipart/form-data", data={
+            "student_ans": (io.BytesIO(ctx["sheet_xlsx"]), "Grade 10.xlsx"),
+            "combined_bank": (io.BytesIO(ctx["bank_xlsx"]), "bank.xlsx"),
+        }))
+
+    def performance_compare():
+        # 每次清空响应缓存，测的是完整计算路径
+        ctx["app"].extensions["compare_cache"].clear()
+        check(client.post("/api/performance/compare", headers=headers,
+                          json={"class_name": first_class, "exam_names": datagen.EXAMS, "format": "compact"}))
+
+    def performance_compare_cached():
+        check(client.post("/api/performance/compare", headers=headers,
+                          json={"class_name": first_class, "exam_names": datagen.EXAMS, "format": "compact"}))
+
+    def grade_compare():
+        check(client.post("/api/performance/compare_grade", headers=headers,
+                          json={"exam_name": datagen.EXAMS[-1], "grade": grade}))
+
+    def performance_export():
+        check(client.get(f"/api/performance/export?format=csv&grade={grade}")).get_data()
+
+    def library_listing():
+        check(client.get("/library"))
+
+    def library_download():
+        check(client.get(f"/library/download/{ctx['material_id']}")).get_data()
+
+    return {
+        "grading_upload": grading_upload,
+        "performance_compare": performance_compare,
+        "performance_compare_cached": performance_compare_cached,
+        "grade_compare": grade_compare,
+        "performance_export": performance_export,
+        "library_listing": library_listing,
+        "library_download": library_download,
+    }
+
+
+def run_case(func, repeat, warmup):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": round(min(timings), 6),
+        "median": round(statistics.median(timings), 6),
+        "mean": round(statistics.fmean(timings), 6),
+        "max": round(max(timings), 6),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", REPO_ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1, help="1 = one school, 10 / 100 = district scale")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="run only these cases")
+    parser.add_argument("--out", help="JSON output path (default: bench_scale<N>.json in the current directory)")
+    args = parser.parse_args()
+
+    out_path = os.path.abspath(args.out or f"bench_scale{args.scale}.json")
+    with tempfile.TemporaryDirectory(prefix="bang_bench_") as workdir:
+        started = time.perf_counter()
+        client, ctx = setup_environment(args.scale, workdir)
+        setup_seconds = time.perf_counter() - started
+        cases = build_cases(client, ctx)
+        selected = args.only or list(cases)
+
+        results = {}
+        for name in selected:
+            results[name] = run_case(cases[name], args.repeat, args.warmup)
+            print(f"{name:<28} median {results[name]['median'] * 1000:9.1f} ms   min {results[name]['min'] * 1000:9.1f} ms")
+        os.chdir(REPO_ROOT)
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "setup_seconds": round(setup_seconds, 3),
+            "sizes": ctx["sizes"],
+        },
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Grading scaling benchmark.
+
+Generates a synthetic answer sheet and question bank, then grades the same
+sheet in-process and with 2, 4, ... worker processes.
+
+    python benchmarks/bench_grading.py --students 50000 --questions 80
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.grading_service import build_answer_key, grade_students  # noqa: E402
+
+
+def make_dataset(students, questions, seed=0):
+    rng = np.random.default_rng(seed)
+    options = np.array(list("ABCD"), dtype=object)
+    bank = pd.DataFrame({
+        "Question ID": [f"Q{i + 1}" for i in range(questions)],
+        "Correct Answer": rng.choice(options, questions),
+        "Score": rng.choice([1, 2, 5], questions),
+    })
+    sheet = pd.DataFrame({f"QQ{i + 1}": rng.choice(options, students) for i in range(questions)})
+    sheet.insert(0, "Student Name", [f"Student{i:06d}" for i in range(students)])
+    return sheet, bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--questions", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    sheet, bank = make_dataset(args.students, args.questions)
+    key = build_answer_key(bank, {"q_id": "Question ID", "ans": "Correct Answer", "score": "Score"})
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    # 阈值设为 0，强制多进程路径，便于比较
+    import services.grading_service as grading
+    grading.PARALLEL_GRADING_MIN_CELLS = 0
+
+    print(f"{args.students} students x {args.questions} questions, cpu_count={os.cpu_count()}")
+    print(f"{'workers':>8} {'best (s)':>10} {'speedup':>8}")
+    baseline = None
+    reference = None
+    for workers in worker_counts:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = grade_students(sheet, key, "Student Name", workers=workers)
+            timings.append(time.perf_counter() - start)
+        if reference is None:
+            reference = result["scores"]
+        assert np.array_equal(reference, result["scores"]), "sharded grading diverged from in-process result"
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>10.3f} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Cold-start report: how long a fresh worker takes to import app.py and serve
+the login page, compared with eagerly importing pandas/numpy/requests first
+(the old startup behaviour). Each measurement runs in a new interpreter.
+
+    python benchmarks/bench_import.py --runs 5
+    python benchmarks/bench_import.py --top 15      # also list the slowest imports
+    python benchmarks/bench_import.py --check       # only verify that `import app` stays light
+
+Exits with status 1 when importing app (and serving /login) loads any of
+HEAVY_MODULES, so the check can run in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{preload}
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/login")
+served = time.perf_counter()
+loaded = [m for m in ("pandas", "numpy", "requests", "openpyxl") if m in sys.modules]
+print(json.dumps({{"import": imported - start, "first_request": served - start, "loaded": loaded}}))
+"""
+
+# 这些模块只允许在真正用到的函数里导入；import app 后出现在 sys.modules 里就算回归
+HEAVY_MODULES = ("pandas", "numpy", "requests")
+
+MODES = {
+    "lazy": "",
+    "eager": "import pandas, numpy, requests",
+}
+
+
+def run_probe(mode, workdir):
+    code = PROBE.format(root=REPO_ROOT, preload=MODES[mode])
+    env = dict(os.environ, BANG_SECRET_KEY=os.environ.get("BANG_SECRET_KEY", "bench"))
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def check_light_import(loaded):
+    """import app 之后不应出现 HEAVY_MODULES；出现时打印出来并返回退出码 1"""
+    heavy = [m for m in HEAVY_MODULES if m in loaded]
+    if heavy:
+        print(f"import app loaded heavy modules: {', '.join(heavy)}")
+        return 1
+    print("import app loaded none of: " + ", ".join(HEAVY_MODULES))
+    return 0
+
+
+def slowest_imports(workdir, top):
+    """python -X importtime 的累计耗时排行 (只看 app 自己触发的顶层导入)"""
+    code = f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import app"
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir,
+                         env=dict(os.environ, BANG_SECRET_KEY="bench"),
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if name.startswith("    "):  # 只保留两层以内
+            continue
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0)
+    parser.add_argument("--out", help="optional JSON output path")
+    parser.add_argument("--check", action="store_true", help="only check that import app loads no heavy module")
+    args = parser.parse_args()
+
+    if args.check:
+        with tempfile.TemporaryDirectory(prefix="bang_import_") as workdir:
+            sys.exit(check_light_import(run_probe("lazy", workdir)["loaded"]))
+
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="bang_import_") as workdir:
+        run_probe("lazy", workdir)  # 第一次运行会建库，不计入
+        for mode in MODES:
+            samples = [run_probe(mode, workdir) for _ in range(args.runs)]
+            report[mode] = {
+                "import_median_s": round(statistics.median(s["import"] for s in samples), 4),
+                "first_request_median_s": round(statistics.median(s["first_request"] for s in samples), 4),
+                "heavy_modules_loaded": samples[-1]["loaded"],
+            }
+        top = slowest_imports(workdir, args.top) if args.top else []
+
+    saved = report["eager"]["first_request_median_s"] - report["lazy"]["first_request_median_s"]
+    print(f"{'mode':<8} {'import app':>12} {'first /login':>14}  heavy modules loaded")
+    for mode, row in report.items():
+        print(f"{mode:<8} {row['import_median_s'] * 1000:>10.1f}ms {row['first_request_median_s'] * 1000:>12.1f}ms  "
+              f"{', '.join(row['heavy_modules_loaded']) or '-'}")
+    print(f"boot time saved per worker: {saved * 1000:.1f} ms")
+    if top:
+        print("\nslowest top-level imports (cumulative):")
+        for cumulative_us, name in top:
+            print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    failed = check_light_import(report["lazy"]["heavy_modules_loaded"])
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "modes": report, "saved_s": round(saved, 4),
+                       "slowest_imports_ms": [[name, us / 1000] for us, name in top]}, f, indent=2)
+    sys.exit(failed)
+
+
+if __name__ == "__main__":
+    main()
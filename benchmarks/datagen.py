@@ -0,0 +1,132 @@
+"""
+Synthetic school-scale datasets for the benchmarks.
+
+Scale 1 is roughly one real school: 3 grades x 8 classes x 40 students,
+6 exams per class, a 60-question bank and 200 library materials.
+Scale N multiplies the number of classes and materials by N.
+
+    python benchmarks/datagen.py --scale 10 --out /tmp/bang_data
+"""
+import argparse
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+
+GRADES = ["Grade 10", "Grade 11", "Grade 12"]
+CLASSES_PER_GRADE = 8
+STUDENTS_PER_CLASS = 40
+EXAMS = ["Placement Test", "Unit 1 Quiz", "Midterm Benchmark", "Unit 3 Quiz", "Mock Exam", "Final Exam"]
+SUBJECTS = ["listening", "speaking", "reading", "writing"]
+QUESTIONS = 60
+MATERIALS = 200
+OPTIONS = np.array(list("ABCD"), dtype=object)
+
+
+def class_letters(n):
+    """A..Z, AA..AZ, ... 作为班级名"""
+    names = []
+    for i in range(n):
+        name = ""
+        i += 1
+        while i:
+            i, rem = divmod(i - 1, 26)
+            name = chr(65 + rem) + name
+        names.append(name)
+    return names
+
+
+def make_question_bank(questions=QUESTIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Question ID": [f"Q{i + 1}" for i in range(questions)],
+        "Question": [f"Synthetic question {i + 1}" for i in range(questions)],
+        "Correct Answer": rng.choice(OPTIONS, questions),
+        "Score": rng.choice([1, 2, 2, 5], questions),
+        "Section": [["Listening", "Reading", "Grammar"][i * 3 // questions] for i in range(questions)],
+    })
+
+
+def make_answer_sheet(bank, students, accuracy=0.7, seed=1, name_prefix="Student"):
+    """每个学生按 accuracy 的概率答对，否则随机选一个选项；少量留空"""
+    rng = np.random.default_rng(seed)
+    answers = bank["Correct Answer"].to_numpy(dtype=object)
+    correct = rng.random((students, len(answers))) < accuracy
+    guesses = rng.choice(OPTIONS, (students, len(answers)))
+    sheet = np.where(correct, answers[np.newaxis, :], guesses)
+    sheet[rng.random(sheet.shape) < 0.02] = ""
+    df = pd.DataFrame(sheet, columns=[f"Q{i + 1}" for i in range(len(answers))])
+    df.insert(0, "Student Name", [f"{name_prefix} {i:05d}" for i in range(students)])
+    return df
+
+
+def make_class_history(class_label, students=STUDENTS_PER_CLASS, exams=EXAMS, seed=2):
+    """一个班级的 performance CSV：名单行 + 每场考试每个学生一行"""
+    rng = np.random.default_rng(seed)
+    names = [f"{class_label} S{i:03d}" for i in range(students)]
+    ability = rng.normal(70, 8, students)
+    frames = [pd.DataFrame({"Name": names, "Exam": "__ROSTER__"})]
+    for k, exam in enumerate(exams):
+        drift = ability + k * rng.normal(0.5, 1.5, students)
+        scores = {sub: np.clip(np.round(drift + rng.normal(0, 5, students)), 0, 100) for sub in SUBJECTS}
+        frames.append(pd.DataFrame({"Name": names, **scores, "Exam": exam}))
+    return pd.concat(frames, ignore_index=True).fillna(0)
+
+
+def write_class_histories(directory, scale=1, seed=3):
+    """按 "年级__班级.csv" 写入 performance 目录，返回 class_id 列表"""
+    os.makedirs(directory, exist_ok=True)
+    class_ids = []
+    for g, grade in enumerate(GRADES):
+        for c, letter in enumerate(class_letters(CLASSES_PER_GRADE * scale)):
+            class_id = f"{grade}__{letter}"
+            make_class_history(class_id, seed=seed + g * 1000 + c).to_csv(os.path.join(directory, f"{class_id}.csv"), index=False)
+            class_ids.append(class_id)
+    return class_ids
+
+
+def write_materials(directory, count, size_kb=64, seed=4):
+    """生成 count 个资料文件 (txt)，返回 [(文件名, 分类, 路径)]"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    categories = ["Chinese", "English", "French", "General"]
+    payload = rng.integers(32, 127, size_kb * 1024, dtype=np.uint8).tobytes()
+    materials = []
+    for i in range(count):
+        filename = f"material_{i:05d}.txt"
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as f:
+            f.write(payload)
+        materials.append((filename, categories[i % len(categories)], path))
+    return materials
+
+
+def to_xlsx_bytes(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    bank = make_question_bank()
+    # 答题卡是一个年级的全部学生
+    students = CLASSES_PER_GRADE * STUDENTS_PER_CLASS * args.scale
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, "question_bank.xlsx"), "wb") as f:
+        f.write(to_xlsx_bytes(bank))
+    with open(os.path.join(args.out, "answer_sheet.xlsx"), "wb") as f:
+        f.write(to_xlsx_bytes(make_answer_sheet(bank, students)))
+    class_ids = write_class_histories(os.path.join(args.out, "performance_data"), args.scale)
+    materials = write_materials(os.path.join(args.out, "library"), MATERIALS * args.scale)
+    print(f"{students} answer-sheet rows, {len(class_ids)} classes, {len(materials)} materials -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import importlib
+
+
+# 功能模块 -> 蓝图所在模块。core (登录 / 首页 / metrics) 总会注册，其余按部署需要选择，
+# 例如批改、成绩分析这类 CPU 密集的 worker 可以单独起一组进程：BANG_MODULES=correction,performance
+CORE_MODULE = "core"
+MODULES = {
+    "core": "blueprints.core",
+    "library": "blueprints.library",
+    "planner": "blueprints.planner",
+    "performance": "blueprints.performance",
+    "correction": "blueprints.correction",
+    "audio": "blueprints.audio",
+    "admin": "blueprints.admin",
+}
+
+
+def parse_modules(value):
+    """"performance, correction" / 列表 -> 规范化的模块名列表；空值表示全部模块"""
+    if not value:
+        return list(MODULES)
+    names = value.split(",") if isinstance(value, str) else list(value)
+    names = [n.strip().lower() for n in names if n and n.strip()]
+    unknown = [n for n in names if n not in MODULES]
+    if unknown:
+        raise ValueError(f"Unknown BANG modules: {', '.join(unknown)} (available: {', '.join(MODULES)})")
+    if CORE_MODULE not in names:
+        names.insert(0, CORE_MODULE)
+    return names
+
+
+def load_blueprint(name):
+    """只在需要时导入蓝图模块，未启用的模块连同它的依赖都不会被加载"""
+    return importlib.import_module(MODULES[name]).bp
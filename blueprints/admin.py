@@ -0,0 +1,97 @@
+from flask import Blueprint, render_template, request, redirect, url_for, Response, jsonify, flash
+from flask_login import current_user
+
+from services import instrumentation
+from services.library_service import (
+    create_user,
+    delete_user_by_id,
+    update_user_role,
+    delete_material_by_id,
+    get_all_categories,
+    query_users,
+    query_materials,
+    admin_stats
+)
+from blueprints.common import admin_required
+
+
+bp = Blueprint('admin', __name__)
+
+
+@bp.route("/admin", methods=["GET", "POST"])
+@admin_required
+def admin_dashboard():
+    if request.method=="POST":
+        u, p, r = request.form.get("new_username"), request.form.get("new_password"), request.form.get("role")
+        if create_user(u, p, 1 if r=='admin' else 0): flash("Created!", "success")
+        else: flash("Create failed. Use a unique username and an 8+ character password.", "error")
+        return redirect(url_for('admin.admin_dashboard'))
+    # 列表和统计由页面通过 /api/admin/* 分页拉取，这里不再把整张表渲染进模板
+    return render_template("admin.html", categories=get_all_categories())
+
+
+@bp.route("/api/admin/users")
+@admin_required
+def api_admin_users():
+    args = request.args
+    return jsonify(query_users(args.get("page", 1, type=int), args.get("per_page", 20, type=int),
+                               q=args.get("q", "").strip() or None, role=args.get("role") or None,
+                               sort=args.get("sort", "id"), order=args.get("order", "desc")))
+
+
+@bp.route("/api/admin/materials")
+@admin_required
+def api_admin_materials():
+    args = request.args
+    return jsonify(query_materials(args.get("page", 1, type=int), args.get("per_page", 20, type=int),
+                                   q=args.get("q", "").strip() or None, category=args.get("category") or None,
+                                   uploader=args.get("uploader") or None, user_id=args.get("user_id", type=int),
+                                   sort=args.get("sort", "upload_time"), order=args.get("order", "desc")))
+
+
+@bp.route("/api/admin/stats")
+@admin_required
+def api_admin_stats():
+    days = min(max(request.args.get("days", 30, type=int), 1), 365)
+    return jsonify(admin_stats(active_days=days))
+
+
+@bp.route("/admin/promote/<int:uid>", methods=["POST"])
+@admin_required
+def admin_promote(uid): update_user_role(uid,1); return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route("/admin/demote/<int:uid>", methods=["POST"])
+@admin_required
+def admin_demote(uid):
+    if uid==1 or uid==current_user.id: flash("Cannot demote", "error")
+    else: update_user_role(uid,0)
+    return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route("/admin/delete_user/<int:uid>", methods=["POST"])
+@admin_required
+def admin_del_u(uid):
+    if uid==1 or uid==current_user.id: flash("Cannot delete", "error")
+    else: delete_user_by_id(uid)
+    return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route("/admin/delete_material/<int:material_id>", methods=["POST"])
+@admin_required
+def admin_delete_material(material_id):
+    if delete_material_by_id(material_id): flash("Material permanently deleted.", "success")
+    else: flash("Delete failed.", "error")
+    return redirect(url_for('admin.admin_dashboard'))
+
+@bp.route("/admin/profile")
+@admin_required
+def admin_profile():
+    """按需采样 profiler：?seconds=5，返回 collapsed stacks 文本 (可生成火焰图)"""
+    seconds = request.args.get("seconds", 5, type=float)
+    interval = request.args.get("interval", 0.005, type=float)
+    # 写成 not (a <= x <= b)，NaN 也会被拒绝
+    if not instrumentation.PROFILE_MIN_SECONDS <= seconds <= instrumentation.PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be between {instrumentation.PROFILE_MIN_SECONDS} and {instrumentation.PROFILE_MAX_SECONDS}"}), 400
+    if not interval >= instrumentation.PROFILE_MIN_INTERVAL:
+        return jsonify({"error": f"interval must be at least {instrumentation.PROFILE_MIN_INTERVAL}"}), 400
+    result = instrumentation.sample_stacks(seconds, interval)
+    if result is None: return jsonify({"error": "A profile is already running"}), 409
+    return Response(result, content_type="text/plain; charset=utf-8")
@@ -0,0 +1,87 @@
+import os
+import re
+
+from flask import Blueprint, current_app, render_template, request, Response, jsonify, url_for, abort
+from flask_login import login_required, current_user
+from werkzeug.security import safe_join
+
+from services.instrumentation import span
+from services.media_service import send_media, content_disposition
+from services.audio_service import save_audio_stream
+
+
+bp = Blueprint('audio', __name__)
+
+
+def tts_url():
+    return current_app.config['TTS_API_URL'].rstrip('/') + "/generate-audio"
+
+
+def audio_dir():
+    return os.path.join(current_app.config['LIBRARY_PATH'], "audio")
+
+
+def saved_audio_response(chunks, filename):
+    """生成结果存进 library/audio，返回可拖动进度条播放的地址和下载地址"""
+    relative = save_audio_stream(chunks, audio_dir(), current_user.id)
+    return jsonify({
+        "url": url_for('audio.serve_audio', filename=relative),
+        "download_url": url_for('audio.serve_audio', filename=relative, download=filename),
+    })
+
+
+@bp.route("/audio")
+@login_required
+def audio_page(): return render_template("audio.html")
+
+@bp.route("/api/generate_audio_json", methods=["POST"])
+@login_required
+def gen_audio_json():
+    import requests
+    d = request.json
+    try:
+        with span("tts_proxy"):
+            r = requests.post(tts_url(), json={"items":[{"en":i.get("English"),"zh":i.get("Chinese")} for i in d.get("items",[])], "repeat":d.get("repeat",1), "rate":d.get("rate","+0%"), "voice":d.get("voice")}, stream=True)
+        if d.get("save"):
+            if r.status_code != 200: return jsonify({"error": r.text}), 502
+            return saved_audio_response(r.iter_content(8192), d.get('filename') or 'audio')
+        return Response(r.iter_content(8192), content_type="audio/mpeg", headers={"Content-Disposition": content_disposition("attachment", f"{d.get('filename')}.mp3")})
+    except Exception as e: return jsonify({"error":str(e)}),500
+
+@bp.route("/generate", methods=["POST"])
+@login_required
+def gen_audio_legacy():
+    import pandas as pd
+    import requests
+    file = request.files.get("file")
+    filename = request.form.get("filename", "audio").strip()
+    rate = request.form.get("rate", "+0%")
+    voice = request.form.get("voice", "zh-CN-XiaoxiaoNeural")
+    repeat = int(request.form.get("repeat", 1))
+    df = pd.read_excel(file)
+    items = [{"en": str(row["English"]), "zh": str(row.get("Chinese", ""))} for _, row in df.iterrows()]
+    try:
+        with span("tts_proxy"):
+            response = requests.post(tts_url(), json={"items": items, "repeat": repeat, "rate": rate, "voice": voice}, stream=True)
+        if response.status_code != 200: return f"Error: {response.text}", 500
+        if request.form.get("play"):
+            return saved_audio_response(response.iter_content(chunk_size=8192), filename)
+        return Response(response.iter_content(chunk_size=8192), content_type="audio/mpeg", headers={"Content-Disposition": content_disposition("attachment", f"{filename}.mp3")})
+    except Exception as e: return f"System Error: {str(e)}", 500
+
+@bp.route("/audio/files/<path:filename>")
+@login_required
+def serve_audio(filename):
+    """
+    library/audio 下的音频：支持 Range / 多段 Range，播放器拖动进度条时只取需要的片段。
+    u<用户id>/ 目录下是生成的音频，只有本人 (和管理员) 能访问；?download=名称 时作为附件下载。
+    """
+    owner = re.match(r'u(\d+)/', filename)
+    if owner and int(owner.group(1)) != current_user.id and not current_user.is_admin:
+        abort(404)
+    path = safe_join(audio_dir(), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    download = request.args.get('download')
+    return send_media(path, mimetype='audio/mpeg' if path.endswith('.mp3') else None,
+                      download_name=f"{download}.mp3" if download else None, as_attachment=bool(download))
@@ -0,0 +1,71 @@
+import secrets
+from functools import wraps
+
+from flask import current_app, request, redirect, url_for, jsonify, make_response, flash, session
+from flask_login import LoginManager, UserMixin, login_required, current_user
+
+from services.library_service import get_user_by_id
+from services.http_cache import make_etag
+from services.performance_service import user_data_dir, get_class_file_path
+
+
+# 各蓝图共用的登录、权限、CSRF 与条件请求工具
+login_manager = LoginManager()
+login_manager.login_view = 'core.login'
+
+
+class User(UserMixin):
+    def __init__(self, id, username, is_admin=0):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    row = get_user_by_id(user_id)
+    return User(row[0], row[1], row[2]) if row else None
+
+
+def admin_required(f):
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if not getattr(current_user, 'is_admin', False):
+            flash("Permission Denied: Admins only.", "error")
+            return redirect(url_for('core.index'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def get_csrf_token():
+    token = session.get("_csrf_token")
+    if not token:
+        token = secrets.token_urlsafe(32)
+        session["_csrf_token"] = token
+    return token
+
+
+def conditional_response(version, build):
+    """
+    以数据版本生成 ETag：客户端带相同 If-None-Match 时直接 304，不再重新计算；
+    Cache-Control 要求浏览器每次都回来校验。build() 返回 JSON 数据或渲染好的页面。
+    """
+    etag = make_etag(current_user.id, request.full_path, version)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        payload = build()
+        response = jsonify(payload) if isinstance(payload, (dict, list)) else make_response(payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def user_performance_dir():
+    return user_data_dir(current_app.config['PERFORMANCE_DIR'], current_user.id)
+
+
+def class_file_path(class_name):
+    """当前账号某个班级的成绩 CSV (performance 与 correction 蓝图共用)"""
+    return get_class_file_path(current_app.config['PERFORMANCE_DIR'], current_user.id, class_name)
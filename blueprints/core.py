@@ -0,0 +1,132 @@
+import secrets
+
+from flask import Blueprint, render_template, request, redirect, url_for, Response, flash, abort, jsonify
+from flask_login import login_user, login_required, logout_user, current_user
+
+from services import instrumentation
+from services.library_service import create_user, verify_user, admin_reset_password
+from services.column_profiles import PROFILE_FIELDS, header_fingerprint, get_profile, list_profiles, save_profile, delete_profile
+from services.correction_service import detect_bank_columns, detect_sheet_columns
+from blueprints.common import User, get_csrf_token
+
+
+# 各类表格没有档案时的自动识别规则 (成绩上传表默认第一列是姓名)
+PROFILE_DETECTORS = {
+    'bank': detect_bank_columns,
+    'sheet': detect_sheet_columns,
+    'performance': lambda columns: {'name': columns[0] if columns else None},
+}
+
+
+# 登录 / 首页 / 账号设置，以及每个 worker 都要有的 /metrics，所有部署都会注册
+bp = Blueprint('core', __name__)
+
+
+def _metrics_authorized():
+    """
+    带正确 Bearer 令牌 (BANG_METRICS_TOKEN) 的抓取请求，或已登录的管理员。
+    不看 remote_addr：放在反向代理后面时所有请求都来自 127.0.0.1。
+    """
+    token = instrumentation.METRICS_TOKEN
+    auth = request.headers.get("Authorization", "")
+    if token and auth.startswith("Bearer ") and secrets.compare_digest(auth[7:].strip(), token):
+        return True
+    return current_user.is_authenticated and bool(getattr(current_user, 'is_admin', False))
+
+
+@bp.route("/metrics")
+def metrics():
+    """Prometheus 抓取端点：需 BANG_METRICS=1；计数只属于当前进程，多 worker 时每次抓到的是其中一个"""
+    if not instrumentation.ENABLED or not _metrics_authorized():
+        abort(404)
+    return Response(instrumentation.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@bp.route("/csrf-token")
+def csrf_token():
+    """当前会话的 CSRF token；可缓存 (ETag) 的页面不内嵌 token，由 base.html 从这里取"""
+    response = jsonify({"csrf_token": get_csrf_token()})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if current_user.is_authenticated: return redirect(url_for('core.index'))
+    if request.method=="POST":
+        act, u, p = request.form.get('action'), request.form.get('username'), request.form.get('password')
+        if act=='register':
+            if create_user(u,p): flash('Registered!', 'success')
+            else: flash('Registration failed. Use a unique username and an 8+ character password.', 'error')
+        else:
+            data = verify_user(u,p)
+            if data: login_user(User(data['id'], u, data['is_admin'])); return redirect(url_for('core.index'))
+            else: flash('Invalid credentials', 'error')
+    return render_template("login.html")
+
+@bp.route("/logout", methods=["POST"])
+@login_required
+def logout(): logout_user(); return redirect(url_for('core.login'))
+
+@bp.route("/")
+@login_required
+def index(): return render_template("index.html", user=current_user)
+
+@bp.route("/vocabulary")
+@login_required
+def vocabulary(): return render_template("vocab.html")
+
+@bp.route("/change_password", methods=["GET","POST"])
+@login_required
+def change_password():
+    if request.method=="POST":
+        np, cp = request.form.get("new_password"), request.form.get("confirm_password")
+        if len(np)<8 or np!=cp: flash("Invalid password", "error")
+        else:
+            admin_reset_password(current_user.id, np)
+            logout_user()
+            flash("Password changed", "success")
+            return redirect(url_for("core.login"))
+    return render_template("change_password.html")
+
+
+# ===========================
+# 🗂 Column Mapping Profiles
+# ===========================
+@bp.route('/api/column_profiles', methods=['GET'])
+@login_required
+def column_profiles_list():
+    kind = request.args.get('kind') or None
+    if kind and kind not in PROFILE_FIELDS: return jsonify({'error': 'Unknown profile kind'}), 400
+    return jsonify({'profiles': list_profiles(current_user.id, kind)})
+
+@bp.route('/api/column_profiles/detect', methods=['POST'])
+@login_required
+def column_profiles_detect():
+    """给定表头，返回已保存的档案 (如有) 和自动识别结果，前端据此让老师确认或修改"""
+    data = request.json or {}
+    kind, columns = data.get('kind'), [str(c).strip() for c in data.get('columns') or []]
+    if kind not in PROFILE_FIELDS: return jsonify({'error': 'Unknown profile kind'}), 400
+    if not columns: return jsonify({'error': 'Header row required'}), 400
+    fingerprint = header_fingerprint(columns)
+    return jsonify({'fingerprint': fingerprint, 'fields': PROFILE_FIELDS[kind],
+                    'profile': get_profile(current_user.id, kind, fingerprint),
+                    'detected': PROFILE_DETECTORS[kind](columns)})
+
+@bp.route('/api/column_profiles', methods=['POST'])
+@login_required
+def column_profiles_save():
+    """保存 (或修正) 一种表头的列映射：{kind, columns: 表头行, mapping: {字段: 列名}, name}"""
+    data = request.json or {}
+    columns = [str(c).strip() for c in data.get('columns') or []]
+    if not columns or not isinstance(data.get('mapping'), dict):
+        return jsonify({'error': 'Header row and mapping required'}), 400
+    try:
+        profile = save_profile(current_user.id, data.get('kind'), columns, data['mapping'], data.get('name'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'profile': profile})
+
+@bp.route('/api/column_profiles/<kind>/<fingerprint>', methods=['DELETE'])
+@login_required
+def column_profiles_delete(kind, fingerprint):
+    if not delete_profile(current_user.id, kind, fingerprint): return jsonify({'error': 'Profile not found'}), 404
+    return jsonify({'success': True})
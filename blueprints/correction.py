@@ -0,0 +1,253 @@
+import io
+import os
+import logging
+
+from flask import Blueprint, current_app, render_template, request, jsonify, abort, send_file, url_for
+from flask_login import login_required, current_user
+
+from services.grading_service import section_subtotals, combine_results
+from services.item_analysis import item_analysis
+from services.performance_store import append_exam
+from services.performance_service import class_reindexer
+from services.correction_service import GradingInputError, review_queue
+from services.grading_jobs import (grade_and_save, submit_grading_job, get_job, load_grading_session,
+                                   review_grading_session, cache_session_analysis)
+from blueprints.common import class_file_path
+
+
+bp = Blueprint('correction', __name__)
+
+
+def grading_session():
+    """当前账号最近一次 (或 ?session_id= 指定的) 批改会话，存放在磁盘上，任意 worker 都能读到"""
+    return load_grading_session(current_user.id, request.args.get('session_id'))
+
+
+def read_uploads(batch):
+    """把上传文件读成 bytes 交给批改引擎；缺文件时返回错误信息"""
+    bank = request.files.get('combined_bank')
+    if batch:
+        student_files = [f for f in request.files.getlist('student_ans') if f and f.filename]
+    else:
+        student_files = [request.files['student_ans']] if 'student_ans' in request.files else []
+    if not bank:
+        return None, None, "Missing question bank" if batch else "Missing files"
+    if not student_files:
+        return None, None, "Missing answer sheets" if batch else "Missing files"
+    return bank.read(), [(f.filename, f.read()) for f in student_files], None
+
+def grade_upload(batch):
+    try:
+        bank_raw, sheets, error = read_uploads(batch)
+        if error: return jsonify({"error": error}), 400
+        return jsonify(grade_and_save(current_app.config['GRADING_SESSION_DIR'], current_user.id, bank_raw, sheets, batch))
+    except GradingInputError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"{'Batch Upload' if batch else 'Upload'} Error: {str(e)}")
+        return jsonify({"error": f"处理失败: {str(e)}"}), 500
+
+# ===========================
+# 📝 Grading Routes
+# ===========================
+@bp.route('/api/correction/upload', methods=['POST'])
+@login_required
+def correction_upload():
+    """同步批改一个班级 (小文件用)；大文件请走 /api/correction/jobs"""
+    return grade_upload(batch=False)
+
+@bp.route('/api/correction/batch_upload', methods=['POST'])
+@login_required
+def correction_batch_upload():
+    """一份题库 + 多个班级：一个工作簿多张 sheet (每张一个班)，或者多个答题卡文件"""
+    return grade_upload(batch=True)
+
+@bp.route('/api/correction/jobs', methods=['POST'])
+@login_required
+def correction_submit_job():
+    """
+    后台批改：立即返回 job_id，之后轮询 /api/correction/jobs/<job_id> 查看阶段和进度。
+    表单字段同 upload / batch_upload，batch=1 表示批量模式。
+    """
+    batch = request.form.get('batch') in {'1', 'true', 'on'}
+    bank_raw, sheets, error = read_uploads(batch)
+    if error: return jsonify({"error": error}), 400
+    job_id = submit_grading_job(current_app.config['GRADING_SESSION_DIR'], current_user.id, bank_raw, sheets, batch)
+    return jsonify({"job_id": job_id, "status": "queued",
+                    "status_url": url_for('correction.correction_job_status', job_id=job_id)}), 202
+
+@bp.route('/api/correction/jobs/<job_id>')
+@login_required
+def correction_job_status(job_id):
+    job = get_job(job_id, current_user.id)
+    if job is None: return jsonify({"error": "Job not found"}), 404
+    return jsonify({key: job[key] for key in ("status", "stage", "percent", "message", "error", "session_id", "result")}
+                   | {"job_id": job_id})
+
+@bp.route('/api/correction/get_student/<path:name>')
+@login_required
+def correction_get_student(name):
+    correction_storage = grading_session()
+    rec = correction_storage["error_records"].get(name) if correction_storage else None
+    if not rec: return jsonify({"error":"Not found"}),404
+    return jsonify({"wrong_questions":rec["wrongs"], "total_score":rec["score"], "paper_total":correction_storage["paper_total_score"]})
+
+@bp.route('/api/correction/download/student/<path:name>')
+@login_required
+def correction_dl_student(name):
+    import pandas as pd
+    correction_storage = grading_session()
+    if not correction_storage: return "Error",404
+    rec = correction_storage["error_records"].get(name)
+    bank = correction_storage["question_bank"]
+    if not rec or bank is None: return "Error",404
+    col_q = correction_storage["col_map"].get('q_id', bank.columns[0])
+    df = bank[bank[col_q].astype(str).isin(map(str, rec["wrongs"]))]
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine='openpyxl') as w: df.to_excel(w, index=False)
+    out.seek(0)
+    return send_file(out, as_attachment=True, download_name=f"{name.replace('/', '-')}_Errors.xlsx")
+
+@bp.route('/api/correction/download/all')
+@login_required
+def correction_dl_all():
+    import pandas as pd
+    correction_storage = grading_session()
+    if not correction_storage or not correction_storage["error_records"]: return "No data",404
+    data = [({"Class":v["class"], "Name":v["name"]} if "class" in v else {"Name":k}) | {"Score":v["score"]}
+            for k,v in correction_storage["error_records"].items()]
+    df = pd.DataFrame(data).sort_values(by="Score", ascending=False)
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine='openpyxl') as w: df.to_excel(w, index=False)
+    out.seek(0)
+    return send_file(out, as_attachment=True, download_name="Class_Scores.xlsx")
+
+@bp.route('/api/correction/item_analysis')
+@login_required
+def correction_item_analysis():
+    """题目分析：按批改会话缓存，同一会话内重复查看不重新计算"""
+    correction_storage = grading_session() or {}
+    results = correction_storage.get("results") or {}
+    key = correction_storage.get("answer_key")
+    if not results or key is None: return jsonify({"error": "No grading results"}), 404
+
+    source = request.args.get('source', '')
+    if source and source not in results: return jsonify({"error": "Class not found"}), 404
+    group_ratio = min(max(request.args.get('group', 0.27, type=float), 0.1), 0.5)
+
+    cache_key = (source, group_ratio)
+    if cache_key not in correction_storage.get("analysis_cache", {}):
+        result = results[source] if source else combine_results(results)
+        correction_storage = cache_session_analysis(correction_storage, cache_key, item_analysis(result, key, group_ratio))
+    return jsonify({"session_id": correction_storage["session_id"], "source": source or None,
+                    **correction_storage["analysis_cache"][cache_key]})
+
+@bp.route('/api/correction/review')
+@login_required
+def correction_review_queue():
+    """简答题待复核的作答 (相似度介于自动给分和自动判错之间)，每个不同的作答只列一次"""
+    correction_storage = grading_session()
+    if not correction_storage: return jsonify({"error": "No grading results"}), 404
+    return jsonify({"session_id": correction_storage["session_id"], "questions": review_queue(correction_storage)})
+
+@bp.route('/api/correction/review', methods=['POST'])
+@login_required
+def correction_apply_review():
+    """
+    老师确认简答题得分：{"decisions": [{"q_id", "response", "credit": 0~1}], "session_id": 可选}。
+    同一作答的所有学生一起改分，会话写回磁盘。
+    """
+    data = request.json or {}
+    try:
+        correction_storage, changed = review_grading_session(current_user.id, data.get('session_id'), data.get('decisions') or [])
+    except GradingInputError as e:
+        return jsonify({"error": str(e)}), 400
+    if not correction_storage: return jsonify({"error": "No grading results"}), 404
+    return jsonify({"success": True, "session_id": correction_storage["session_id"], "changed": changed,
+                    "question_error_counts": correction_storage["question_error_counts"],
+                    "pending": sum(len(q["responses"]) for q in review_queue(correction_storage))})
+
+@bp.route('/api/correction/to_performance', methods=['POST'])
+@login_required
+def correction_to_performance():
+    """
+    把本次批改的成绩直接写入成绩分析的班级历史，不经过 Excel 导出/导入。
+    targets: [{"source": 批改中的班级, "class_name": 成绩分析中的班级}]，单次批改可直接传 class_name。
+    """
+    import numpy as np
+    import pandas as pd
+    data = request.json or {}
+    correction_storage = load_grading_session(current_user.id, data.get('session_id')) or {}
+    exam_name = str(data.get('exam_name', '')).strip()
+    results = correction_storage.get("results") or {}
+    key = correction_storage.get("answer_key")
+    if not exam_name: return jsonify({'error': 'Exam name required'}), 400
+    if not results or key is None: return jsonify({'error': 'No grading results'}), 404
+
+    targets = data.get('targets') or [{"source": data.get('source') or next(iter(results)), "class_name": data.get('class_name', '')}]
+    subject = str(data.get('subject') or 'Score').strip()
+    include_sections = bool(data.get('include_sections')) and bool(key.get("sections"))
+
+    for target in targets:
+        if target.get('source') not in results or not str(target.get('class_name', '')).strip():
+            return jsonify({'error': f"Invalid target: {target.get('source')}"}), 400
+
+    imported = []
+    for target in targets:
+        result = results[target['source']]
+        class_name = str(target['class_name']).strip()
+        path = class_file_path(class_name)
+        if include_sections:
+            columns = {sec: np.round(vals, 2) for sec, vals in section_subtotals(result, key).items()}
+        else:
+            columns = {subject: np.round(result["scores"], 2)}
+        df = pd.DataFrame({'Name': result["names"], **columns}).drop_duplicates('Name', keep='last')
+        history = append_exam(path, df, exam_name, on_commit=class_reindexer(current_user.id, path))
+        imported.append({'source': target.get('source'), 'class_name': class_name, 'students': len(df),
+                         'subjects': list(columns), 'rows': len(history)})
+    return jsonify({'success': True, 'exam_name': exam_name, 'imported': imported})
+
+# ===========================
+# 📝 Grading Pages
+# ===========================
+@bp.route("/correction")
+@login_required
+def correction_page():
+    example_files = {
+        "student_sheet": {
+            "name": "Example -- student answer.xlsx",
+            "download_url": url_for("correction.correction_example_download", filename="Example -- student answer.xlsx"),
+            "preview_url": url_for("correction.correction_example_image", filename="stu_ref.png"),
+            "label": "Student Answer Example",
+            "description": "Reference layout for the uploaded student answer sheet."
+        },
+        "bank_sheet": {
+            "name": "Example -- standard version.xlsx",
+            "download_url": url_for("correction.correction_example_download", filename="Example -- standard version.xlsx"),
+            "preview_url": url_for("correction.correction_example_image", filename="bank_ref.png"),
+            "label": "Question Bank Example",
+            "description": "Reference layout for the uploaded comprehensive bank."
+        }
+    }
+    return render_template("correction.html", example_files=example_files)
+
+
+@bp.route("/correction/examples/download/<path:filename>")
+@login_required
+def correction_example_download(filename):
+    allowed = {
+        "Example -- student answer.xlsx",
+        "Example -- standard version.xlsx",
+    }
+    if filename not in allowed:
+        abort(404)
+    return send_file(os.path.join(current_app.config['CORRECTION_EXAMPLE_DIR'], filename), as_attachment=True, download_name=filename)
+
+
+@bp.route("/correction/examples/image/<path:filename>")
+@login_required
+def correction_example_image(filename):
+    allowed = {"stu_ref.png", "bank_ref.png"}
+    if filename not in allowed:
+        abort(404)
+    return send_file(os.path.join(current_app.config['CORRECTION_EXAMPLE_DIR'], "static", filename))
@@ -0,0 +1,169 @@
+import os
+import logging
+
+from flask import Blueprint, current_app, render_template, request, send_file, jsonify, url_for
+from flask_login import login_required, current_user
+
+from services.library_service import (
+    save_user_upload_with_db,
+    get_materials,
+    get_materials_version,
+    get_all_categories,
+    StorageQuotaError
+)
+from services.media_service import send_media
+from services.preview_service import previewable, unavailable_reason, request_preview, page_path
+from blueprints.common import conditional_response
+
+
+bp = Blueprint('library', __name__)
+
+
+@bp.route("/library", methods=["GET", "POST"])
+@login_required
+def library():
+    success = None
+    error = None
+
+    # 1. 处理上传逻辑 (保持不变)
+    if request.method == "POST":
+        files = request.files.getlist("material_file")
+        cover = request.files.get("cover_file")
+        select_mode = request.form.get("category_mode")
+        selected_cat = request.form.get("category_select")
+        new_cat = request.form.get("category_new")
+        final_category = new_cat if (select_mode == "new" and new_cat) else (selected_cat or "General")
+
+        if not files or files[0].filename == "":
+            error = "No file selected."
+        else:
+            uploader_type = 'System' if current_user.is_admin else 'User'
+            success_count = 0
+            for file in files:
+                if file and file.filename:
+                    file.stream.seek(0)
+                    if cover: cover.stream.seek(0)
+                    owner_id = None if current_user.is_admin else current_user.id
+                    try:
+                        if save_user_upload_with_db(file, cover, final_category, current_app.config['LIBRARY_PATH'], uploader=uploader_type, user_id=owner_id):
+                            success_count += 1
+                    except StorageQuotaError as e:
+                        error = str(e)
+                        break
+            if success_count > 0: success = f"Successfully uploaded {success_count} files!"
+            elif not error: error = "Upload failed."
+
+    # 2. 获取数据 & 🔥 核心修复：将 SQLite Row 转为字典 (Dict)
+    sort_option = request.args.get('sort', 'newest')
+    active_tab = request.args.get('tab', 'official')
+
+    # 纯浏览 (无上传结果提示) 时按资料表版本 (+ 发布版本，见 make_etag) 做条件请求。
+    # 可缓存的页面里不放 CSRF token，由 base.html 加载后从 /csrf-token 取，ETag 与会话无关。
+    if request.method == "GET":
+        return conditional_response(get_materials_version(),
+                                    lambda: render_library_page(sort_option, active_tab, embed_csrf=False))
+    return render_library_page(sort_option, active_tab, success, error)
+
+def render_library_page(sort_option, active_tab, success=None, error=None, embed_csrf=True):
+
+    # 获取原始数据
+    raw_official = get_materials(uploader_type='System', sort_by=sort_option)
+    raw_user = get_materials(uploader_type='User', sort_by=sort_option, user_id=current_user.id)
+
+    # 🔥 强制转换为字典列表，否则前端 Vue 无法解析 (tojson 会报错)
+    official_materials = [dict(row) for row in raw_official]
+    user_materials = [dict(row) for row in raw_user]
+
+    categories = get_all_categories()
+
+    return render_template("library.html",
+                         official_materials=official_materials,
+                         user_materials=user_materials,
+                         categories=categories,
+                         active_tab=active_tab,
+                         sort_option=sort_option,
+                         success=success,
+                         error=error,
+                         **({} if embed_csrf else {"csrf_token": ""}))
+
+def find_material(material_id):
+    """当前账号可见的资料及其绝对路径；找不到记录时返回 (None, None)"""
+    rows = get_materials(None, user_id=current_user.id, include_all=current_user.is_admin)
+    target = next((dict(m) for m in rows if m['id'] == material_id), None)
+    if target is None:
+        return None, None
+    file_path = target["file_path"]
+    if not os.path.isabs(file_path):
+        file_path = os.path.join(current_app.root_path, file_path)
+    return target, file_path
+
+# ===========================
+# 📚 Library 预览 (分页，后台渲染 + 磁盘缓存)
+# ===========================
+@bp.route("/library/preview/<int:material_id>")
+@login_required
+def preview_material(material_id):
+    """预览清单：渲染完成时返回页数和每页地址；还在渲染时返回 202，前端稍后重试"""
+    target, file_path = find_material(material_id)
+    if target is None or not os.path.exists(file_path):
+        return jsonify({"error": "Material not found"}), 404
+    if not previewable(file_path):
+        return jsonify({"error": unavailable_reason(file_path)}), 415
+    _, manifest = request_preview(current_app.config['PREVIEW_CACHE_DIR'], file_path)
+    if manifest["status"] == "rendering":
+        return jsonify({"status": "rendering"}), 202, {"Retry-After": "1"}
+    if manifest["status"] == "failed":
+        return jsonify({"status": "failed", "error": manifest.get("error")}), 422
+    pages = manifest["pages"]
+    return jsonify({
+        "status": "ready",
+        "filename": target["filename"],
+        "pages": len(pages),
+        "kind": "image" if pages and pages[0].endswith('.png') else "html",
+        "page_urls": [url_for('library.preview_page', material_id=material_id, page=i + 1) for i in range(len(pages))],
+    })
+
+@bp.route("/library/preview/<int:material_id>/<int:page>")
+@login_required
+def preview_page(material_id, page):
+    target, file_path = find_material(material_id)
+    if target is None or not os.path.exists(file_path):
+        return jsonify({"error": "Material not found"}), 404
+    cache_dir = current_app.config['PREVIEW_CACHE_DIR']
+    digest, manifest = request_preview(cache_dir, file_path)
+    path = page_path(cache_dir, digest, manifest, page)
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": "Page not found"}), 404
+    mimetype = 'image/png' if path.endswith('.png') else 'text/html; charset=utf-8'
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=3600)
+    # 预览要登录才能看，只允许浏览器缓存，不让共享缓存保存
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+# ===========================
+# 📚 Library 下载功能 (修复版)
+# ===========================
+@bp.route("/library/download/<int:material_id>")
+@login_required
+def download_material(material_id):
+    try:
+        # 1. 查找当前账号可见的素材 (官方 + 自己上传的)，相对路径拼到项目根目录下
+        target, file_path = find_material(material_id)
+
+        if target is None:
+            return "错误：数据库中找不到该文件记录", 404
+
+        # 2. 检查服务器上文件是否真的存在
+        if not os.path.exists(file_path):
+            return f"错误：服务器物理文件丢失 (路径: {file_path})", 404
+
+        # 3. 获取文件名并处理
+        filename = os.path.basename(file_path)
+
+        # 4. 发送文件：支持 Range / 多段 Range 断点续传，文本资源有 .gz 预压缩版本时直接发送
+        return send_media(file_path, download_name=filename, as_attachment=True)
+
+    except Exception as e:
+        logging.error(f"Library Download Error: {e}")
+        return f"下载服务出错: {str(e)}", 500
@@ -0,0 +1,279 @@
+import os
+import glob
+import tempfile
+from urllib.parse import quote
+
+from flask import Blueprint, current_app, render_template, request, Response, jsonify, send_file
+from flask_login import login_required, current_user
+
+from services.instrumentation import span
+from services.http_cache import file_version, dir_version, ResponseCache
+from services.export_utils import stream_csv, write_xlsx
+from services.performance_analytics import get_class_analytics
+from services.grade_analytics import grade_analytics
+from services.performance_payload import compact_performance_response
+from services.performance_export import iter_history_rows
+from services.student_index import drop_student_index, get_student_history, get_class_students
+from services.performance_store import (
+    normalize_exam_frame,
+    append_exam,
+    delete_exam,
+    create_class_file,
+    delete_class_file
+)
+from services.performance_service import (
+    build_class_id,
+    parse_class_id,
+    class_id_from_path,
+    class_reindexer,
+    load_exam_trend,
+    generate_unified_performance_response
+)
+from services.column_profiles import resolve_columns
+from blueprints.common import conditional_response, user_performance_dir, class_file_path
+
+
+bp = Blueprint('performance', __name__)
+
+
+@bp.record_once
+def init_state(state):
+    # 对比结果缓存跟着应用实例走，同一进程里的多个 app (测试、拆分部署) 互不串数据
+    state.app.extensions.setdefault('compare_cache', ResponseCache())
+
+
+def performance_payload(resp, fmt=None):
+    """前端传 format=compact 时返回列式精简格式"""
+    return compact_performance_response(resp) if fmt == 'compact' else resp
+
+# ===========================
+# 📊 Performance Routes
+# ===========================
+@bp.route("/performance")
+@login_required
+def performance_page():
+    return render_template("performance.html")
+
+# --- Class Management ---
+@bp.route('/api/performance/classes', methods=['GET'])
+@login_required
+def get_classes():
+    user_dir = user_performance_dir()
+    if not os.path.exists(user_dir):
+        return jsonify({'classes': []})
+
+    def build():
+        files = glob.glob(os.path.join(user_dir, "*.csv"))
+        classes = [parse_class_id(os.path.basename(f).replace('.csv', '')) for f in files]
+        classes.sort(key=lambda item: (item['grade'], item['class_name']))
+        return {'classes': classes}
+    return conditional_response(dir_version(user_dir), build)
+
+@bp.route('/api/performance/classes', methods=['POST'])
+@login_required
+def create_class():
+    import pandas as pd
+    data = request.json
+    grade = data.get('grade', '').strip()
+    class_name = data.get('class_name', '').strip()
+    students = data.get('students', [])
+    if not class_name: return jsonify({'error': 'Invalid name'})
+
+    class_id = build_class_id(grade, class_name)
+    path = class_file_path(class_id)
+
+    # 如果创建时提供了名单，存入一个隐藏的 __ROSTER__ 标记
+    if students:
+        df = pd.DataFrame({'Name': students})
+        df['Exam'] = '__ROSTER__'
+    else:
+        df = pd.DataFrame(columns=['Name', 'Exam'])
+    if not create_class_file(path, df, on_commit=class_reindexer(current_user.id, path)): return jsonify({'error': 'Class already exists'})
+    return jsonify({'success': True, 'class_id': class_id})
+
+@bp.route('/api/performance/classes/<class_name>', methods=['DELETE'])
+@login_required
+def delete_class(class_name):
+    path = class_file_path(class_name)
+    if delete_class_file(path):
+        drop_student_index(current_user.id, class_id_from_path(path))
+        return jsonify({'success': True})
+    return jsonify({'error': 'Class not found'})
+
+# --- Exam Management ---
+@bp.route('/api/performance/exams', methods=['GET'])
+@login_required
+def get_performance_exams():
+    class_name = request.args.get('class_name')
+    if not class_name: return jsonify({'error': 'Class name required'})
+
+    path = class_file_path(class_name)
+    if os.path.exists(path):
+        return conditional_response(file_version(path), lambda: load_exam_trend(path))
+    return jsonify({'success': True, 'exams': []})
+
+@bp.route('/api/performance/delete', methods=['POST'])
+@login_required
+def delete_performance_exam():
+    data = request.json
+    class_name = data.get('class_name')
+    exam_name = data.get('exam_name')
+    path = class_file_path(class_name)
+
+    history = delete_exam(path, exam_name, on_commit=class_reindexer(current_user.id, path))
+    if history is None: return jsonify({'error': 'File not found'})
+    return jsonify({'success': True})
+
+@bp.route('/api/performance/compare', methods=['POST'])
+@login_required
+def compare_performance_exams():
+    import pandas as pd
+    data = request.json
+    class_name = data.get('class_name')
+    exam_names = data.get('exam_names', [])
+    path = class_file_path(class_name)
+
+    if not os.path.exists(path): return jsonify({'error': 'Class data not found'})
+    # 同一份数据 + 同一组考试的重复对比直接命中缓存；文件一变版本号就不同
+    compare_cache = current_app.extensions['compare_cache']
+    cache_key = (current_user.id, path, file_version(path), tuple(exam_names), data.get('format'))
+    payload = compare_cache.get(cache_key)
+    if payload is None:
+        with span("parse"):
+            history = pd.read_csv(path)
+        with span("aggregate"):
+            resp = generate_unified_performance_response(history, exam_names)
+            payload = performance_payload(resp, data.get('format'))
+        compare_cache.put(cache_key, payload)
+    with span("serialize"):
+        return jsonify(payload)
+
+@bp.route('/api/performance/students', methods=['GET'])
+@login_required
+def get_performance_students():
+    class_name = request.args.get('class_name')
+    if not class_name: return jsonify({'error': 'Class name required'})
+    path = class_file_path(class_name)
+    students = get_class_students(current_user.id, class_id_from_path(path), path)
+    if students is None: return jsonify({'error': 'Class data not found'})
+    return jsonify({'success': True, 'students': students})
+
+@bp.route('/api/performance/student/<path:name>', methods=['GET'])
+@login_required
+def get_performance_student(name):
+    """Student Tracker：直接查学生时间序列索引，不再为一个学生重算整个班级"""
+    class_name = request.args.get('class_name')
+    if not class_name: return jsonify({'error': 'Class name required'})
+    path = class_file_path(class_name)
+    history = get_student_history(current_user.id, class_id_from_path(path), path, name)
+    if history is None: return jsonify({'error': 'Class data not found'})
+    if history['records'] is None: return jsonify({'error': 'Student not found'}), 404
+    return jsonify({
+        'success': True, 'student': name,
+        'exams': history['meta']['exams'], 'subjects': history['meta']['subjects'],
+        'records': history['records']
+    })
+
+@bp.route('/api/performance/analytics', methods=['GET'])
+@login_required
+def get_performance_analytics():
+    """排名 / 百分位 / z 分数 / 增值 / 预警，按班级数据版本缓存"""
+    class_name = request.args.get('class_name')
+    if not class_name: return jsonify({'error': 'Class name required'})
+    path = class_file_path(class_name)
+    analytics = get_class_analytics(path)
+    if analytics is None: return jsonify({'error': 'Class data not found'})
+    student = request.args.get('student')
+    if student:
+        rows = [r for r in analytics['students'] if r['name'] == student]
+        if not rows: return jsonify({'error': 'Student not found'}), 404
+        return jsonify({'success': True, 'exams': analytics['exams'], 'class_stats': analytics['class_stats'], 'student': rows[0]})
+    return jsonify({'success': True, **analytics})
+
+@bp.route('/api/performance/upload', methods=['POST'])
+@login_required
+def upload_performance_file():
+    import pandas as pd
+    if 'file' not in request.files: return jsonify({'error': 'No file found'})
+    file = request.files['file']
+    exam_name = request.form.get('exam_name', 'Unnamed Exam').strip()
+    class_name = request.form.get('class_name', '').strip()
+
+    if not class_name: return jsonify({'error': 'Class not specified'})
+    path = class_file_path(class_name)
+
+    try:
+        if file.filename.endswith('.csv'): df = pd.read_csv(file)
+        elif file.filename.endswith(('.xlsx', '.xls')): df = pd.read_excel(file, engine='openpyxl')
+        else: return jsonify({'error': 'Unsupported format'})
+
+        # 有保存的列映射档案时按档案取姓名 / 科目列，否则沿用第一列作姓名
+        df.columns = df.columns.astype(str).str.strip()
+        mapping, _, _ = resolve_columns(current_user.id, 'performance', df.columns,
+                                        lambda columns: {'name': columns[0]}, remember=False)
+        history = append_exam(path, normalize_exam_frame(df, mapping), exam_name, on_commit=class_reindexer(current_user.id, path))
+        resp = generate_unified_performance_response(history, [exam_name])
+        return jsonify(performance_payload(resp, request.form.get('format')))
+    except Exception as e: return jsonify({'error': f'Error: {str(e)}'})
+
+def select_class_files(selected_grade, selected_classes):
+    """当前账号的班级文件，按年级 / 班级 ID 过滤：[(class_id, meta, 路径)]"""
+    class_files = []
+    for f in sorted(glob.glob(os.path.join(user_performance_dir(), "*.csv"))):
+        class_id = os.path.basename(f).replace('.csv', '')
+        meta = parse_class_id(class_id)
+        if selected_grade and meta['grade'] != selected_grade:
+            continue
+        if selected_classes and class_id not in selected_classes:
+            continue
+        class_files.append((class_id, meta, f))
+    return class_files
+
+@bp.route('/api/performance/export', methods=['GET'])
+@login_required
+def export_performance_history():
+    """导出全部 (或某个年级 / 指定班级) 的成绩历史，CSV 流式输出，XLSX 用 write_only 工作簿"""
+    selected_grade = request.args.get('grade', '')
+    fmt = request.args.get('format', 'csv').lower()
+    class_files = select_class_files(selected_grade, request.args.getlist('class_ids'))
+    if not class_files: return jsonify({'error': 'No class data to export'}), 404
+
+    filename = f"performance_{selected_grade or 'all'}"
+    rows = iter_history_rows(class_files)
+    if fmt == 'xlsx':
+        out = write_xlsx(rows, tempfile.TemporaryFile(), sheet_title="Performance")
+        return send_file(out, as_attachment=True, download_name=f"{filename}.xlsx",
+                         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    return Response(stream_csv(rows), content_type="text/csv; charset=utf-8",
+                    headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}.csv"})
+
+# --- Grade Dashboard ---
+@bp.route('/api/performance/grade_overview', methods=['GET'])
+@login_required
+def get_grade_overview():
+    import pandas as pd
+    user_dir = user_performance_dir()
+
+    def build():
+        files = glob.glob(os.path.join(user_dir, "*.csv"))
+        all_exams = set()
+        for f in files:
+            try:
+                df = pd.read_csv(f, usecols=['Exam'])
+                all_exams.update(e for e in df['Exam'].dropna().unique() if e != '__ROSTER__')
+            except: pass
+        return {'exams': sorted(list(all_exams))}
+    return conditional_response(dir_version(user_dir), build)
+
+@bp.route('/api/performance/compare_grade', methods=['POST'])
+@login_required
+def compare_grade_performance():
+    exam_name = request.json.get('exam_name')
+    class_files = [(class_id, meta['display_name'], f) for class_id, meta, f in
+                   select_class_files(request.json.get('grade', ''), request.json.get('class_ids', []))]
+
+    # 一次扫描整个年级，返回各班统计 + 直方图 + 箱线图
+    with span("aggregate"):
+        stats = grade_analytics(class_files, exam_name)
+    with span("serialize"):
+        return jsonify({'exam': exam_name, **stats})
@@ -0,0 +1,187 @@
+import logging
+import tempfile
+from urllib.parse import quote
+
+from flask import Blueprint, render_template, request, Response, jsonify, abort, send_file
+from flask_login import login_required, current_user
+
+from services.planner_service import (
+    list_boards,
+    get_board,
+    create_board,
+    update_board,
+    delete_board,
+    delete_all_boards,
+    add_task,
+    update_task,
+    delete_task,
+    delete_tasks,
+    iter_csv_rows,
+    iter_xlsx_rows,
+    import_rows,
+    iter_export_rows,
+    MAX_TEXT_LENGTH,
+    MAX_HEADERS,
+    MAX_CREATE_TASKS
+)
+from services.export_utils import stream_csv, write_xlsx
+
+
+bp = Blueprint('planner', __name__)
+
+
+@bp.route("/planner")
+@login_required
+def planner(): return render_template("planner.html")
+
+# ===========================
+# 📅 Planner API (server-side boards, per-task saves)
+# ===========================
+def _expected_version(data):
+    """客户端通过 If-Match 头或 body.version 提交它看到的版本号"""
+    raw = request.headers.get("If-Match") or (data or {}).get("version")
+    try:
+        return int(str(raw).strip('"'))
+    except (TypeError, ValueError):
+        return None
+
+def _task_ids(raw):
+    """批量删除的 id 列表：必须是整数 (或纯数字字符串) 组成的列表，否则返回 None"""
+    if not isinstance(raw, list):
+        return None
+    ids = []
+    for value in raw:
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+            return None
+        ids.append(int(value))
+    return ids
+
+def _short_text(value):
+    return isinstance(value, str) and len(value) <= MAX_TEXT_LENGTH
+
+def _new_board_fields(data):
+    """
+    校验新建看板的请求体，返回 (字段, 错误信息)。
+    存进库的 headers / tasks 之后会被列表接口和导出直接使用，类型不对就会把它们弄坏，所以在这里拦下。
+    """
+    name = data.get("name")
+    if not isinstance(name, str) or not name.strip(): return None, "Board name required"
+    if len(name.strip()) > MAX_TEXT_LENGTH: return None, f"Board name must be at most {MAX_TEXT_LENGTH} characters"
+    headers = data.get("headers")
+    if headers is not None and (not isinstance(headers, list) or len(headers) > MAX_HEADERS
+                                or not all(_short_text(h) for h in headers)):
+        return None, f"headers must be a list of at most {MAX_HEADERS} column names"
+    tasks = data.get("tasks")
+    if tasks is not None:
+        if not isinstance(tasks, list) or len(tasks) > MAX_CREATE_TASKS:
+            return None, f"tasks must be a list of at most {MAX_CREATE_TASKS} tasks"
+        if not all(isinstance(t, dict) and isinstance(t.get("data", {}), dict) for t in tasks):
+            return None, "Each task must be an object whose data is an object"
+    sort_by = data.get("sortBy")
+    if sort_by is not None and not _short_text(sort_by): return None, "sortBy must be a column name"
+    sort_order = data.get("sortOrder") or 'desc'
+    if sort_order not in ('asc', 'desc'): return None, "sortOrder must be 'asc' or 'desc'"
+    return {"name": name.strip(), "headers": headers, "tasks": tasks, "sort_by": sort_by, "sort_order": sort_order}, None
+
+@bp.route("/api/planner/boards", methods=["GET"])
+@login_required
+def planner_list_boards():
+    return jsonify({"boards": list_boards(current_user.id)})
+
+@bp.route("/api/planner/boards", methods=["POST"])
+@login_required
+def planner_create_board():
+    data = request.json
+    if not isinstance(data, dict): return jsonify({"error": "JSON object required"}), 400
+    fields, error = _new_board_fields(data)
+    if error: return jsonify({"error": error}), 400
+    board = create_board(current_user.id, fields["name"], fields["headers"], fields["tasks"],
+                         fields["sort_by"], fields["sort_order"])
+    return jsonify({"success": True, "board": board}), 201
+
+@bp.route("/api/planner/boards", methods=["DELETE"])
+@login_required
+def planner_clear_boards():
+    delete_all_boards(current_user.id)
+    return jsonify({"success": True})
+
+@bp.route("/api/planner/boards/<int:board_id>", methods=["PATCH"])
+@login_required
+def planner_update_board(board_id):
+    data = request.json or {}
+    version = _expected_version(data)
+    if version is None: return jsonify({"error": "Version required"}), 428
+    status, board = update_board(board_id, current_user.id, data, version)
+    if status == "missing": return jsonify({"error": "Board not found"}), 404
+    if status == "conflict": return jsonify({"error": "Board was changed by someone else", "board": board}), 409
+    return jsonify({"success": True, "board": board})
+
+@bp.route("/api/planner/boards/<int:board_id>", methods=["DELETE"])
+@login_required
+def planner_delete_board(board_id):
+    if not delete_board(board_id, current_user.id): return jsonify({"error": "Board not found"}), 404
+    return jsonify({"success": True})
+
+@bp.route("/api/planner/boards/<int:board_id>/tasks", methods=["POST"])
+@login_required
+def planner_add_task(board_id):
+    data = request.json or {}
+    if not isinstance(data.get("data", {}), dict): return jsonify({"error": "Task data must be an object"}), 400
+    task = add_task(board_id, current_user.id, data.get("data", {}), data.get("archived", False))
+    if task is None: return jsonify({"error": "Board not found"}), 404
+    return jsonify({"success": True, "task": task}), 201
+
+@bp.route("/api/planner/boards/<int:board_id>/tasks/delete", methods=["POST"])
+@login_required
+def planner_delete_tasks(board_id):
+    ids = _task_ids((request.json or {}).get("ids", []))
+    if ids is None: return jsonify({"error": "ids must be a list of task ids"}), 400
+    return jsonify({"success": True, "deleted": delete_tasks(board_id, current_user.id, ids)})
+
+@bp.route("/api/planner/tasks/<int:task_id>", methods=["PATCH"])
+@login_required
+def planner_update_task(task_id):
+    data = request.json or {}
+    version = _expected_version(data)
+    if version is None: return jsonify({"error": "Version required"}), 428
+    status, task = update_task(task_id, current_user.id, data, version)
+    if status == "missing": return jsonify({"error": "Task not found"}), 404
+    if status == "conflict": return jsonify({"error": "Task was changed by someone else", "task": task}), 409
+    return jsonify({"success": True, "task": task})
+
+@bp.route("/api/planner/tasks/<int:task_id>", methods=["DELETE"])
+@login_required
+def planner_delete_task(task_id):
+    if not delete_task(task_id, current_user.id): return jsonify({"error": "Task not found"}), 404
+    return jsonify({"success": True})
+
+@bp.route("/api/planner/boards/<int:board_id>/import", methods=["POST"])
+@login_required
+def planner_import(board_id):
+    file = request.files.get("file")
+    if not file or not file.filename: return jsonify({"error": "No file found"}), 400
+    name = file.filename.lower()
+    if name.endswith('.csv'): rows = iter_csv_rows(file.stream)
+    elif name.endswith('.xlsx'): rows = iter_xlsx_rows(file.stream)
+    else: return jsonify({"error": "Unsupported format (use .csv or .xlsx)"}), 400
+    try:
+        board = import_rows(board_id, current_user.id, rows, replace=request.form.get("mode", "replace") == "replace")
+    except Exception as e:
+        logging.error(f"Planner Import Error: {e}")
+        return jsonify({"error": f"Import failed: {str(e)}"}), 400
+    if board is None: return jsonify({"error": "Board not found or file is empty"}), 404
+    return jsonify({"success": True, "board": get_board(board_id, current_user.id)})
+
+@bp.route("/api/planner/boards/<int:board_id>/export")
+@login_required
+def planner_export(board_id):
+    board = get_board(board_id, current_user.id, include_tasks=False)
+    if board is None: abort(404)
+    fmt = request.args.get("format", "csv").lower()
+    rows = iter_export_rows(board_id, current_user.id)
+    if fmt == "xlsx":
+        out = write_xlsx(rows, tempfile.TemporaryFile(), sheet_title="Lessons")
+        return send_file(out, as_attachment=True, download_name=f"{board['name']}.xlsx",
+                         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    return Response(stream_csv(rows), content_type="text/csv; charset=utf-8",
+                    headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(board['name'])}.csv"})
@@ -0,0 +1,7 @@
+# gunicorn 启动时自动读取当前目录下的本文件：每个 worker 加载完应用后启动后台任务。
+# 命令行参数 (-w / -b 等) 照常使用，这里只放钩子。
+
+
+def post_worker_init(worker):
+    from app import start_background_tasks
+    start_background_tasks(worker.wsgi)
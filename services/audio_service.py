@@ -1,5 +1,6 @@
 import os
-import requests
+import tempfile
+import uuid
 from typing import List, Dict
 
 
@@ -33,6 +34,7 @@ class AudioServiceClient:
         Call MP3 Generation API, download generated mp3,
         save it locally, and return filename.
         """
+        import requests
 
         payload = {
             "items": items,
@@ -67,3 +69,25 @@ class AudioServiceClient:
 
         # ③ 返回给 app.py（它完全不用知道细节）
         return filename
+
+
+def save_audio_stream(chunks, storage_dir, user_id):
+    """
+    把 TTS 服务流式返回的 mp3 写到 storage_dir/u<user_id>/<随机名>.mp3 (临时文件 + os.replace)，
+    返回相对 storage_dir 的路径，供播放接口按 Range 分段读取。
+    """
+    owner_dir = os.path.join(storage_dir, f"u{user_id}")
+    os.makedirs(owner_dir, exist_ok=True)
+    relative = f"u{user_id}/{uuid.uuid4().hex}.mp3"
+    fd, tmp_path = tempfile.mkstemp(dir=owner_dir, prefix='.tmp_', suffix='.mp3')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+        os.replace(tmp_path, os.path.join(storage_dir, relative))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return relative
@@ -0,0 +1,119 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+# 题号 -> 答题卡列 的匹配，每种表头布局只计算一次。
+# 匹配顺序：原样相同 > 规范化后相同 (大小写 / 全角 / 空格) > 题号键相同 (大题 + 题号 + 小题字母)
+# > 只比题号 (答题卡没有大题信息时)。同一层级出现多个候选视为歧义，不再悄悄取最后一个。
+QUESTION_MARKERS = {'q', 'qq', 'qu', 'ques', 'question', 'no', 'num', 'number', 'item', 'id', '第', '题', '题号', '小题'}
+SECTION_MARKERS = {'part', 'pt', 'p', 'section', 'sec', 'sect', 's', 'unit', 'task', '部分', '大题'}
+MATCH_CACHE_SIZE = 64
+
+_TOKEN_RE = re.compile(r'[a-z]+|\d+|[一-鿿]')
+_match_cache = OrderedDict()
+_match_cache_guard = threading.Lock()
+
+
+def normalize_label(value):
+    """NFKC (全角转半角) + 小写 + 去掉所有空白"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', str(value)).lower())
+
+
+def question_key(value):
+    """
+    题号键 (大题, 题号, 小题字母)：
+    "Q1" / "QQ1" / "1" -> ('', 1, '')；"A-3" -> ('a', 3, '')；"Part2 Q3" -> ('2', 3, '')；
+    "Section B 12b" -> ('b', 12, 'b')；"第3题" -> ('', 3, '')。没有数字时返回 None。
+    """
+    tokens = [t for t in _TOKEN_RE.findall(unicodedata.normalize('NFKC', str(value)).lower()) if t not in QUESTION_MARKERS]
+    numbers = [i for i, t in enumerate(tokens) if t.isdigit()]
+    if not numbers:
+        return None
+    last = numbers[-1]
+    sub = tokens[last + 1] if last + 1 < len(tokens) and len(tokens[last + 1]) == 1 else ''
+    section = ''.join(t for t in tokens[:last] if t not in SECTION_MARKERS)
+    return section, int(tokens[last]), sub
+
+
+class ColumnIndex:
+    """答题卡表头的预编译索引：每一层匹配规则一张 {键: [列名]} 表"""
+
+    def __init__(self, columns):
+        self.columns = [str(c) for c in columns]
+        self.exact = {}
+        self.normalized = {}
+        self.keyed = {}
+        self.numbered = {}
+        for col in self.columns:
+            self.exact.setdefault(col, []).append(col)
+            self.normalized.setdefault(normalize_label(col), []).append(col)
+            key = question_key(col)
+            if key is not None:
+                self.keyed.setdefault(key, []).append(col)
+                self.numbered.setdefault(key[1:], []).append(col)
+        self.has_sections = any(key[0] for key in self.keyed)
+
+    def candidates(self, q_id):
+        """返回 (层级, 候选列)；找不到时 (None, [])"""
+        q_id = str(q_id)
+        for level, table, key in (('exact', self.exact, q_id),
+                                  ('normalized', self.normalized, normalize_label(q_id))):
+            if table.get(key):
+                return level, table[key]
+        key = question_key(q_id)
+        if key is None:
+            return None, []
+        if self.keyed.get(key):
+            return 'key', self.keyed[key]
+        # 答题卡没有大题信息 (只有 Q1..Qn) 时，带大题的题号退回到只比题号
+        if key[0] and not self.has_sections and self.numbered.get(key[1:]):
+            return 'number', self.numbered[key[1:]]
+        return None, []
+
+
+def _compute_match(columns, q_ids):
+    index = ColumnIndex(columns)
+    matched, levels, ambiguous, unmatched = [], [], {}, []
+    for q in q_ids:
+        level, cands = index.candidates(q)
+        if len(cands) > 1:
+            ambiguous[str(q)] = list(cands)
+            level, cands = None, []
+        matched.append(cands[0] if cands else None)
+        levels.append(level)
+        if not cands and str(q) not in ambiguous:
+            unmatched.append(str(q))
+
+    # 模糊匹配 (key / number) 不允许多道题共用一列：例如 A-3 和 B-3 都落到 "Q3"
+    claims = {}
+    for i, (col, level) in enumerate(zip(matched, levels)):
+        if col is not None and level in ('key', 'number'):
+            claims.setdefault(col, []).append(i)
+    exact_cols = {col for col, level in zip(matched, levels) if level in ('exact', 'normalized')}
+    for col, idx in claims.items():
+        if len(idx) > 1 or col in exact_cols:
+            for i in idx:
+                ambiguous[str(q_ids[i])] = [col]
+                matched[i] = None
+    return {"columns": matched, "ambiguous": ambiguous, "unmatched": unmatched}
+
+
+def match_columns(student_columns, q_ids):
+    """
+    题号列表 -> 答题卡列名列表 (对不上的为 None)，同时给出歧义题号和未匹配题号：
+    {"columns": [...], "ambiguous": {题号: [候选列]}, "unmatched": [题号]}。
+    按 (表头, 题号) 缓存，每周上传同一模板时直接复用。
+    """
+    cache_key = (tuple(str(c) for c in student_columns), tuple(str(q) for q in q_ids))
+    with _match_cache_guard:
+        if cache_key in _match_cache:
+            _match_cache.move_to_end(cache_key)
+            return _match_cache[cache_key]
+    match = _compute_match(list(cache_key[0]), list(cache_key[1]))
+    with _match_cache_guard:
+        _match_cache[cache_key] = match
+        while len(_match_cache) > MATCH_CACHE_SIZE:
+            _match_cache.popitem(last=False)
+    return match
@@ -0,0 +1,131 @@
+import hashlib
+import json
+from datetime import datetime
+
+from services.library_service import get_db_connection
+from services.column_matching import normalize_label
+
+
+# 列映射档案：按表头指纹 (规范化后的表头行的哈希) 保存每种表格该用哪些列。
+# 老师每周上传同一个模板时，指纹一致就直接套用档案，只需 O(列数) 校验一遍，不再做关键字识别。
+# kind: bank = 题库, sheet = 学生答题卡, performance = 成绩上传表
+PROFILE_FIELDS = {
+    'bank': {'required': ('q_id', 'ans', 'score'), 'optional': ('content', 'section', 'rule'), 'lists': ()},
+    'sheet': {'required': (), 'optional': ('name',), 'lists': ()},
+    'performance': {'required': ('name',), 'optional': (), 'lists': ('subjects',)},
+}
+
+
+def header_fingerprint(columns):
+    normalized = "\x1f".join(normalize_label(c) for c in columns)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def validate_mapping(kind, columns, mapping):
+    """
+    检查映射里的列都在表头中 (按规范化列名比较)，返回换成本次实际列名的映射。
+    不合法时抛出 ValueError。
+    """
+    if kind not in PROFILE_FIELDS:
+        raise ValueError(f"Unknown profile kind: {kind}")
+    spec = PROFILE_FIELDS[kind]
+    by_label = {normalize_label(c): c for c in columns}
+    unknown = set(mapping) - set(spec['required']) - set(spec['optional']) - set(spec['lists'])
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    def actual(field, col):
+        if col is None or col == '':
+            return None
+        found = by_label.get(normalize_label(col))
+        if found is None:
+            raise ValueError(f"Column '{col}' for {field} is not in the header")
+        return found
+
+    resolved = {}
+    for field in spec['required'] + spec['optional']:
+        resolved[field] = actual(field, mapping.get(field))
+    for field in spec['lists']:
+        if field in mapping:
+            resolved[field] = [actual(field, col) for col in mapping[field] or [] if col]
+    missing = [field for field in spec['required'] if resolved[field] is None]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return resolved
+
+
+def _row_to_profile(row):
+    return {
+        "kind": row["kind"], "fingerprint": row["fingerprint"], "name": row["name"],
+        "header": json.loads(row["header"]), "mapping": json.loads(row["mapping"]),
+        "source": row["source"], "updated_at": str(row["updated_at"]),
+    }
+
+
+def get_profile(user_id, kind, fingerprint):
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM column_profiles WHERE user_id = ? AND kind = ? AND fingerprint = ?",
+                       (user_id, kind, fingerprint)).fetchone()
+    conn.close()
+    return _row_to_profile(row) if row else None
+
+
+def list_profiles(user_id, kind=None):
+    conn = get_db_connection()
+    if kind:
+        rows = conn.execute("SELECT * FROM column_profiles WHERE user_id = ? AND kind = ? ORDER BY updated_at DESC",
+                            (user_id, kind)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM column_profiles WHERE user_id = ? ORDER BY kind, updated_at DESC",
+                            (user_id,)).fetchall()
+    conn.close()
+    return [_row_to_profile(row) for row in rows]
+
+
+def save_profile(user_id, kind, columns, mapping, name=None, source='user'):
+    """
+    校验并保存映射档案，返回档案。source='auto' 的自动识别结果不会覆盖用户手动保存的档案。
+    """
+    columns = [str(c) for c in columns]
+    resolved = validate_mapping(kind, columns, mapping)
+    fingerprint = header_fingerprint(columns)
+    verb = "INSERT OR IGNORE" if source == 'auto' else "INSERT OR REPLACE"
+    conn = get_db_connection()
+    conn.execute(
+        f"{verb} INTO column_profiles (user_id, kind, fingerprint, name, header, mapping, source, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, kind, fingerprint, name, json.dumps(columns), json.dumps(resolved), source, datetime.now())
+    )
+    conn.commit()
+    conn.close()
+    return get_profile(user_id, kind, fingerprint)
+
+
+def delete_profile(user_id, kind, fingerprint):
+    conn = get_db_connection()
+    cursor = conn.execute("DELETE FROM column_profiles WHERE user_id = ? AND kind = ? AND fingerprint = ?",
+                          (user_id, kind, fingerprint))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def resolve_columns(user_id, kind, columns, detect, remember=True):
+    """
+    表头 -> 列映射。有同指纹的档案且校验通过时直接使用；否则调用 detect(columns) 识别，
+    识别完整时 (remember=True) 自动存成 auto 档案。返回 (映射, 指纹, 来源 'profile' / 'detected')。
+    """
+    columns = [str(c) for c in columns]
+    fingerprint = header_fingerprint(columns)
+    profile = get_profile(user_id, kind, fingerprint) if user_id is not None else None
+    if profile:
+        try:
+            return validate_mapping(kind, columns, profile["mapping"]), fingerprint, 'profile'
+        except ValueError:
+            pass  # 档案与表头对不上 (例如被手工改坏)，退回自动识别
+    mapping = detect(columns)
+    if remember and user_id is not None:
+        try:
+            save_profile(user_id, kind, columns, mapping, source='auto')
+        except ValueError:
+            pass  # 识别不完整，不保存
+    return mapping, fingerprint, 'detected'
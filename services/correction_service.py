@@ -1,172 +1,311 @@
-from flask import Flask, request, jsonify, send_file, render_template
-from flask_cors import CORS
-import pandas as pd
+import hashlib
 import io
-import logging
-
-# 初始化配置
-logging.basicConfig(level=logging.INFO)
-app = Flask(__name__, template_folder='.', static_folder='static')
-CORS(app)
-
-# 全局存储
-storage = {"error_records": {}, "question_bank": None, "paper_total_score": 0, "col_map": {}, "all_questions_info": []}
-
-def clean_ans(val):
-    """处理 Excel 中的 .0 浮点数、空格和大小写"""
-    if pd.isna(val):
-        return ""
-    s = str(val).strip()
-    if s.endswith('.0'):
-        s = s[:-2]
-    return s.upper()
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/upload_data', methods=['POST'])
-def upload_data():
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from services.instrumentation import span
+from services.grading_service import (
+    build_answer_key, build_error_records, grade_classes, batch_statistics, clean_ans, credit_matrix
+)
+from services.column_matching import match_columns
+from services.scoring_rules import ScoringRuleError, key_matchers, text_review
+from services.column_profiles import resolve_columns, header_fingerprint
+
+
+# 批改模块共用的引擎：题库解析、列名识别、批改会话组装。
+# 主应用的 correction 蓝图和单独部署的批改 worker 都调用这里，不再各自维护一份。
+BANK_CACHE_SIZE = 8
+_bank_cache = OrderedDict()
+# 请求线程和后台批改线程共用题库缓存 (含每份题库的 parsed 字典)，读写都在锁内
+_bank_cache_guard = threading.Lock()
+
+
+class GradingInputError(ValueError):
+    """上传的文件无法批改 (题库缺列 / 没有学生行)，消息直接返回给前端"""
+
+
+def normalize_header(value):
+    return str(value).strip().lower()
+
+
+def pick_best_column(columns, preferred_keywords, fallback_keywords):
+    normalized = [(col, normalize_header(col)) for col in columns]
+    for keyword in preferred_keywords:
+        for col, lowered in normalized:
+            if keyword in lowered:
+                return col
+    for keyword in fallback_keywords:
+        for col, lowered in normalized:
+            if keyword in lowered:
+                return col
+    return None
+
+
+def detect_bank_columns(columns):
+    """关键字识别题库各列 (没有映射档案时使用)"""
+    # 中文表头 (题号 / 答案 / 分值) 来自原先独立的批改服务，合并后一并支持
+    return {
+        'q_id': pick_best_column(columns, ['question id', 'q_id', 'question no', 'question number', '题号'], ['question', 'id', 'no.']),
+        'ans': pick_best_column(columns, ['correct answer', 'answer key', 'correct ans', '答案'], ['answer', 'ans', 'key']),
+        'score': pick_best_column(columns, ['score', 'points', 'point value', '分值', '分数'], ['mark']),
+        'content': pick_best_column(columns, ['question text', 'question', 'content', '题目内容'], ['text', 'title']),
+        'section': pick_best_column(columns, ['section', 'part'], ['skill', 'category']),
+        'rule': pick_best_column(columns, ['scoring rule', 'rule', '评分规则'], ['scoring']),
+    }
+
+
+def detect_sheet_columns(columns):
+    return {'name': pick_best_column(columns, ['student name', 'name', '姓名'], ['student'])}
+
+
+def _read_bank_frame(raw):
+    """题库表格按内容哈希缓存；同一份题库在不同列映射下的解析结果存在 parsed 里"""
+    import pandas as pd
+    digest = hashlib.sha1(raw).hexdigest()
+    with _bank_cache_guard:
+        cached = _bank_cache.get(digest)
+        if cached is not None:
+            _bank_cache.move_to_end(digest)
+            return cached
+    # 解析不持锁；两个线程同时解析同一份题库时后写入的覆盖先写入的，结果相同
+    df_b = pd.read_excel(io.BytesIO(raw)).dropna(how='all')
+    df_b.columns = df_b.columns.astype(str).str.strip()
+    entry = {"frame": df_b, "parsed": {}}
+    with _bank_cache_guard:
+        _bank_cache[digest] = entry
+        _bank_cache.move_to_end(digest)
+        if len(_bank_cache) > BANK_CACHE_SIZE:
+            _bank_cache.popitem(last=False)
+    return entry
+
+
+def load_question_bank(file, user_id=None):
+    """
+    解析题库并建立标准答案索引。按文件内容哈希缓存，
+    同一份题库连续给多个班级批改时不再重复解析。
+    传入 user_id 时优先使用该账号保存的列映射档案 (按表头指纹)。
+    返回 (df_b, col_map, key)，列名不匹配时返回 None，评分规则写错时抛出 GradingInputError。
+    """
+    cached = _read_bank_frame(file.read())
+    df_b = cached["frame"]
+    col_map, _, _ = resolve_columns(user_id, 'bank', df_b.columns, detect_bank_columns)
+    if any(col_map.get(field) is None for field in ('q_id', 'ans', 'score')):
+        return None
+    mapping_key = tuple(col_map.get(field) for field in ('q_id', 'ans', 'score', 'content', 'section', 'rule'))
+    with _bank_cache_guard:
+        parsed = cached["parsed"].get(mapping_key)
+    if parsed is not None:
+        return parsed
     try:
-        files = request.files
-        if 'student_ans' not in files or 'combined_bank' not in files:
-            return jsonify({"error": "请确保上传了学生答题卡和综合题库两个文件"}), 400
-
-        df_student = pd.read_excel(files['student_ans']).dropna(how='all')
-        df_bank = pd.read_excel(files['combined_bank']).dropna(how='all')
-        
-        df_student.columns = df_student.columns.astype(str).str.strip()
-        df_bank.columns = df_bank.columns.astype(str).str.strip()
-        
-        col_map = {}
-        for col in df_bank.columns:
-            c = str(col).strip().lower() # 统一转小写去空格
-            if any(k in c for k in ['题号', 'question', 'q_id', 'no.']): 
-                col_map['q_id'] = col
-            if any(k in c for k in ['答案', 'answer', 'ans']): 
-                col_map['ans'] = col
-            if any(k in c for k in ['分值', '分数', '得分', 'score']): 
-                col_map['score'] = col
-
-        if len(col_map) < 3:
-            return jsonify({"error": "题库列名不匹配！请确保包含：题号、正确答案、分值（或得分）"}), 400
-
-        storage["col_map"] = col_map
-
-        valid_bank = df_bank[
-            df_bank[col_map['q_id']].notna() & 
-            (~df_bank[col_map['q_id']].astype(str).str.contains('总分|合计|得分|nan|统计', na=False))
-        ].copy()
-
-        ans_map = dict(zip(valid_bank[col_map['q_id']].astype(str), valid_bank[col_map['ans']]))
-        score_map = dict(zip(valid_bank[col_map['q_id']].astype(str), valid_bank[col_map['score']]))
-        
-        paper_total = float(valid_bank[col_map['score']].sum())
-        storage["paper_total_score"] = paper_total
-        
-        # --- 新增：收集所有题目的信息，用于错题分布图 ---
-        all_questions_info = []
-        q_content_col = [c for c in df_bank.columns if '题目内容' in str(c) or 'Content' in str(c)][0] if [c for c in df_bank.columns if '题目内容' in str(c) or 'Content' in str(c)] else None
-
-        for q_id in ans_map.keys():
-            content = "无题目内容"
-            if q_content_col and q_id in df_bank[col_map['q_id']].astype(str).values:
-                # 找到对应题号的行
-                q_row = df_bank[df_bank[col_map['q_id']].astype(str) == q_id].iloc[0]
-                content = str(q_row[q_content_col]) if pd.notna(q_row[q_content_col]) else "无题目内容"
-            
-            all_questions_info.append({"q_id": q_id, "content": content})
-        
-        storage["all_questions_info"] = all_questions_info
-        # --- 结束新增 ---
-
-        error_map = {}
-        # --- 批改逻辑 ---
-        # 用于统计每道题的错误人数
-        question_error_counts = {q_id: 0 for q_id in ans_map.keys()}
-
-        # 姓名列的匹配关键词
-        name_keywords = ['姓名', 'name', 'student']
-
-        for _, row in df_student.iterrows():
-            name_col = [c for c in df_student.columns if any(k in str(c).lower() for k in name_keywords)]
-            name = str(row[name_col[0]]).strip() if name_col else str(row.iloc[0]).strip()
-            
-            if name == 'nan' or not name: continue
-
-            wrongs = []
-            total_score = 0
-            
-            for q_id, correct_ans in ans_map.items():
-                student_ans_raw = ""
-                # 题号模糊匹配
-                if q_id in df_student.columns:
-                    student_ans_raw = row[q_id]
-                else:
-                    digit_id = ''.join(filter(str.isdigit, q_id))
-                    matched_col = [c for c in df_student.columns if digit_id != '' and digit_id == ''.join(filter(str.isdigit, c))]
-                    if matched_col:
-                        student_ans_raw = row[matched_col[0]]
-
-                if clean_ans(student_ans_raw) == clean_ans(correct_ans):
-                    total_score += score_map.get(q_id, 0)
-                else:
-                    wrongs.append(q_id)
-                    question_error_counts[q_id] += 1 # 统计错误人数
-            
-            error_map[name] = {"wrongs": wrongs, "score": total_score}
-
-        storage["error_records"] = error_map
-        storage["question_bank"] = df_bank 
-        storage["question_error_counts"] = question_error_counts # 存储错误统计
-
-        return jsonify({
-            "status": "success", 
-            "students": list(error_map.keys()),
-            "paper_total": paper_total,
-            "all_questions_info": all_questions_info, # 返回所有题目信息
-            "question_error_counts": question_error_counts # 返回错误统计
-        })
-    except Exception as e:
-        logging.error(f"处理失败: {e}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/get_errors/<student_name>', methods=['GET'])
-def get_errors(student_name):
-    record = storage["error_records"].get(student_name)
-    paper_total = storage.get("paper_total_score", 0)
-    if not record: return jsonify({"error": "未找到记录"}), 404
-    return jsonify({"wrong_questions": record["wrongs"], "total_score": record["score"], "paper_total": paper_total})
-
-@app.route('/download_error_book/<student_name>', methods=['GET'])
-def download_error_book(student_name):
-    record = storage["error_records"].get(student_name)
-    bank = storage["question_bank"]
-    col_map = storage.get("col_map", {})
-    if not record or bank is None: return "数据不存在", 404
-    q_id_col = col_map.get('q_id', bank.columns[0])
-    personal_df = bank[bank[q_id_col].astype(str).isin(map(str, record["wrongs"]))]
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        personal_df.to_excel(writer, index=False)
-    output.seek(0)
-    return send_file(output, as_attachment=True, download_name=f"{student_name}_错题本.xlsx")
-
-@app.route('/download_all_scores', methods=['GET'])
-def download_all_scores():
-    if not storage["error_records"]: return "暂无数据", 404
-    data_list = [{"姓名": k, "总分": v["score"]} for k, v in storage["error_records"].items()]
-    summary_df = pd.DataFrame(data_list).sort_values(by="总分", ascending=False)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        summary_df.to_excel(writer, index=False)
-    output.seek(0)
-    return send_file(output, as_attachment=True, download_name="全班成绩汇总表.xlsx")
-
-@app.route('/clear_data', methods=['POST'])
-def clear_data():
-    storage.update({"error_records": {}, "question_bank": None, "paper_total_score": 0, "col_map": {}, "all_questions_info": [], "question_error_counts": {}})
-    return jsonify({"status": "success"})
-
-if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
+        key = build_answer_key(df_b, col_map, col_map.get('content'), col_map.get('section'), col_map.get('rule'))
+    except ScoringRuleError as e:
+        raise GradingInputError(str(e)) from None
+    parsed = (df_b, col_map, key)
+    with _bank_cache_guard:
+        cached["parsed"][mapping_key] = parsed
+    return parsed
+
+
+def prepare_student_sheet(df_s, user_id=None):
+    df_s = df_s.dropna(how='all')
+    df_s.columns = df_s.columns.astype(str).str.strip()
+    mapping, _, _ = resolve_columns(user_id, 'sheet', df_s.columns, detect_sheet_columns)
+    return df_s, mapping.get('name')
+
+
+def summarize_results(results, key, batch=False):
+    """错题记录和每题错误人数；批量模式下学生以 "班级 / 姓名" 区分"""
+    import numpy as np
+    err_map = {}
+    for label, result in results.items():
+        for name, rec in build_error_records(result, key).items():
+            if batch:
+                err_map[f"{label} / {name}"] = {**rec, "class": label, "name": name}
+            else:
+                err_map[name] = rec
+    q_err_counts = {q: int(c) for q, c in zip(key["q_ids"], np.sum([r["error_counts"] for r in results.values()], axis=0))} if results else {}
+    return err_map, q_err_counts
+
+
+def build_grading_session(df_b, col_map, key, results, batch=False):
+    """把批改结果整理成一次批改会话"""
+    err_map, q_err_counts = summarize_results(results, key, batch)
+    return {
+        "batch": batch,
+        "col_map": col_map,
+        "paper_total_score": key["paper_total"],
+        "all_questions_info": [{"q_id": q, "content": c} for q, c in zip(key["q_ids"], key["content"])],
+        "error_records": err_map,
+        "question_bank": df_b,
+        "question_error_counts": q_err_counts,
+        "answer_key": key,
+        "results": results,
+        "session_id": uuid.uuid4().hex,
+        "reviewed": {},
+        "analysis_cache": {}
+    }
+
+
+def read_answer_sheet(filename, raw, batch=False, file_count=1, user_id=None):
+    """
+    一个答题卡文件 -> {班级名: (答题卡, 姓名列)}。
+    单次批改只读第一张 sheet；批量模式下工作簿的每张 sheet 都是一个班级 (空 sheet 跳过)。
+    """
+    import pandas as pd
+    stem = os.path.splitext(filename or '')[0]
+    if not batch:
+        return {stem or 'Class': prepare_student_sheet(pd.read_excel(io.BytesIO(raw)), user_id)}
+    class_sheets = {}
+    book = pd.read_excel(io.BytesIO(raw), sheet_name=None)
+    for sheet_name, df in book.items():
+        df_s, name_col = prepare_student_sheet(df, user_id)
+        if df_s.empty:
+            continue
+        if file_count == 1:
+            label = str(sheet_name)
+        else:
+            label = stem if len(book) == 1 else f"{stem} - {sheet_name}"
+        class_sheets[label] = (df_s, name_col)
+    return class_sheets
+
+
+def run_grading(bank_raw, sheets, batch=False, progress=None, user_id=None):
+    """
+    完整的批改流程：解析题库 -> 读答题卡 -> 批改 -> 统计。
+    progress(stage, percent, message) 用于后台任务汇报进度。
+    sheets: [(文件名, 文件内容 bytes)]；user_id 用于查找该账号的列映射档案。
+    返回 (批改会话, 前端需要的结果摘要)；输入不合法时抛出 GradingInputError。
+    """
+    report = progress or (lambda stage, percent, message=None: None)
+
+    report('parse', 5, 'Reading question bank')
+    with span("parse"):
+        bank = load_question_bank(io.BytesIO(bank_raw), user_id)
+    if bank is None:
+        raise GradingInputError("Question bank must include Question ID, Correct Answer, and Score columns.")
+    df_b, col_map, key = bank
+
+    class_sheets = {}
+    for i, (filename, raw) in enumerate(sheets):
+        report('parse', 10 + 25 * i // len(sheets), f'Reading {filename}')
+        with span("parse"):
+            class_sheets.update(read_answer_sheet(filename, raw, batch, len(sheets), user_id))
+    if not class_sheets:
+        raise GradingInputError("No student rows found")
+
+    report('grade', 35, f'Grading {len(class_sheets)} class(es)')
+    with span("grade"):
+        results = grade_classes(class_sheets, key, progress=lambda done, total: report(
+            'grade', 35 + 50 * done // total, f'Graded {done}/{total} class(es)'))
+
+    report('stats', 85, 'Building statistics')
+    with span("aggregate"):
+        session = build_grading_session(df_b, col_map, key, results, batch)
+        summary = {
+            "status": "success",
+            "students": list(session["error_records"]),
+            "paper_total": session["paper_total_score"],
+            "question_error_counts": session["question_error_counts"],
+            "sources": list(results),
+            "has_sections": bool(key.get("sections")),
+            "bank_columns": {"fingerprint": header_fingerprint(df_b.columns), "mapping": col_map}
+        }
+        if batch:
+            summary.update(batch_statistics(results, key))
+        warnings = column_warnings(class_sheets, key["q_ids"])
+        if warnings:
+            summary["column_warnings"] = warnings
+        pending = sum(len(item["responses"]) for item in review_queue(session))
+        if pending:
+            summary["review_pending"] = pending
+    return session, summary
+
+
+def column_warnings(class_sheets, q_ids):
+    """各班答题卡里有歧义或找不到对应列的题号 (匹配结果已缓存，这里不会重新计算)"""
+    warnings = {}
+    for label, (df_s, _) in class_sheets.items():
+        match = match_columns(df_s.columns, q_ids)
+        if match["ambiguous"] or match["unmatched"]:
+            warnings[label] = {"ambiguous": match["ambiguous"], "unmatched": match["unmatched"]}
+    return warnings
+
+
+# ===========================
+# Short-answer Review
+# ===========================
+def review_queue(session):
+    """
+    简答题 (text 规则) 里相似度落在复核区间、老师还没确认过的作答。
+    每个不同的作答只列一次，附上建议得分比例和作答人数。
+    """
+    import numpy as np
+    key = session["answer_key"]
+    reviewed = session.get("reviewed") or {}
+    queue = []
+    for j, matcher in enumerate(key_matchers(key)):
+        if matcher[0] != 'text':
+            continue
+        q_id = key["q_ids"][j]
+        pending = {}
+        for result in session["results"].values():
+            vocab = result["vocabs"][j]
+            sims, credits, uncertain = text_review(matcher, vocab)
+            counts = np.bincount(result["codes"][:, j], minlength=len(vocab))
+            for v in np.flatnonzero(uncertain & (counts > 0)):
+                if vocab[v] in reviewed.get(q_id, {}):
+                    continue
+                item = pending.setdefault(vocab[v], {"response": vocab[v], "similarity": round(float(sims[v]), 3),
+                                                     "suggested": float(credits[v]), "students": 0})
+                item["students"] += int(counts[v])
+        if pending:
+            queue.append({"q_id": q_id, "reference": key["answers"][j], "score": float(key["scores"][j]),
+                          "responses": sorted(pending.values(), key=lambda r: -r["students"])})
+    return queue
+
+
+def apply_review(session, decisions):
+    """
+    老师确认后的得分：decisions = [{"q_id", "response", "credit" (0~1 的得分比例)}]。
+    在会话的副本上改写各班的得分矩阵并重算总分 / 错题，原会话 (可能正被其他请求读取) 不变。
+    返回 (新会话, 实际改动的学生人次)。
+    """
+    key = session["answer_key"]
+    index = {q: j for j, q in enumerate(key["q_ids"])}
+    # 题目分析缓存随得分失效：副本一开始就用新的空缓存，不碰原会话那份
+    session = {**session, "results": {name: dict(result) for name, result in session["results"].items()},
+               "analysis_cache": {}}
+    reviewed = {q: dict(responses) for q, responses in session.get("reviewed", {}).items()}
+    session["reviewed"] = reviewed
+    copied = set()
+    changed = 0
+    for decision in decisions:
+        q_id, response = str(decision.get("q_id")), clean_ans(decision.get("response"))
+        if q_id not in index:
+            raise GradingInputError(f"Unknown question: {q_id}")
+        try:
+            credit = min(max(float(decision.get("credit")), 0.0), 1.0)
+        except (TypeError, ValueError):
+            raise GradingInputError(f"Invalid credit for question {q_id}") from None
+        j = index[q_id]
+        reviewed.setdefault(q_id, {})[response] = credit
+        for name, result in session["results"].items():
+            if response not in result["vocabs"][j]:
+                continue
+            rows = result["codes"][:, j] == result["vocabs"][j].index(response)
+            if name not in copied:
+                result["credit"] = (credit_matrix(result) if result.get("credit") is None else result["credit"]).copy()
+                copied.add(name)
+            result["credit"][rows, j] = credit
+            changed += int(rows.sum())
+
+    for result in session["results"].values():
+        if result.get("credit") is not None:
+            result["correct"] = result["credit"] >= 1
+            result["scores"] = result["credit"] @ key["scores"]
+            result["error_counts"] = (~result["correct"]).sum(axis=0)
+    batch = session.get("batch", any("class" in rec for rec in session["error_records"].values()))
+    session["error_records"], session["question_error_counts"] = summarize_results(session["results"], key, batch)
+    return session, changed
@@ -0,0 +1,32 @@
+import csv
+import io
+
+
+# 表格导出的公共部分：计划板导出和成绩历史导出都用这两个函数，行数据由各自的服务逐行生成
+CSV_FLUSH_ROWS = 500
+
+
+def stream_csv(rows):
+    """逐块产出 CSV 文本 (带 BOM，Excel 直接打开不乱码)，每 CSV_FLUSH_ROWS 行输出一次"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def write_xlsx(rows, target, sheet_title):
+    """write_only 工作簿逐行写出，内存占用与行数无关"""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    for row in rows:
+        ws.append(row)
+    wb.save(target)
+    target.seek(0)
+    return target
@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+EXCLUDE_COLS = ['Name', 'Exam', 'Total']
+HISTOGRAM_BINS = 10
+# 班级文件较多时用线程池并发读取 (read_csv 的解析大部分在 C 层，会释放 GIL)
+GRADE_SCAN_WORKERS = int(os.environ.get("BANG_GRADE_SCAN_WORKERS", min(8, os.cpu_count() or 1)))
+PARALLEL_SCAN_MIN_FILES = 4
+
+
+def _round(value, digits=2):
+    import numpy as np
+    return round(float(value), digits) if value is not None and np.isfinite(value) else 0
+
+
+def _read_class_exam(item, exam_name):
+    """读取单个班级 CSV，只保留指定考试的行，并补上班级列与 Total 列"""
+    import pandas as pd
+    class_id, class_label, path = item
+    try:
+        df = pd.read_csv(path)
+    except Exception:
+        return None
+    if 'Exam' not in df.columns:
+        return None
+    df = df[df['Exam'] == exam_name]
+    if df.empty:
+        return None
+    subjects = [c for c in df.columns if c not in EXCLUDE_COLS]
+    numeric = df[subjects].apply(pd.to_numeric, errors='coerce')
+    if 'Total' in df.columns:
+        total = pd.to_numeric(df['Total'], errors='coerce').fillna(0)
+    else:
+        total = numeric.sum(axis=1)
+    frame = numeric.copy()
+    frame['Total'] = total.to_numpy()
+    frame['_class_id'] = class_id
+    frame['_class'] = class_label
+    return frame
+
+
+def load_grade_frame(class_files, exam_name, workers=None):
+    """
+    一次扫描读取整个年级的班级文件，拼成一张列式大表：
+    每行一个学生，列为各科分数 + Total + 班级。class_files: [(class_id, 显示名, 路径)]
+    """
+    import pandas as pd
+    workers = GRADE_SCAN_WORKERS if workers is None else workers
+    if workers > 1 and len(class_files) >= PARALLEL_SCAN_MIN_FILES:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(lambda item: _read_class_exam(item, exam_name), class_files))
+    else:
+        frames = [_read_class_exam(item, exam_name) for item in class_files]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def _five_numbers(values):
+    """箱线图五数：[min, Q1, median, Q3, max]"""
+    import numpy as np
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return [0, 0, 0, 0, 0]
+    return [_round(v) for v in np.quantile(values, [0, 0.25, 0.5, 0.75, 1])]
+
+
+def grade_distribution(frame, bins=HISTOGRAM_BINS):
+    """
+    在拼好的年级大表上一次性计算：各班均分/最高分/人数/四分位、
+    全年级共用分箱的总分直方图，以及每个科目按班级的箱线图数据。
+    """
+    import numpy as np
+    import pandas as pd
+    class_ids = frame['_class_id'].to_numpy()
+    order = pd.unique(class_ids)
+    labels = frame.drop_duplicates('_class_id').set_index('_class_id')['_class']
+    subjects = [c for c in frame.columns if c not in ('Total', '_class_id', '_class')
+                and frame[c].fillna(0).ne(0).any()]
+    totals = frame['Total'].to_numpy(dtype=float)
+    groups = {cid: np.flatnonzero(class_ids == cid) for cid in order}
+
+    finite_totals = totals[np.isfinite(totals)]
+    lo, hi = (finite_totals.min(), finite_totals.max()) if finite_totals.size else (0, 1)
+    edges = np.histogram_bin_edges(finite_totals, bins=bins, range=(lo, hi if hi > lo else lo + 1))
+
+    stats, histogram = [], {}
+    for cid in order:
+        class_totals = totals[groups[cid]]
+        five = _five_numbers(class_totals)
+        stats.append({
+            'class_id': cid,
+            'class': labels[cid],
+            'avg_total': _round(np.nanmean(class_totals)) if np.isfinite(class_totals).any() else 0,
+            'max_total': five[4],
+            'min_total': five[0],
+            'q1': five[1],
+            'median': five[2],
+            'q3': five[3],
+            'std': _round(np.nanstd(class_totals)) if np.isfinite(class_totals).any() else 0,
+            'student_count': int(len(class_totals)),
+        })
+        counts, _ = np.histogram(class_totals[np.isfinite(class_totals)], bins=edges)
+        histogram[labels[cid]] = counts.tolist()
+
+    boxplots = {}
+    for sub in ['Total'] + subjects:
+        values = frame[sub].to_numpy(dtype=float)
+        boxplots[sub] = [_five_numbers(values[groups[cid]]) for cid in order]
+
+    grade_counts, _ = np.histogram(finite_totals, bins=edges)
+    return {
+        'stats': stats,
+        'histogram': {
+            'edges': [_round(e) for e in edges],
+            'classes': histogram,
+            'grade': grade_counts.tolist(),
+        },
+        'boxplots': {
+            'classes': [labels[cid] for cid in order],
+            'subjects': ['Total'] + subjects,
+            'data': boxplots,
+        },
+        'grade_summary': {
+            'count': int(len(totals)),
+            'mean': _round(finite_totals.mean()) if finite_totals.size else 0,
+            'std': _round(finite_totals.std()) if finite_totals.size else 0,
+            'quartiles': _five_numbers(totals),
+        },
+    }
+
+
+def grade_analytics(class_files, exam_name, workers=None):
+    """Grade Overview 的单次接口：扫描 + 分布计算；没有数据时返回空 stats"""
+    frame = load_grade_frame(class_files, exam_name, workers)
+    if frame is None:
+        return {'stats': []}
+    return grade_distribution(frame)
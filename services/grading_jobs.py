@@ -0,0 +1,270 @@
+import json
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from services.library_service import get_db_connection
+from services.correction_service import run_grading, apply_review, GradingInputError
+from services.http_cache import file_version
+
+
+# 后台批改：上传接口只登记任务并立即返回 job id，批改在线程池里分阶段执行，
+# 进度和结果写进 SQLite，所以任意一个 worker 都能回答状态查询。
+# 线程池足够：大答题卡的批改本身会再分片交给 grading_service 的进程池。
+GRADING_JOB_WORKERS = int(os.environ.get("BANG_GRADING_JOB_WORKERS", 2))
+# 超过这个时间没有进度更新的运行中任务视为 worker 已退出
+JOB_STALE_AFTER = timedelta(minutes=15)
+JOB_RETENTION = timedelta(days=1)
+# 每个账号保留最近几次批改会话
+SESSIONS_PER_USER = 3
+SESSION_CACHE_SIZE = 16
+
+_executor = None
+_executor_guard = threading.Lock()
+_session_cache = OrderedDict()
+_session_cache_guard = threading.Lock()
+# 复核写回按账号串行：固定数量的锁，按用户 id 取一把，不随账号数增长
+_review_locks = [threading.Lock() for _ in range(16)]
+
+
+def _pool():
+    global _executor
+    with _executor_guard:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=GRADING_JOB_WORKERS, thread_name_prefix="grading-job")
+        return _executor
+
+
+# ===========================
+# Grading Sessions (persisted results)
+# ===========================
+def _write_session_file(path, session):
+    """临时文件 + os.replace，读的一方永远看不到写了一半的会话"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.pkl')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({**session, "analysis_cache": {}}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_grading_session(session_dir, user_id, session):
+    """批改会话整体 pickle 到磁盘，并只保留该账号最近几次"""
+    os.makedirs(session_dir, exist_ok=True)
+    path = os.path.join(session_dir, f"{session['session_id']}.pkl")
+    _write_session_file(path, session)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO grading_sessions (id, user_id, file_path, created_at) VALUES (?, ?, ?, ?)",
+                   (session['session_id'], user_id, path, datetime.now()))
+    cursor.execute("SELECT id, file_path FROM grading_sessions WHERE user_id = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                   (user_id, SESSIONS_PER_USER))
+    expired = cursor.fetchall()
+    cursor.executemany("DELETE FROM grading_sessions WHERE id = ?", [(row["id"],) for row in expired])
+    conn.commit()
+    conn.close()
+    for row in expired:
+        if os.path.exists(row["file_path"]):
+            os.remove(row["file_path"])
+    _cache_session(session, file_version(path))
+
+
+def _cache_session(session, version):
+    """进程内缓存按会话文件的 (mtime_ns, size) 记版本：其他 worker 写回后这里会重新读文件"""
+    with _session_cache_guard:
+        _session_cache[session['session_id']] = (version, session)
+        _session_cache.move_to_end(session['session_id'])
+        while len(_session_cache) > SESSION_CACHE_SIZE:
+            _session_cache.popitem(last=False)
+
+
+def cache_session_analysis(session, cache_key, analysis):
+    """
+    题目分析结果记到会话的 analysis_cache：不原地修改共用的会话，换成带新缓存的副本。
+    缓存里已经是别的版本 (复核刚写回) 时不覆盖，返回的副本只给本次请求用。
+    """
+    updated = {**session, "analysis_cache": {**session.get("analysis_cache", {}), cache_key: analysis}}
+    with _session_cache_guard:
+        cached = _session_cache.get(session['session_id'])
+        if cached is not None and cached[1] is session:
+            _session_cache[session['session_id']] = (cached[0], updated)
+    return updated
+
+
+def _session_row(conn, user_id, session_id=None):
+    if session_id:
+        return conn.execute("SELECT id, file_path FROM grading_sessions WHERE id = ? AND user_id = ?",
+                            (session_id, user_id)).fetchone()
+    return conn.execute("SELECT id, file_path FROM grading_sessions WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+                        (user_id,)).fetchone()
+
+
+def _read_session(row):
+    version = file_version(row["file_path"])
+    if version is None:
+        return None
+    with _session_cache_guard:
+        cached = _session_cache.get(row["id"])
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    try:
+        with open(row["file_path"], 'rb') as f:
+            session = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    _cache_session(session, version)
+    return session
+
+
+def load_grading_session(user_id, session_id=None):
+    """
+    该账号最近一次 (或指定的) 批改会话；没有时返回 None。
+    返回的对象可能被多个请求共用，调用方不能原地修改 (复核改分走 review_grading_session)。
+    """
+    conn = get_db_connection()
+    row = _session_row(conn, user_id, session_id)
+    conn.close()
+    return _read_session(row) if row is not None else None
+
+
+def review_grading_session(user_id, session_id, decisions):
+    """
+    老师复核简答题：在会话的副本上改分并写回原文件 (临时文件 + os.replace)。
+    返回 (新会话, 改动人次)；没有会话时返回 (None, 0)，决定不合法时抛出 GradingInputError。
+    同一会话的复核串行执行：进程内按账号加锁，跨 worker 由 SQLite 写事务 (BEGIN IMMEDIATE) 排队，
+    每次都在上一次写回的版本上修改，不会互相覆盖。
+    """
+    lock = _review_locks[hash(user_id) % len(_review_locks)]
+    with lock:
+        conn = get_db_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = _session_row(conn, user_id, session_id)
+            session = _read_session(row) if row is not None else None
+            if session is None:
+                conn.rollback()
+                return None, 0
+            reviewed, changed = apply_review(session, decisions)
+            _write_session_file(row["file_path"], reviewed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        _cache_session(reviewed, file_version(row["file_path"]))
+    return reviewed, changed
+
+
+# ===========================
+# Grading Jobs
+# ===========================
+def _update_job(job_id, **fields):
+    fields["updated_at"] = datetime.now()
+    conn = get_db_connection()
+    conn.execute(f"UPDATE grading_jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                 (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+
+def create_job(user_id):
+    job_id = uuid.uuid4().hex
+    now = datetime.now()
+    conn = get_db_connection()
+    conn.execute("DELETE FROM grading_jobs WHERE updated_at < ?", (now - JOB_RETENTION,))
+    conn.execute(
+        "INSERT INTO grading_jobs (id, user_id, status, stage, percent, message, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, user_id, 'queued', 'queued', 0, 'Waiting for a grading worker', now, now)
+    )
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def get_job(job_id, user_id):
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM grading_jobs WHERE id = ? AND user_id = ?", (job_id, user_id)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    # 只有运行中的任务才按进度超时判断：排队中的任务可能只是前面的大批改还没做完
+    stale_before = datetime.now() - JOB_STALE_AFTER
+    if job["status"] == 'running' and datetime.fromisoformat(str(job["updated_at"])) < stale_before:
+        error = 'Grading worker stopped before the job finished'
+        conn = get_db_connection()
+        cursor = conn.execute(
+            "UPDATE grading_jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND status = 'running' AND updated_at < ?",
+            (error, datetime.now(), job_id, stale_before)
+        )
+        conn.commit()
+        conn.close()
+        if cursor.rowcount == 1:
+            job.update(status='failed', error=error)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def grade_and_save(session_dir, user_id, bank_raw, sheets, batch=False, progress=None):
+    """同步执行完整批改并保存会话，返回结果摘要 (含 session_id)"""
+    session, summary = run_grading(bank_raw, sheets, batch, progress, user_id)
+    if progress:
+        progress('save', 95, 'Saving grading session')
+    save_grading_session(session_dir, user_id, session)
+    return {**summary, "session_id": session["session_id"]}
+
+
+def _claim_job(job_id):
+    """queued -> running，返回是否由本线程执行；任务已不是排队状态 (已失败 / 已取消) 时不再开始"""
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "UPDATE grading_jobs SET status = 'running', stage = 'start', message = 'Grading started', updated_at = ? "
+        "WHERE id = ? AND status = 'queued'",
+        (datetime.now(), job_id)
+    )
+    conn.commit()
+    conn.close()
+    return cursor.rowcount == 1
+
+
+def _run_job(job_id, session_dir, user_id, bank_raw, sheets, batch):
+    if not _claim_job(job_id):
+        return
+    last = {}
+
+    def progress(stage, percent, message=None):
+        # 同一阶段内进度没变就不写库
+        if last.get("stage") == stage and last.get("percent") == percent:
+            return
+        last.update(stage=stage, percent=percent)
+        _update_job(job_id, status='running', stage=stage, percent=percent, message=message)
+
+    try:
+        summary = grade_and_save(session_dir, user_id, bank_raw, sheets, batch, progress)
+    except GradingInputError as e:
+        _update_job(job_id, status='failed', error=str(e))
+    except Exception as e:
+        _update_job(job_id, status='failed', error=f"处理失败: {str(e)}")
+    else:
+        _update_job(job_id, status='done', stage='done', percent=100, message='Complete',
+                    session_id=summary["session_id"], result=json.dumps(summary))
+
+
+def submit_grading_job(session_dir, user_id, bank_raw, sheets, batch=False):
+    """
+    登记任务并交给后台线程池。文件内容需先读成 bytes (请求结束后上传流会被关闭)。
+    sheets: [(文件名, bytes)]。返回 job id。
+    """
+    job_id = create_job(user_id)
+    _pool().submit(_run_job, job_id, session_dir, user_id, bank_raw, sheets, batch)
+    return job_id
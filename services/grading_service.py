@@ -0,0 +1,357 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from services.column_matching import match_columns
+from services.scoring_rules import compile_rules, key_matchers, score_vocab
+
+
+# 超过这个规模 (学生行数 × 题目数) 才启用多进程，小文件进程启动开销反而更大
+PARALLEL_GRADING_MIN_CELLS = int(os.environ.get("BANG_PARALLEL_GRADING_MIN_CELLS", 2000000))
+GRADING_WORKERS = int(os.environ.get("BANG_GRADING_WORKERS", 0)) or (os.cpu_count() or 1)
+BANK_SUMMARY_ROWS = ['total score', 'total', 'summary', 'statistics', 'nan']
+
+
+def clean_ans(val):
+    import pandas as pd
+    if pd.isna(val):
+        return ""
+    s = str(val).strip()
+    if s.endswith('.0'):
+        s = s[:-2]
+    return s.upper()
+
+
+def clean_answer_series(series):
+    """clean_ans 的向量化版本：只对不同的取值各清洗一次"""
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    cleaned = np.array([clean_ans(v) for v in uniques] + [""], dtype=object)
+    return cleaned[codes]
+
+
+def encode_answer_column(series):
+    """
+    把一列作答编码成 (codes, vocab)：vocab 是清洗后的不同答案，codes 是每行在 vocab 中的下标。
+    比对和统计都在整数数组上完成，跨进程传输也只需要 int32。
+    """
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    cleaned = [clean_ans(v) for v in uniques] + [""]
+    vocab_codes, vocab = pd.factorize(pd.Series(cleaned, dtype=object))
+    return vocab_codes[codes].astype(np.int32), [str(v) for v in vocab]
+
+
+# ===========================
+# 1. Answer Key
+# ===========================
+def build_answer_key(df_b, col_map, content_col=None, section_col=None, rule_col=None):
+    """
+    从题库中提取题号、标准答案(已清洗)、分值、题目内容和所属大题 (可选)，
+    并把每题的评分规则 (rule_col，可选) 编译成匹配器，规则写错时抛出 ScoringRuleError。
+    """
+    import pandas as pd
+    valid_b = df_b[df_b[col_map['q_id']].notna()].copy()
+    qid_series = valid_b[col_map['q_id']].astype(str).str.strip()
+    valid_b = valid_b[~qid_series.str.lower().isin(BANK_SUMMARY_ROWS)]
+
+    # 与旧版 dict(zip(...)) 行为一致：重复题号以最后一行为准，顺序按首次出现
+    q_ids = valid_b[col_map['q_id']].astype(str)
+    last_rows = valid_b[~q_ids.duplicated(keep='last')]
+    order = pd.unique(q_ids)
+    last_rows = last_rows.set_index(last_rows[col_map['q_id']].astype(str)).loc[order]
+
+    scores = pd.to_numeric(last_rows[col_map['score']], errors='coerce').fillna(0)
+    content = ["No Content"] * len(order)
+    if content_col:
+        first_rows = valid_b[~q_ids.duplicated(keep='first')]
+        content = [str(v) for v in first_rows[content_col]]
+    sections = None
+    if section_col:
+        sections = ["Other" if pd.isna(v) or not str(v).strip() else str(v).strip() for v in last_rows[section_col]]
+    rules = None
+    if rule_col:
+        rules = ["" if pd.isna(v) else str(v).strip() for v in last_rows[rule_col]]
+    answers = clean_answer_series(last_rows[col_map['ans']])
+    q_id_list = [str(q) for q in order]
+
+    return {
+        "q_ids": q_id_list,
+        "answers": answers,
+        "rules": rules,
+        "matchers": compile_rules(answers, rules, q_id_list),
+        "scores": scores.to_numpy(dtype=float),
+        "content": content,
+        "sections": sections,
+        "paper_total": float(pd.to_numeric(valid_b[col_map['score']], errors='coerce').fillna(0).sum()),
+    }
+
+
+def match_student_columns(student_columns, q_ids):
+    """
+    题号 -> 答题卡列名，规则见 column_matching (精确 > 规范化 > 大题/题号键 > 只比题号)。
+    没有对应列或存在歧义的题目返回 None（按空答案处理）。
+    """
+    return match_columns(student_columns, q_ids)["columns"]
+
+
+# ===========================
+# 2. Grading (vectorized, optionally sharded across processes)
+# ===========================
+def extract_names(df_s, name_col):
+    raw = df_s[name_col] if name_col else df_s.iloc[:, 0]
+    names = raw.astype(str).str.strip()
+    keep = (names != '') & (names.str.lower() != 'nan')
+    return names, keep.to_numpy()
+
+
+def encode_responses(df_s, matched_cols):
+    """返回 n × q 的作答编码矩阵以及每题的答案词表"""
+    import numpy as np
+    n = len(df_s)
+    codes = np.zeros((n, len(matched_cols)), dtype=np.int32)
+    vocabs = []
+    cache = {}
+    for j, col in enumerate(matched_cols):
+        if col is None:
+            vocabs.append([""])
+            continue
+        if col not in cache:
+            cache[col] = encode_answer_column(df_s[col])
+        codes[:, j], vocab = cache[col]
+        vocabs.append(vocab)
+    return codes, vocabs
+
+
+def grade_responses(codes, vocabs, matchers, scores):
+    """
+    每题只对词表里不同的作答按评分规则算一次得分比例，再按 codes 广播到所有学生。
+    返回 credit (n × q，0~1 的得分比例)、correct (得满分)、每个学生的总分。
+    """
+    import numpy as np
+    credit = np.zeros(codes.shape, dtype=float)
+    for j, vocab in enumerate(vocabs):
+        credit[:, j] = score_vocab(matchers[j], vocab)[codes[:, j]]
+    return credit, credit >= 1, credit @ scores
+
+
+def credit_matrix(result):
+    """得分比例矩阵；按旧版 (只有对错) 保存的批改会话退回 correct"""
+    import numpy as np
+    credit = result.get("credit")
+    return credit if credit is not None else np.asarray(result["correct"], dtype=float)
+
+
+def merge_encoded(parts):
+    """合并各分片的编码：每题的词表取并集，分片 codes 重新映射到合并后的词表"""
+    import numpy as np
+    n_questions = parts[0][0].shape[1]
+    vocabs = []
+    remapped = [np.empty_like(codes) for codes, _ in parts]
+    for j in range(n_questions):
+        index = {}
+        for k, (codes, shard_vocabs) in enumerate(parts):
+            lookup = np.array([index.setdefault(v, len(index)) for v in shard_vocabs[j]], dtype=np.int32)
+            remapped[k][:, j] = lookup[codes[:, j]]
+        vocabs.append(list(index))
+    return np.vstack(remapped), vocabs
+
+
+def response_matrix(result):
+    """按需还原成清洗后的作答字符串矩阵 (n × q)"""
+    import numpy as np
+    out = np.empty(result["codes"].shape, dtype=object)
+    for j, vocab in enumerate(result["vocabs"]):
+        out[:, j] = np.array(vocab, dtype=object)[result["codes"][:, j]]
+    return out
+
+
+_worker_key = {}
+
+
+def _init_worker(key):
+    """每个子进程只接收一次标准答案"""
+    _worker_key.update(key)
+
+
+def _process_pool(max_workers, key):
+    """
+    批改用的进程池。调用方是多线程的 web 进程 / 后台批改线程，直接 fork 会把别的线程持有的锁
+    (SQLite、logging、各种缓存) 原样复制进子进程，可能卡死；改用 forkserver (Windows 上为 spawn)，
+    子进程从干净的服务进程派生，标准答案经 initargs 序列化传入。
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method),
+                               initializer=_init_worker, initargs=(key,))
+
+
+def _grade_shard(shard, matched_cols):
+    codes, vocabs = encode_responses(shard, matched_cols)
+    credit, correct, totals = grade_responses(codes, vocabs, key_matchers(_worker_key), _worker_key["scores"])
+    return codes, vocabs, credit, correct, totals, (~correct).sum(axis=0)
+
+
+def _grade_class(df_s, name_col):
+    return grade_students(df_s, _worker_key, name_col, workers=1)
+
+
+def should_use_pool(n_rows, n_questions, workers):
+    return workers > 1 and n_rows * n_questions >= PARALLEL_GRADING_MIN_CELLS
+
+
+def grade_students(df_s, key, name_col=None, workers=None):
+    """
+    批改整张答题卡。返回:
+    names, codes/vocabs (作答编码), credit (n × q 得分比例), correct (n × q bool, 得满分),
+    scores (n), error_counts (q, 未得满分的人数)
+    超过阈值时按行切片，交给 ProcessPoolExecutor 并行批改，最后合并错题统计。
+    """
+    import numpy as np
+    names, keep = extract_names(df_s, name_col)
+    df_s = df_s[keep]
+    names = names[keep].tolist()
+    matched_cols = match_student_columns(df_s.columns, key["q_ids"])
+    used_cols = sorted({c for c in matched_cols if c is not None})
+    df_answers = df_s[used_cols]
+
+    workers = GRADING_WORKERS if workers is None else workers
+    if not should_use_pool(len(df_answers), len(key["q_ids"]), workers):
+        codes, vocabs = encode_responses(df_answers, matched_cols)
+        credit, correct, totals = grade_responses(codes, vocabs, key_matchers(key), key["scores"])
+        error_counts = (~correct).sum(axis=0)
+    else:
+        bounds = np.linspace(0, len(df_answers), workers + 1, dtype=int)
+        shards = [df_answers.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        with _process_pool(len(shards), key) as pool:
+            parts = list(pool.map(_grade_shard, shards, [matched_cols] * len(shards)))
+        codes, vocabs = merge_encoded([(p[0], p[1]) for p in parts])
+        credit = np.vstack([p[2] for p in parts])
+        correct = np.vstack([p[3] for p in parts])
+        totals = np.concatenate([p[4] for p in parts])
+        error_counts = np.sum([p[5] for p in parts], axis=0)
+
+    return {
+        "names": names,
+        "codes": codes,
+        "vocabs": vocabs,
+        "credit": credit,
+        "correct": correct,
+        "scores": totals,
+        "error_counts": error_counts,
+    }
+
+
+def build_error_records(result, key):
+    """转换成旧接口使用的 {姓名: {"wrongs": [...], "score": x}} 结构"""
+    import numpy as np
+    q_ids = np.array(key["q_ids"], dtype=object)
+    return {
+        name: {"wrongs": q_ids[~result["correct"][i]].tolist(), "score": round(float(result["scores"][i]), 2)}
+        for i, name in enumerate(result["names"])
+    }
+
+
+def section_subtotals(result, key):
+    """按大题汇总每个学生的得分，返回 {大题名: 分数数组}，题库没有大题列时返回 {}"""
+    import numpy as np
+    import pandas as pd
+    if not key.get("sections"):
+        return {}
+    earned = credit_matrix(result) * key["scores"][np.newaxis, :]
+    sections = np.array(key["sections"], dtype=object)
+    return {sec: earned[:, sections == sec].sum(axis=1) for sec in pd.unique(sections)}
+
+
+# ===========================
+# 3. Batch Grading (one answer key, many classes)
+# ===========================
+def grade_classes(class_sheets, key, workers=None, progress=None):
+    """
+    class_sheets: {班级名: (答题卡 DataFrame, 姓名列)}
+    同一份标准答案批改所有班级；总规模超过阈值时每个班级交给一个子进程。
+    progress(已完成班级数, 班级总数) 在每个班级批改完后调用。
+    """
+    workers = GRADING_WORKERS if workers is None else workers
+    total_rows = sum(len(df) for df, _ in class_sheets.values())
+    labels = list(class_sheets)
+    results = {}
+    if len(labels) > 1 and should_use_pool(total_rows, len(key["q_ids"]), workers):
+        with _process_pool(min(workers, len(labels)), key) as pool:
+            futures = {pool.submit(_grade_class, *class_sheets[label]): label for label in labels}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress:
+                    progress(done, len(labels))
+        return {label: results[label] for label in labels}
+    for done, label in enumerate(labels, 1):
+        df, name_col = class_sheets[label]
+        results[label] = grade_students(df, key, name_col, workers=workers)
+        if progress:
+            progress(done, len(labels))
+    return results
+
+
+def combine_results(results):
+    """把多个班级的批改结果纵向合并成一个整体 (用于全年级统计)"""
+    import numpy as np
+    parts = list(results.values())
+    if len(parts) == 1:
+        return parts[0]
+    codes, vocabs = merge_encoded([(r["codes"], r["vocabs"]) for r in parts])
+    return {
+        "names": [name for r in parts for name in r["names"]],
+        "codes": codes,
+        "vocabs": vocabs,
+        "credit": np.vstack([credit_matrix(r) for r in parts]),
+        "correct": np.vstack([r["correct"] for r in parts]),
+        "scores": np.concatenate([r["scores"] for r in parts]),
+        "error_counts": np.sum([r["error_counts"] for r in parts], axis=0),
+    }
+
+
+def score_summary(scores, paper_total, pass_ratio=0.6):
+    import numpy as np
+    scores = np.asarray(scores, dtype=float)
+    if scores.size == 0:
+        return {"student_count": 0, "avg": 0, "median": 0, "max": 0, "min": 0, "std": 0, "pass_rate": 0}
+    return {
+        "student_count": int(scores.size),
+        "avg": round(float(scores.mean()), 2),
+        "median": round(float(np.median(scores)), 2),
+        "max": round(float(scores.max()), 2),
+        "min": round(float(scores.min()), 2),
+        "std": round(float(scores.std()), 2),
+        "pass_rate": round(float((scores >= paper_total * pass_ratio).mean()), 4) if paper_total else 0,
+    }
+
+
+def batch_statistics(results, key):
+    """每个班级 + 全年级的成绩统计，以及每道题按班级的错误人数/错误率分布"""
+    import numpy as np
+    q_ids = key["q_ids"]
+    classes = []
+    distribution = {"q_ids": q_ids, "classes": {}, "combined": {}}
+    combined_errors = np.zeros(len(q_ids), dtype=int)
+    combined_count = 0
+    for label, result in results.items():
+        count = len(result["names"])
+        errors = np.asarray(result["error_counts"], dtype=int)
+        combined_errors += errors
+        combined_count += count
+        classes.append({"class": label, **score_summary(result["scores"], key["paper_total"])})
+        distribution["classes"][label] = {
+            "error_counts": errors.tolist(),
+            "error_rates": (errors / count).round(4).tolist() if count else [0] * len(q_ids),
+        }
+    all_scores = np.concatenate([r["scores"] for r in results.values()]) if results else np.array([])
+    distribution["combined"] = {
+        "error_counts": combined_errors.tolist(),
+        "error_rates": (combined_errors / combined_count).round(4).tolist() if combined_count else [0] * len(q_ids),
+    }
+    return {
+        "classes": classes,
+        "combined": score_summary(all_scores, key["paper_total"]),
+        "question_distribution": distribution,
+    }
@@ -0,0 +1,87 @@
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+RESPONSE_CACHE_SIZE = 64
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git_revision(root=ROOT_DIR):
+    """读 .git/HEAD 得到当前提交 (不启动 git 进程)；不是 git 目录时返回 None"""
+    git_dir = os.path.join(root, '.git')
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), encoding='utf-8') as f:
+            head = f.read().strip()
+        if not head.startswith('ref: '):
+            return head
+        ref = head[5:]
+        ref_path = os.path.join(git_dir, ref)
+        if os.path.exists(ref_path):
+            with open(ref_path, encoding='utf-8') as f:
+                return f.read().strip()
+        with open(os.path.join(git_dir, 'packed-refs'), encoding='utf-8') as f:
+            for line in f:
+                if line.rstrip().endswith(' ' + ref):
+                    return line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+# 部署版本：同一次部署的所有 worker、重启前后都相同，发布新模板 / 新代码后旧 ETag 自动失效。
+# 优先取 BANG_RELEASE，其次取 git 当前提交。不能用每个进程随机生成的值，
+# 否则请求落到另一个 worker 或重启后 If-None-Match 永远对不上。
+RELEASE_ID = os.environ.get("BANG_RELEASE", "").strip() or _git_revision() or "dev"
+
+
+def make_etag(*parts):
+    """ETag 只由部署版本和调用方给的数据版本 (用户、路径、file_version / dir_version) 决定"""
+    digest = hashlib.sha1(repr((RELEASE_ID,) + parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def file_version(path):
+    """文件数据版本：(mtime_ns, size)，文件不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def dir_version(directory, pattern='*.csv'):
+    """目录下所有匹配文件的 (文件名, mtime_ns, size)，只 stat 不读内容"""
+    return tuple(sorted(
+        (os.path.basename(path),) + (file_version(path) or ())
+        for path in glob.glob(os.path.join(directory, pattern))
+    ))
+
+
+class ResponseCache:
+    """线程安全的小型 LRU，用于缓存重复的只读 POST 查询结果"""
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
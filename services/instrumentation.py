@@ -0,0 +1,225 @@
+"""
+可选的性能埋点：路由延迟直方图、命名阶段 span、SQLite 查询计数/耗时，
+以 Prometheus 文本格式导出；另有给管理员用的按需采样 profiler。
+设置 BANG_METRICS=1 开启，默认关闭且几乎零开销。
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+ENABLED = os.environ.get("BANG_METRICS", "").strip().lower() in {"1", "true", "yes", "on"}
+# /metrics 的抓取令牌 (Authorization: Bearer <令牌>)；不设置时只有登录的管理员能看
+METRICS_TOKEN = os.environ.get("BANG_METRICS_TOKEN", "").strip()
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+# 采样 profiler 的参数范围：时长 0.1–30 秒，采样间隔不低于 1 毫秒
+PROFILE_MIN_SECONDS = 0.1
+PROFILE_MAX_SECONDS = 30
+PROFILE_MIN_INTERVAL = 0.001
+
+# 当前请求内各 span 的累计耗时，用于 Server-Timing 响应头
+_request_spans = ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    """Prometheus 风格的累计直方图，按标签元组分组"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            for labels, (counts, total, count) in items:
+                base = _format_labels(self.label_names, labels)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_with_le(base, bound)} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_with_le(base, "+Inf")} {count}')
+                lines.append(f"{self.name}_sum{base} {total:.6f}")
+                lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _with_le(base, bound):
+    le = f'le="{bound}"'
+    return "{" + le + "}" if not base else base[:-1] + "," + le + "}"
+
+
+REQUEST_LATENCY = Histogram("bang_request_duration_seconds", "Request latency by route", ("route", "method", "status"), LATENCY_BUCKETS)
+SPAN_LATENCY = Histogram("bang_span_duration_seconds", "Duration of named processing stages", ("span",), LATENCY_BUCKETS)
+SQL_LATENCY = Histogram("bang_sqlite_query_duration_seconds", "SQLite statement execution time", ("operation",), SQL_BUCKETS)
+SQL_CONNECTIONS = CounterMetric("bang_sqlite_connections_total", "SQLite connections opened", ())
+METRICS = (REQUEST_LATENCY, SPAN_LATENCY, SQL_LATENCY, SQL_CONNECTIONS)
+
+
+# ---------- 请求 / span ----------
+
+def begin_request():
+    if ENABLED:
+        _request_spans.set({})
+    return time.perf_counter()
+
+
+def end_request(started, route, method, status):
+    """记录路由延迟，返回可放进 Server-Timing 头的字符串 (未开启时为 None)"""
+    if not ENABLED:
+        return None
+    REQUEST_LATENCY.observe((route, method, str(status)), time.perf_counter() - started)
+    spans = _request_spans.get() or {}
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans.items()) or None
+
+
+@contextmanager
+def span(name):
+    """给一个处理阶段计时：with span("grade"): ..."""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_LATENCY.observe((name,), elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans[name] = spans.get(name, 0.0) + elapsed
+
+
+# ---------- SQLite ----------
+
+def _operation(sql):
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else "OTHER"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            SQL_LATENCY.observe((_operation(sql),), time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            SQL_LATENCY.observe((_operation(sql),), time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        SQL_CONNECTIONS.inc(())
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def connection_factory():
+    """sqlite3.connect(..., factory=connection_factory())；未开启时就是原生 Connection"""
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+
+# ---------- 导出 / profiler ----------
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(seconds=5.0, interval=0.005):
+    """
+    采样 profiler：在 seconds 内每隔 interval 抓一次所有线程的调用栈，
+    输出 collapsed stack 格式 ("a;b;c 次数")，可直接喂给 flamegraph 工具。
+    同一时间只允许一个采样任务。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        seconds = min(max(float(seconds), PROFILE_MIN_SECONDS), PROFILE_MAX_SECONDS)
+        interval = max(float(interval), PROFILE_MIN_INTERVAL)
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stacks[";".join(reversed(parts))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+    finally:
+        _profile_lock.release()
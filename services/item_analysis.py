@@ -0,0 +1,120 @@
+from services.grading_service import credit_matrix
+from services.scoring_rules import key_matchers, score_vocab
+
+
+UPPER_LOWER_RATIO = 0.27
+
+
+def _safe(value, digits=4):
+    import numpy as np
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def _columnwise_corr(x, y):
+    """x, y 都是 n × q 矩阵，逐列计算 Pearson 相关系数；方差为 0 的列返回 nan"""
+    import numpy as np
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denom = np.sqrt((xc ** 2).sum(axis=0) * (yc ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denom > 0, (xc * yc).sum(axis=0) / denom, np.nan)
+
+
+def reliability(correct, item_scores):
+    """KR-20 (按对错计) 与 Cronbach's alpha (按题目分值计)"""
+    import numpy as np
+    n, k = correct.shape
+    if n < 2 or k < 2:
+        return None, None
+    p = correct.mean(axis=0)
+    raw_total = correct.sum(axis=1)
+    var_raw = raw_total.var()
+    kr20 = k / (k - 1) * (1 - (p * (1 - p)).sum() / var_raw) if var_raw > 0 else np.nan
+    var_total = item_scores.sum(axis=1).var()
+    alpha = k / (k - 1) * (1 - item_scores.var(axis=0).sum() / var_total) if var_total > 0 else np.nan
+    return _safe(kr20), _safe(alpha)
+
+
+def item_analysis(result, key, group_ratio=UPPER_LOWER_RATIO):
+    """
+    基于批改得到的对错矩阵，一次性向量化计算:
+    难度 (答对率)、点二列相关区分度 (题目与其余题总分)、高/低分组答对率与区分指数 D、
+    每个选项的作答人数 (干扰项分析)，以及整卷 KR-20 / Cronbach's alpha。
+    """
+    import numpy as np
+    # 部分得分的题目按得分比例计算 (0~1)，全对全错的题目与原来的 0/1 完全一致
+    correct = np.asarray(credit_matrix(result), dtype=float)
+    weights = np.asarray(key["scores"], dtype=float)
+    n, q = correct.shape
+    item_scores = correct * weights[np.newaxis, :]
+    totals = item_scores.sum(axis=1)
+
+    difficulty = correct.mean(axis=0) if n else np.zeros(q)
+    # 区分度用 "去掉本题后的总分"，避免题目与自身相关而虚高
+    rest = totals[:, np.newaxis] - item_scores
+    discrimination = _columnwise_corr(correct, rest) if n > 1 else np.full(q, np.nan)
+
+    group_size = max(1, int(round(n * group_ratio))) if n else 0
+    order = np.argsort(totals, kind='stable')
+    lower_idx, upper_idx = order[:group_size], order[n - group_size:]
+    p_upper = correct[upper_idx].mean(axis=0) if group_size else np.zeros(q)
+    p_lower = correct[lower_idx].mean(axis=0) if group_size else np.zeros(q)
+    in_upper = np.zeros(n, dtype=bool)
+    in_upper[upper_idx] = True
+    in_lower = np.zeros(n, dtype=bool)
+    in_lower[lower_idx] = True
+
+    kr20, alpha = reliability(correct, item_scores)
+
+    items = []
+    codes = result["codes"]
+    matchers = key_matchers(key)
+    for j, q_id in enumerate(key["q_ids"]):
+        vocab = result["vocabs"][j]
+        size = len(vocab)
+        full_credit = score_vocab(matchers[j], vocab) >= 1
+        counts = np.bincount(codes[:, j], minlength=size)
+        upper_counts = np.bincount(codes[in_upper, j], minlength=size)
+        lower_counts = np.bincount(codes[in_lower, j], minlength=size)
+        options = sorted(
+            ({
+                "option": vocab[v] or "(blank)",
+                "count": int(counts[v]),
+                "rate": _safe(counts[v] / n) if n else 0,
+                "upper": int(upper_counts[v]),
+                "lower": int(lower_counts[v]),
+                "is_key": bool(full_credit[v]),
+            } for v in range(size) if counts[v]),
+            key=lambda o: -o["count"]
+        )
+        flags = []
+        if difficulty[j] < 0.2: flags.append("too_hard")
+        if difficulty[j] > 0.9: flags.append("too_easy")
+        if np.isfinite(discrimination[j]) and discrimination[j] < 0.2: flags.append("low_discrimination")
+        if any(not o["is_key"] and o["upper"] > upper_counts.sum() * 0.5 for o in options): flags.append("key_check")
+        items.append({
+            "q_id": q_id,
+            "key": key["answers"][j],
+            "difficulty": _safe(difficulty[j]),
+            "discrimination": _safe(discrimination[j]),
+            "p_upper": _safe(p_upper[j]),
+            "p_lower": _safe(p_lower[j]),
+            "d_index": _safe(p_upper[j] - p_lower[j]),
+            "options": options,
+            "flags": flags,
+        })
+
+    return {
+        "summary": {
+            "students": int(n),
+            "items": int(q),
+            "mean": _safe(totals.mean(), 2) if n else 0,
+            "std": _safe(totals.std(), 2) if n else 0,
+            "kr20": kr20,
+            "alpha": alpha,
+            "group_size": group_size,
+        },
+        "items": items,
+    }
@@ -1,15 +1,29 @@
+import json
+import logging
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from services.instrumentation import connection_factory
+
 
 DB_PATH = 'platform.db'
+# 表结构有变化 (新表 / 新列 / 新索引) 时加 1，已部署的库会在下次启动时自动补齐
+SCHEMA_VERSION = 5
+# 普通用户上传资料的空间上限 (文件 + 封面)，0 表示不限；管理员上传的官方资料不计入
+USER_QUOTA_BYTES = int(os.environ.get("BANG_USER_QUOTA_MB", 500)) * 1024 * 1024
+# 管理后台分页接口每页最多返回的行数
+MAX_PAGE_SIZE = 100
+
+
+def _connect():
+    return sqlite3.connect(DB_PATH, factory=connection_factory())
 
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -17,9 +31,22 @@ def get_db_connection():
 # 1. Database Initialization
 # ===========================
 def init_db():
+    """
+    建表 / 升级表结构。多个 worker 同时启动时可能一起走到这里：
+    先用 BEGIN IMMEDIATE 拿到写锁，再重新读一次 user_version，已被别的进程升级过就直接返回，
+    ALTER TABLE 不会重复执行。整个升级在一个事务里，中途失败不会留下半升级的库。
+    """
     conn = get_db_connection()
+    # 升级 (含补 size_bytes) 可能持锁较久，其他 worker 在 BEGIN IMMEDIATE 上等它做完
+    conn.execute("PRAGMA busy_timeout = 60000")
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.rollback()
+        conn.close()
+        bootstrap_admin_from_env()
+        return
     cursor = conn.cursor()
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS materials (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,7 +56,8 @@ def init_db():
             cover_path TEXT,
             upload_time DATETIME,
             uploader TEXT,
-            user_id INTEGER
+            user_id INTEGER,
+            size_bytes INTEGER
         )
     ''')
     
@@ -38,30 +66,152 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT NOT NULL UNIQUE,
             password_hash TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0 
+            is_admin INTEGER DEFAULT 0,
+            last_login DATETIME
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS planner_boards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            headers TEXT NOT NULL,
+            sort_by TEXT,
+            sort_order TEXT DEFAULT 'desc',
+            version INTEGER DEFAULT 1,
+            updated_at DATETIME
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS planner_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            board_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            archived INTEGER DEFAULT 0,
+            version INTEGER DEFAULT 1,
+            updated_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS performance_student_index (
+            user_id INTEGER NOT NULL,
+            class_id TEXT NOT NULL,
+            student TEXT NOT NULL,
+            records TEXT NOT NULL,
+            PRIMARY KEY (user_id, class_id, student)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grading_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT,
+            percent INTEGER DEFAULT 0,
+            message TEXT,
+            error TEXT,
+            session_id TEXT,
+            result TEXT,
+            created_at DATETIME,
+            updated_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grading_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            created_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS column_profiles (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            name TEXT,
+            header TEXT NOT NULL,
+            mapping TEXT NOT NULL,
+            source TEXT DEFAULT 'user',
+            updated_at DATETIME,
+            PRIMARY KEY (user_id, kind, fingerprint)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            name TEXT PRIMARY KEY,
+            holder TEXT,
+            started_at DATETIME,
+            finished_at DATETIME,
+            report TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_planner_boards_user ON planner_boards(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_user ON grading_jobs(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grading_sessions_user ON grading_sessions(user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_planner_tasks_board ON planner_tasks(board_id)")
+
     cursor.execute("PRAGMA table_info(materials)")
     material_columns = {row["name"] for row in cursor.fetchall()}
     if "user_id" not in material_columns:
         cursor.execute("ALTER TABLE materials ADD COLUMN user_id INTEGER")
+    if "size_bytes" not in material_columns:
+        cursor.execute("ALTER TABLE materials ADD COLUMN size_bytes INTEGER")
+    cursor.execute("PRAGMA table_info(users)")
+    if "last_login" not in {row["name"] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE users ADD COLUMN last_login DATETIME")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_user ON materials(user_id, upload_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_category ON materials(category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_upload_time ON materials(upload_time)")
+
+    # 旧库里的资料没有记录大小：升级时按磁盘上的文件补一次，之后上传时直接写入
+    cursor.execute("SELECT id, file_path, cover_path FROM materials WHERE size_bytes IS NULL")
+    cursor.executemany("UPDATE materials SET size_bytes = ? WHERE id = ?",
+                       [(material_size(row["file_path"], row["cover_path"]), row["id"]) for row in cursor.fetchall()])
+
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    conn.close()
+    bootstrap_admin_from_env()
 
+def bootstrap_admin_from_env():
     init_admin_username = os.environ.get("BANG_INIT_ADMIN_USERNAME", "").strip()
     init_admin_password = os.environ.get("BANG_INIT_ADMIN_PASSWORD", "").strip()
+    if not (init_admin_username and init_admin_password):
+        return
 
-    if init_admin_username and init_admin_password:
-        cursor.execute("SELECT id FROM users WHERE username = ?", (init_admin_username,))
-        if not cursor.fetchone():
-            p_hash = generate_password_hash(init_admin_password)
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
-                (init_admin_username, p_hash, 1)
-            )
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE username = ?", (init_admin_username,))
+    if not cursor.fetchone():
+        p_hash = generate_password_hash(init_admin_password)
+        # 多个 worker 同时启动时只有一个插入成功，其余忽略
+        cursor.execute(
+            "INSERT OR IGNORE INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
+            (init_admin_username, p_hash, 1)
+        )
+        conn.commit()
+        if cursor.rowcount == 1:
             print(f">>> Initial admin created from environment: {init_admin_username}")
+    conn.close()
 
-    conn.commit()
+def schema_version():
+    conn = _connect()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
     conn.close()
+    return version
+
+def ensure_db():
+    """
+    worker 启动时调用：只读一次 PRAGMA user_version，库已是最新结构就什么都不做。
+    正式部署建议在发布时执行一次 `flask --app app init-db`。
+    """
+    if schema_version() < SCHEMA_VERSION:
+        init_db()
+    else:
+        bootstrap_admin_from_env()
 
 # ===========================
 # 2. User Management
@@ -70,7 +220,7 @@ def init_db():
 def create_user(username, password, is_admin=0):
     if not username or not password or len(password) < 8:
         return False
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     try:
         p_hash = generate_password_hash(password)
@@ -84,20 +234,24 @@ def create_user(username, password, is_admin=0):
         conn.close()
 
 def verify_user(username, password):
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('SELECT id, password_hash, is_admin FROM users WHERE username = ?', (username,))
     row = cursor.fetchone()
-    conn.close()
     
-    if row:
-        user_id, p_hash, is_admin = row
-        if check_password_hash(p_hash, password):
-            return {"id": user_id, "is_admin": is_admin}
-    return None
+    try:
+        if row:
+            user_id, p_hash, is_admin = row
+            if check_password_hash(p_hash, password):
+                cursor.execute('UPDATE users SET last_login = ? WHERE id = ?', (datetime.now(), user_id))
+                conn.commit()
+                return {"id": user_id, "is_admin": is_admin}
+        return None
+    finally:
+        conn.close()
 
 def get_user_by_id(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('SELECT id, username, is_admin FROM users WHERE id = ?', (user_id,))
     row = cursor.fetchone()
@@ -113,7 +267,7 @@ def get_all_users():
     return rows
 
 def delete_user_by_id(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     if user_id == 1:
         return False
@@ -123,7 +277,7 @@ def delete_user_by_id(user_id):
     return True
 
 def update_user_role(user_id, is_admin):
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     if user_id == 1: 
         return False
@@ -135,7 +289,7 @@ def update_user_role(user_id, is_admin):
 def admin_reset_password(user_id, new_password):
     if not new_password or len(new_password) < 8:
         return False
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     p_hash = generate_password_hash(new_password)
     cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (p_hash, user_id))
@@ -147,7 +301,7 @@ def admin_reset_password(user_id, new_password):
 # 3. Material Management
 # ===========================
 def get_all_categories():
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cursor = conn.cursor()
     try:
         cursor.execute('SELECT DISTINCT category FROM materials')
@@ -187,34 +341,94 @@ def get_materials(uploader_type=None, sort_by='newest', user_id=None, include_al
     conn.close()
     return rows
 
+def get_materials_version():
+    """资料表的数据版本：行数 + 最大 id + 最新上传时间，任何增删都会改变它"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT COUNT(*), MAX(id), MAX(upload_time) FROM materials").fetchone()
+    conn.close()
+    return tuple(row)
+
+def _remove_files(*paths):
+    """
+    删除资料文件 / 封面。已经不存在的跳过；删不掉的 (被占用、权限等) 记日志，
+    数据库里已没有引用，后台清理任务 (storage_sweeper) 下次会再删一次。
+    """
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove {path}, leaving it for the storage sweeper: {e}")
+
 def delete_material_by_id(material_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM materials WHERE id = ?", (material_id,))
+    cursor.execute("SELECT file_path, cover_path FROM materials WHERE id = ?", (material_id,))
     row = cursor.fetchone()
     if row:
-        if row['file_path'] and os.path.exists(row['file_path']):
-            try: os.remove(row['file_path']) 
-            except: pass
-        if row['cover_path'] and os.path.exists(row['cover_path']):
-            try: os.remove(row['cover_path']) 
-            except: pass
+        # 先删记录再删文件：占用空间立即从该用户的用量里扣掉，文件删除失败也不会留下指向空文件的资料
         cursor.execute("DELETE FROM materials WHERE id = ?", (material_id,))
         conn.commit()
         conn.close()
+        _remove_files(row['file_path'], row['cover_path'])
         return True
     conn.close()
     return False
 
-def add_file_to_db(filename, category, file_path, cover_path=None, uploader='System', user_id=None):
-    conn = sqlite3.connect(DB_PATH)
+class StorageQuotaError(Exception):
+    """上传后会超出该用户的空间上限，消息直接显示给用户"""
+
+def user_storage_bytes(user_id):
+    """该用户资料占用的字节数：materials.size_bytes 在上传时写入，删除时随记录一起去掉"""
+    conn = _connect()
+    row = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM materials WHERE user_id = ?", (user_id,)).fetchone()
+    conn.close()
+    return row[0]
+
+def _quota_message(used, incoming, quota):
+    mb = 1024 * 1024
+    return (f"Storage quota exceeded: {used / mb:.1f} MB of {quota / mb:.0f} MB used, "
+            f"this upload needs {incoming / mb:.1f} MB more.")
+
+def _stream_size(file):
+    """上传文件的大小：移到流末尾读位置，不读内容"""
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def material_size(file_path, cover_path=None):
+    """资料占用的磁盘字节数 (文件 + 封面)，文件不存在时按 0 计"""
+    total = 0
+    for path in (file_path, cover_path):
+        if path:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    return total
+
+def add_file_to_db(filename, category, file_path, cover_path=None, uploader='System', user_id=None, quota=None):
+    """
+    登记一份资料，返回是否写入。给了 quota 时，"已用 + 本次" 超出上限就不写入：
+    检查和插入是同一条 SQL，同一用户并发上传也不会一起越过上限。
+    """
+    size = material_size(file_path, cover_path)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO materials (filename, category, file_path, cover_path, upload_time, uploader, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (filename, category, file_path, cover_path, datetime.now(), uploader, user_id))
+        INSERT INTO materials (filename, category, file_path, cover_path, upload_time, uploader, user_id, size_bytes)
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?
+        WHERE ? IS NULL OR (SELECT COALESCE(SUM(size_bytes), 0) FROM materials WHERE user_id = ?) + ? <= ?
+    ''', (filename, category, file_path, cover_path, datetime.now(), uploader, user_id, size,
+          quota, user_id, size, quota))
     conn.commit()
     conn.close()
+    return cursor.rowcount == 1
 
 def save_user_upload_with_db(file, cover_file, category_input, base_path, uploader='User', user_id=None):
     ALLOWED_EXTENSIONS = {'pdf', 'docx', 'xlsx', 'pptx', 'txt'}
@@ -222,6 +436,13 @@ def save_user_upload_with_db(file, cover_file, category_input, base_path, upload
     if not file or '.' not in file.filename: return False
     ext = file.filename.rsplit('.', 1)[1].lower()
     if ext not in ALLOWED_EXTENSIONS: return False
+    quota = USER_QUOTA_BYTES if user_id is not None and USER_QUOTA_BYTES > 0 else None
+    if quota:
+        # 先按上传流的大小预检，明显超额时不必写盘
+        incoming = _stream_size(file) + (_stream_size(cover_file) if cover_file and cover_file.filename else 0)
+        used = user_storage_bytes(user_id)
+        if used + incoming > quota:
+            raise StorageQuotaError(_quota_message(used, incoming, quota))
     target_dir = os.path.join(base_path, "User_Uploads")
     if not os.path.exists(target_dir): os.makedirs(target_dir)
     original_name = secure_filename(file.filename)
@@ -247,5 +468,157 @@ def save_user_upload_with_db(file, cover_file, category_input, base_path, upload
                 cover_counter += 1
             cover_file.save(cover_full_path)
             final_cover_path = cover_full_path
-    add_file_to_db(filename, category_input, full_path, final_cover_path, uploader=uploader, user_id=user_id)
+    if not add_file_to_db(filename, category_input, full_path, final_cover_path, uploader=uploader, user_id=user_id, quota=quota):
+        # 预检之后同一用户的其他上传先占了空间
+        incoming = material_size(full_path, final_cover_path)
+        _remove_files(full_path, final_cover_path)
+        raise StorageQuotaError(_quota_message(user_storage_bytes(user_id), incoming, quota))
     return True
+
+# ===========================
+# 4. Admin Queries
+# ===========================
+# 管理后台的列表都在 SQL 里完成过滤、排序、分页和聚合，只把当前一页传给前端。
+# 排序字段只能取下面白名单里的列，避免把请求参数拼进 SQL。
+USER_SORTS = {
+    'id': 'u.id',
+    'username': 'u.username COLLATE NOCASE',
+    'role': 'u.is_admin',
+    'uploads': 'uploads',
+    'storage': 'storage_bytes',
+    'last_login': 'u.last_login',
+}
+MATERIAL_SORTS = {
+    'id': 'm.id',
+    'filename': 'm.filename COLLATE NOCASE',
+    'category': 'm.category COLLATE NOCASE',
+    'uploader': 'm.uploader',
+    'size': 'm.size_bytes',
+    'upload_time': 'm.upload_time',
+}
+
+def _like(text):
+    """用户输入的关键字 -> LIKE 模式 (转义 % 和 _)"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _page_window(page, per_page):
+    per_page = min(max(int(per_page or 20), 1), MAX_PAGE_SIZE)
+    page = max(int(page or 1), 1)
+    return page, per_page, (page - 1) * per_page
+
+def _order_clause(sorts, sort, order, default, tiebreak):
+    column = sorts.get(sort, sorts[default])
+    direction = 'ASC' if str(order).lower() == 'asc' else 'DESC'
+    # 排序值相同的行再按 id 排，翻页时顺序稳定
+    return f" ORDER BY {column} {direction}, {tiebreak} {direction}"
+
+def query_users(page=1, per_page=20, q=None, role=None, sort='id', order='desc'):
+    """
+    分页的用户列表，每行带上传数与占用空间。
+    返回 {"items", "total", "page", "per_page"}。
+    role: 'admin' / 'user' / None
+    """
+    page, per_page, offset = _page_window(page, per_page)
+    clauses, params = [], []
+    if q:
+        clauses.append("u.username LIKE ? ESCAPE '\\'")
+        params.append(_like(q))
+    if role in ('admin', 'user'):
+        clauses.append("u.is_admin = ?" if role == 'admin' else "COALESCE(u.is_admin, 0) = ?")
+        params.append(1 if role == 'admin' else 0)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+    conn = get_db_connection()
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM users u{where}", params).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT u.id, u.username, u.is_admin, u.last_login,
+                   COALESCE(m.uploads, 0) AS uploads, COALESCE(m.storage_bytes, 0) AS storage_bytes
+            FROM users u
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS uploads, SUM(size_bytes) AS storage_bytes
+                FROM materials WHERE user_id IS NOT NULL GROUP BY user_id
+            ) m ON m.user_id = u.id
+            {where}{_order_clause(USER_SORTS, sort, order, 'id', 'u.id')}
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, offset]).fetchall()
+    finally:
+        conn.close()
+    return {"items": [dict(row) for row in rows], "total": total, "page": page, "per_page": per_page}
+
+def query_materials(page=1, per_page=20, q=None, category=None, uploader=None, user_id=None, sort='upload_time', order='desc'):
+    """分页的资料列表，带上传者用户名。返回格式同 query_users。"""
+    page, per_page, offset = _page_window(page, per_page)
+    clauses, params = [], []
+    if q:
+        clauses.append("m.filename LIKE ? ESCAPE '\\'")
+        params.append(_like(q))
+    if category:
+        clauses.append("m.category = ?")
+        params.append(category)
+    if uploader in ('System', 'User'):
+        clauses.append("m.uploader = ?")
+        params.append(uploader)
+    if user_id is not None:
+        clauses.append("m.user_id = ?")
+        params.append(user_id)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+    conn = get_db_connection()
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM materials m{where}", params).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT m.id, m.filename, m.category, m.uploader, m.user_id, u.username,
+                   m.upload_time, COALESCE(m.size_bytes, 0) AS size_bytes
+            FROM materials m
+            LEFT JOIN users u ON u.id = m.user_id
+            {where}{_order_clause(MATERIAL_SORTS, sort, order, 'upload_time', 'm.id')}
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, offset]).fetchall()
+    finally:
+        conn.close()
+    return {"items": [dict(row) for row in rows], "total": total, "page": page, "per_page": per_page}
+
+def admin_stats(active_days=30, top=5):
+    """
+    管理后台的汇总数字，全部由 SQL 聚合得出：
+    用户数 / 管理员数 / 活跃用户数 (active_days 天内登录过或上传过)、资料总数与总占用、
+    各分类的上传数与占用、占用空间最多的用户，以及每人的空间上限和最近一次磁盘清理的结果。
+    """
+    since = datetime.now() - timedelta(days=active_days)
+    conn = get_db_connection()
+    try:
+        users = conn.execute('''
+            SELECT COUNT(*) AS total, COALESCE(SUM(is_admin), 0) AS admins,
+                   COALESCE(SUM(last_login >= ? OR EXISTS (
+                       SELECT 1 FROM materials m WHERE m.user_id = users.id AND m.upload_time >= ?)), 0) AS active
+            FROM users
+        ''', (since, since)).fetchone()
+        materials = conn.execute('''
+            SELECT COUNT(*) AS total, COALESCE(SUM(size_bytes), 0) AS storage_bytes,
+                   COALESCE(SUM(uploader = 'User'), 0) AS user_uploads,
+                   COALESCE(SUM(upload_time >= ?), 0) AS recent_uploads
+            FROM materials
+        ''', (since,)).fetchone()
+        categories = conn.execute('''
+            SELECT category, COUNT(*) AS uploads, COALESCE(SUM(size_bytes), 0) AS storage_bytes
+            FROM materials GROUP BY category ORDER BY uploads DESC, category
+        ''').fetchall()
+        top_users = conn.execute('''
+            SELECT u.id, u.username, COUNT(*) AS uploads, COALESCE(SUM(m.size_bytes), 0) AS storage_bytes
+            FROM materials m JOIN users u ON u.id = m.user_id
+            GROUP BY u.id ORDER BY storage_bytes DESC, uploads DESC LIMIT ?
+        ''', (top,)).fetchall()
+        sweep = conn.execute("SELECT started_at, finished_at, report FROM maintenance_runs WHERE name = 'storage_sweep'").fetchone()
+    finally:
+        conn.close()
+    return {
+        "active_days": active_days,
+        "users": dict(users),
+        "materials": dict(materials),
+        "categories": [dict(row) for row in categories],
+        "top_users": [dict(row) for row in top_users],
+        "quota_bytes": USER_QUOTA_BYTES,
+        "last_sweep": dict(sweep, report=json.loads(sweep["report"])) if sweep and sweep["report"] else None,
+    }
@@ -0,0 +1,234 @@
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+
+
+# 大文件 / 音频的发送：支持单段和多段 Range (multipart/byteranges)、If-Range 断点续传、
+# ETag / Last-Modified 条件请求，以及文本资源预先压缩好的 .gz 版本。
+# 文件按块流式读出，不整个读进内存。
+CHUNK_SIZE = 64 * 1024
+# 一次请求最多接受的区间数，超过时按整个文件返回 (RFC 7233 允许服务端忽略 Range)
+MAX_RANGES = 16
+PRECOMPRESS_EXTENSIONS = {'.txt', '.csv', '.html', '.json', '.xml', '.svg'}
+PRECOMPRESS_MIN_BYTES = 8 * 1024
+
+_RANGE_RE = re.compile(r'(\d*)\s*-\s*(\d*)')
+
+
+def file_etag(stat, suffix=''):
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"
+
+
+def _iter_file(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _coalesce(ranges):
+    """排序并合并重叠 / 相邻的区间：[(start, stop)]，stop 不含"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def parse_byte_ranges(header, size):
+    """
+    "bytes=0-99,200-,-50" -> [(start, stop)] (stop 不含，已截到文件长度内，丢掉无法满足的区间)。
+    写法不合法时返回 None (按没有 Range 处理)。
+    werkzeug 的 parse_range_header 会拒绝乱序或重叠的多段区间，这里自己解析后再合并。
+    """
+    units, _, spec = (header or '').partition('=')
+    if units.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    resolved = []
+    for part in spec.split(','):
+        match = _RANGE_RE.fullmatch(part.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first:
+            if not last:
+                return None
+            start, stop = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            stop = size if not last else min(int(last) + 1, size)
+            if last and int(last) < start:
+                return None
+        if start < stop:
+            resolved.append((start, stop))
+    return resolved
+
+
+def _gzip_variant(path, stat):
+    """客户端接受 gzip 且有不旧于原文件的 .gz 时，返回 (路径, stat)"""
+    accepted = {part.split(';')[0].strip().lower() for part in request.headers.get('Accept-Encoding', '').split(',')}
+    if 'gzip' not in accepted:
+        return None
+    gz_path = path + '.gz'
+    try:
+        gz_stat = os.stat(gz_path)
+    except OSError:
+        return None
+    return (gz_path, gz_stat) if gz_stat.st_mtime_ns >= stat.st_mtime_ns else None
+
+
+def _not_modified(etag, last_modified):
+    if_none_match = request.if_none_match
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if_modified_since = request.if_modified_since
+    return bool(if_modified_since and last_modified <= if_modified_since)
+
+
+def _if_range_matches(etag, last_modified):
+    """If-Range 与当前版本一致时才按区间返回，否则整个文件重新下载"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        tag, weak = unquote_etag(if_range)
+        return not weak and tag == etag
+    date = parse_date(if_range)
+    return date is not None and last_modified <= date
+
+
+def content_disposition(disposition, filename):
+    """
+    总是同时给出 filename*=UTF-8'' (RFC 5987，原名) 和一个纯 ASCII 的 filename 兜底：
+    兜底名里非 ASCII 字符、引号、反斜杠和控制字符都换成 _，不会提前结束引号或拆开响应头。
+    """
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', '_', filename)
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def send_media(path, mimetype=None, download_name=None, as_attachment=False, max_age=3600, private=True):
+    """
+    发送文件，支持 Range / 多段 Range / 条件请求 / 预压缩 .gz。
+    文件不存在时抛出 FileNotFoundError，由调用方决定怎么报错。
+    """
+    stat = os.stat(path)
+    mimetype = mimetype or mimetypes.guess_type(download_name or path)[0] or 'application/octet-stream'
+    if mimetype.startswith('text/') and 'charset' not in mimetype:
+        mimetype += '; charset=utf-8'
+
+    body_path, body_stat, encoding = path, stat, None
+    # 压缩版本不支持按原文件偏移取区间，带 Range 的请求始终发原文件
+    if 'Range' not in request.headers and os.path.splitext(path)[1].lower() in PRECOMPRESS_EXTENSIONS:
+        variant = _gzip_variant(path, stat)
+        if variant:
+            body_path, body_stat = variant
+            encoding = 'gzip'
+
+    etag = file_etag(stat, '-gz' if encoding else '')
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f"{'private' if private else 'public'}, max-age={max_age}",
+    }
+    if os.path.splitext(path)[1].lower() in PRECOMPRESS_EXTENSIONS:
+        headers['Vary'] = 'Accept-Encoding'
+    if download_name:
+        headers['Content-Disposition'] = content_disposition('attachment' if as_attachment else 'inline', download_name)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    size = body_stat.st_size
+    ranges = None
+    if encoding is None and 'Range' in request.headers and _if_range_matches(etag, last_modified):
+        resolved = parse_byte_ranges(request.headers.get('Range'), size)
+        if resolved is not None:
+            if not resolved:
+                return Response(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+            ranges = _coalesce(resolved)
+            if len(ranges) > MAX_RANGES:
+                ranges = None
+
+    if not ranges or ranges == [(0, size)]:
+        response = Response(_iter_file(body_path, 0, size), status=200, mimetype=mimetype, headers=headers, direct_passthrough=True)
+        response.content_length = size
+        return response
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response = Response(_iter_file(body_path, start, stop - start), status=206, mimetype=mimetype, headers=headers, direct_passthrough=True)
+        response.content_length = stop - start
+        return response
+
+    # 多段：multipart/byteranges，每段带自己的 Content-Type / Content-Range 头
+    boundary = uuid.uuid4().hex
+    parts = [(f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n".encode('ascii'), start, stop)
+             for start, stop in ranges]
+    closing = f"\r\n--{boundary}--\r\n".encode('ascii')
+
+    def generate():
+        for head, start, stop in parts:
+            yield head
+            yield from _iter_file(body_path, start, stop - start)
+        yield closing
+
+    response = Response(generate(), status=206, mimetype=f'multipart/byteranges; boundary={boundary}', headers=headers, direct_passthrough=True)
+    response.content_length = sum(len(head) + stop - start for head, start, stop in parts) + len(closing)
+    return response
+
+
+# ===========================
+# Precompressed Variants
+# ===========================
+def precompress_file(path, min_bytes=PRECOMPRESS_MIN_BYTES):
+    """给文本文件生成 path.gz (已是最新时跳过)，返回是否新写了文件"""
+    if os.path.splitext(path)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+        return False
+    stat = os.stat(path)
+    if stat.st_size < min_bytes:
+        return False
+    gz_path = path + '.gz'
+    if os.path.exists(gz_path) and os.stat(gz_path).st_mtime_ns >= stat.st_mtime_ns:
+        return False
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.gz')
+    try:
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(tmp_path, gz_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def precompress_tree(root, min_bytes=PRECOMPRESS_MIN_BYTES):
+    """遍历目录为所有较大的文本文件生成 .gz，返回新生成的个数"""
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.startswith('.') and precompress_file(os.path.join(dirpath, name), min_bytes):
+                written += 1
+    return written
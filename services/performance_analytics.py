@@ -0,0 +1,167 @@
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+from services.http_cache import file_version
+
+
+ROSTER_EXAM = '__ROSTER__'
+EXCLUDE_COLS = ['Name', 'Exam', 'Total']
+
+# 预警阈值
+AT_RISK_PERCENTILE = 20.0
+AT_RISK_Z_DROP = -1.0
+AT_RISK_DECLINE_RUN = 2
+
+ANALYTICS_CACHE_SIZE = 32
+_analytics_cache = OrderedDict()
+_analytics_lock = threading.Lock()
+
+
+def _clean(matrix, digits=2):
+    """numpy 矩阵转 JSON 友好的嵌套 list，NaN 记为 None"""
+    import numpy as np
+    rounded = np.round(matrix.astype(float), digits)
+    return [[None if np.isnan(v) else float(v) for v in row] for row in rounded]
+
+
+def total_matrix(history_df):
+    """学生 × 考试 的总分矩阵 (缺考为 NaN)，考试按上传顺序、学生按名单顺序"""
+    import numpy as np
+    import pandas as pd
+    students = history_df['Name'].dropna().astype(str).unique().tolist()
+    df = history_df[history_df['Exam'] != ROSTER_EXAM].dropna(subset=['Name', 'Exam'])
+    exams = df['Exam'].astype(str).unique().tolist()
+    subjects = [c for c in history_df.columns if c not in EXCLUDE_COLS]
+    if df.empty:
+        return students, exams, np.full((len(students), 0), np.nan)
+
+    scores = df[subjects].apply(pd.to_numeric, errors='coerce').fillna(0)
+    frame = pd.DataFrame({
+        'Name': df['Name'].astype(str).values,
+        'Exam': df['Exam'].astype(str).values,
+        'Total': scores.sum(axis=1).values,
+    }).drop_duplicates(['Name', 'Exam'], keep='first')
+    matrix = frame.pivot(index='Name', columns='Exam', values='Total').reindex(index=students, columns=exams)
+    return students, exams, matrix.to_numpy(dtype=float)
+
+
+def _value_added(totals):
+    """
+    每场考试 (第二场起) 以上一场总分为自变量对全班做最小二乘拟合，
+    残差 = 实际 - 预测，即相对班级整体趋势的增值；两场都有成绩的学生才计算。
+    """
+    import numpy as np
+    n, e = totals.shape
+    va = np.full((n, e), np.nan)
+    for j in range(1, e):
+        prev, cur = totals[:, j - 1], totals[:, j]
+        mask = ~np.isnan(prev) & ~np.isnan(cur)
+        if mask.sum() < 3 or np.ptp(prev[mask]) == 0:
+            continue
+        slope, intercept = np.polyfit(prev[mask], cur[mask], 1)
+        va[mask, j] = cur[mask] - (slope * prev[mask] + intercept)
+    return va
+
+
+def compute_class_analytics(history_df):
+    """
+    一次向量化计算班级所有考试的：密集排名、百分位、z 分数、与上一场的差值、
+    相对班级趋势的增值 (value-added) 以及预警标记。
+    """
+    import numpy as np
+    import pandas as pd
+    if history_df is None or history_df.empty or 'Exam' not in history_df.columns:
+        return {"exams": [], "class_stats": {}, "students": [], "at_risk": []}
+
+    students, exams, totals = total_matrix(history_df)
+    n, e = totals.shape
+    frame = pd.DataFrame(totals, index=students, columns=exams)
+
+    dense_rank = frame.rank(method='dense', ascending=False).to_numpy()
+    percentile = (frame.rank(method='max', pct=True) * 100).to_numpy()
+    counts = frame.count().to_numpy()
+    means = frame.mean().to_numpy()
+    stds = frame.std(ddof=0).to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(stds > 0, (totals - means) / stds, 0.0)
+    z[np.isnan(totals)] = np.nan
+
+    delta = np.full((n, e), np.nan)
+    z_delta = np.full((n, e), np.nan)
+    if e > 1:
+        delta[:, 1:] = np.diff(totals, axis=1)
+        z_delta[:, 1:] = np.diff(z, axis=1)
+    value_added = _value_added(totals)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 没有增值记录的学生 nanmean 为空切片
+        growth = np.nanmean(value_added, axis=1) if e > 1 else np.full(n, np.nan)
+
+    # 预警：最近一场排名靠后 / z 分数骤降 / 连续下滑 / 最近一场缺考
+    flags = [[] for _ in range(n)]
+    if e:
+        last_pct = percentile[:, -1]
+        for i in np.flatnonzero(np.isnan(totals[:, -1])):
+            flags[i].append("missing_latest")
+        for i in np.flatnonzero(last_pct <= AT_RISK_PERCENTILE):
+            flags[i].append("low_percentile")
+        for i in np.flatnonzero(z_delta[:, -1] <= AT_RISK_Z_DROP):
+            flags[i].append("sharp_drop")
+        if e > AT_RISK_DECLINE_RUN:
+            declining = (delta[:, -AT_RISK_DECLINE_RUN:] < 0).all(axis=1)
+            for i in np.flatnonzero(declining):
+                flags[i].append("declining")
+
+    totals_l, rank_l, pct_l = _clean(totals), _clean(dense_rank, 0), _clean(percentile, 1)
+    z_l, delta_l, va_l = _clean(z, 3), _clean(delta), _clean(value_added)
+    rows = []
+    for i, name in enumerate(students):
+        rows.append({
+            "name": name,
+            "totals": totals_l[i],
+            "dense_rank": [None if r is None else int(r) for r in rank_l[i]],
+            "percentile": pct_l[i],
+            "z_score": z_l[i],
+            "delta": delta_l[i],
+            "value_added": va_l[i],
+            "growth": None if np.isnan(growth[i]) else round(float(growth[i]), 2),
+            "flags": flags[i],
+        })
+
+    class_stats = {
+        exam: {
+            "count": int(counts[j]),
+            "mean": None if np.isnan(means[j]) else round(float(means[j]), 2),
+            "std": None if np.isnan(stds[j]) else round(float(stds[j]), 2),
+        } for j, exam in enumerate(exams)
+    }
+    return {
+        "exams": exams,
+        "class_stats": class_stats,
+        "students": rows,
+        "at_risk": [r["name"] for r in rows if r["flags"]],
+    }
+
+
+def get_class_analytics(path):
+    """
+    按数据版本 (http_cache.file_version：mtime + 大小) 缓存的班级分析结果，
+    任何写入 (包括外部修改) 都会让缓存失效；文件不存在时返回 None
+    """
+    import pandas as pd
+    version = file_version(path)
+    if version is None:
+        return None
+    cache_key = (os.path.abspath(path), version)
+    with _analytics_lock:
+        if cache_key in _analytics_cache:
+            _analytics_cache.move_to_end(cache_key)
+            return _analytics_cache[cache_key]
+
+    analytics = compute_class_analytics(pd.read_csv(path))
+    with _analytics_lock:
+        _analytics_cache[cache_key] = analytics
+        while len(_analytics_cache) > ANALYTICS_CACHE_SIZE:
+            _analytics_cache.popitem(last=False)
+    return analytics
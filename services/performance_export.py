@@ -0,0 +1,44 @@
+ROSTER_EXAM = '__ROSTER__'
+EXCLUDE_COLS = ['Name', 'Exam', 'Total']
+EXPORT_CHUNK_ROWS = 5000
+META_COLUMNS = ['Grade', 'Class', 'Class ID', 'Exam', 'Name']
+
+
+def _subject_columns(class_files):
+    """只读各文件表头，得到所有班级科目列的并集 (保持首次出现顺序)"""
+    import pandas as pd
+    subjects = []
+    for _, _, path in class_files:
+        try:
+            columns = pd.read_csv(path, nrows=0).columns
+        except Exception:
+            continue
+        subjects.extend(c for c in columns if c not in EXCLUDE_COLS and c not in subjects)
+    return subjects
+
+
+def iter_history_rows(class_files):
+    """
+    逐班级、按块 (chunksize) 读取 CSV 并产出导出行，内存只与块大小有关。
+    class_files: [(class_id, parse_class_id 的 meta, 路径)]；第一行是表头。
+    """
+    import pandas as pd
+    subjects = _subject_columns(class_files)
+    yield META_COLUMNS + subjects + ['Total']
+    for class_id, meta, path in class_files:
+        try:
+            reader = pd.read_csv(path, chunksize=EXPORT_CHUNK_ROWS)
+        except Exception:
+            continue
+        with reader:
+            for chunk in reader:
+                if 'Exam' not in chunk.columns:
+                    break
+                chunk = chunk[chunk['Exam'] != ROSTER_EXAM]
+                if chunk.empty:
+                    continue
+                scores = chunk.reindex(columns=subjects).apply(pd.to_numeric, errors='coerce')
+                totals = scores.sum(axis=1).round(2)
+                scores = scores.astype(object).where(scores.notna(), '')
+                for exam, name, row, total in zip(chunk['Exam'], chunk['Name'], scores.itertuples(index=False, name=None), totals):
+                    yield [meta['grade'], meta['class_name'], class_id, exam, name, *row, total]
@@ -0,0 +1,86 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPACT_FORMAT = 'columnar-v1'
+COMPRESS_MIN_BYTES = 1024
+# 只压缩数据接口：HTML 页面里有 CSRF 令牌，和可被用户影响的内容一起压缩会给 BREACH 类攻击留口子
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv'}
+
+
+def compact_performance_response(resp):
+    """
+    把 generate_unified_performance_response 的嵌套结构压成列式格式：
+    学生、科目、考试名只发一次，分数是按 [考试][学生][科目] 展平的数值数组，
+    图表配置 (bar/radar series) 由前端还原。
+    """
+    if not resp.get('success'):
+        return resp
+    students = resp['students']
+    subjects = resp['valid_subjects']
+    exams = [series['name'] for series in resp['bar_series']]
+    details = resp['student_details']
+
+    totals = []
+    scores = []
+    for exam_index, exam in enumerate(exams):
+        totals.extend(resp['bar_series'][exam_index]['data'])
+        for stu in students:
+            row = details[stu].get(exam, {})
+            scores.extend(row.get(sub, 0) for sub in subjects)
+
+    return {
+        'success': True,
+        'format': COMPACT_FORMAT,
+        'exam_names': resp['exam_names'],
+        'exams': exams,
+        'students': students,
+        'subjects': subjects,
+        'max_scores': [resp['max_scores'][sub] for sub in subjects],
+        'averages': [resp['class_averages'][exam] for exam in exams],
+        'totals': totals,
+        'scores': scores,
+    }
+
+
+def _accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def compress_response(response, accept_encoding):
+    """
+    按 Accept-Encoding 对较大的 JSON / CSV 响应做 brotli (已安装时) 或 gzip 压缩。
+    流式响应、已编码响应和小响应原样返回。
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        encoded, encoding = brotli.compress(body, quality=5), 'br'
+    elif 'gzip' in accepted:
+        encoded, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+    else:
+        return response
+
+    response.set_data(encoded)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(encoded))
+    response.vary.add('Accept-Encoding')
+    return response
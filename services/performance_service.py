@@ -1,61 +1,154 @@
-from flask import Flask, render_template, request, jsonify
-import pandas as pd
 import os
 
-app = Flask(__name__)
-HISTORY_FILE = 'history.csv'
+from services.http_cache import file_version
+from services.student_index import refresh_student_index
 
-# ======= 核心引擎：组装多场考试的对比数据 =======
-def generate_unified_response(history_df, selected_exams):
-    # 取出被选中的考试数据
-    df_selected = history_df[history_df['Exam'].isin(selected_exams)]
-    
-    # 获取有效的科目（排除掉全班都是0分的无效列）
-    exclude_cols = ['Name', 'Exam', 'Total']
-    all_subjects = [c for c in history_df.columns if c not in exclude_cols]
-    valid_subjects = [sub for sub in all_subjects if sub in df_selected.columns and (df_selected[sub] != 0).any()]
 
-    students = df_selected['Name'].unique().tolist()
-    max_scores = {sub: float(history_df[sub].max()) for sub in valid_subjects}
+# 成绩分析模块共用的引擎：班级 ID / 文件路径规则、考试趋势、多场考试对比数据。
+# 主应用的 performance 蓝图、批改结果导入都调用这里，不再各自维护一份。
+ROSTER_EXAM = '__ROSTER__'
+EXCLUDE_COLS = ['Name', 'Exam', 'Total']
+CLASS_ID_SEPARATOR = "__"
+
+
+def sanitize_class_component(value):
+    cleaned = "".join([c for c in str(value).strip() if c.isalpha() or c.isdigit() or c in {' ', '_', '-'}]).strip()
+    return cleaned or "Unnamed"
+
+
+def build_class_id(grade, class_name):
+    safe_grade = sanitize_class_component(grade)
+    safe_class = sanitize_class_component(class_name)
+    if not grade:
+        return safe_class
+    return f"{safe_grade}{CLASS_ID_SEPARATOR}{safe_class}"
+
+
+def parse_class_id(class_id):
+    class_id = str(class_id).strip()
+    if CLASS_ID_SEPARATOR in class_id:
+        grade, class_name = class_id.split(CLASS_ID_SEPARATOR, 1)
+        return {
+            "id": class_id,
+            "grade": grade.strip(),
+            "class_name": class_name.strip(),
+            "display_name": f"{grade.strip()} / {class_name.strip()}"
+        }
+    return {
+        "id": class_id,
+        "grade": "Ungrouped",
+        "class_name": class_id,
+        "display_name": class_id
+    }
+
+
+def user_data_dir(performance_dir, user_id):
+    return os.path.join(performance_dir, f"user_{user_id}")
+
+
+def get_class_file_path(performance_dir, user_id, class_name):
+    """根据 User ID 隔离不同账号的班级数据"""
+    user_dir = user_data_dir(performance_dir, user_id)
+    if not os.path.exists(user_dir):
+        os.makedirs(user_dir)
+    safe_name = sanitize_class_component(class_name)
+    return os.path.join(user_dir, f"{safe_name}.csv")
+
+
+def class_id_from_path(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def reindex_class(user_id, path, history):
+    """
+    写入班级 CSV 后同步更新学生时间序列索引。须在班级锁内调用 (作为 performance_store 写入函数的 on_commit)，
+    记录的文件版本才和 history 对得上。
+    """
+    refresh_student_index(user_id, class_id_from_path(path), history, file_version(path))
+
+
+def class_reindexer(user_id, path):
+    """performance_store 写入函数的 on_commit 回调"""
+    return lambda history: reindex_class(user_id, path, history)
+
+
+def load_exam_trend(path):
+    import pandas as pd
+    try:
+        df = pd.read_csv(path)
+        if df.empty or 'Exam' not in df.columns: return {'success': True, 'exams': []}
+
+        # 过滤掉名单占位符
+        exams = [e for e in df['Exam'].dropna().unique().tolist() if e != ROSTER_EXAM]
+        if not exams: return {'success': True, 'exams': []}
+
+        all_subjects = [c for c in df.columns if c not in EXCLUDE_COLS]
+        trend_data = {'exams': exams, 'averages': {}}
+
+        for sub in all_subjects:
+            if pd.to_numeric(df[sub], errors='coerce').notna().any():
+                # 计算平均分时排除掉 __ROSTER__
+                avgs = df[df['Exam'] != ROSTER_EXAM].groupby('Exam', sort=False)[sub].apply(lambda x: pd.to_numeric(x, errors='coerce').mean()).round(2)
+                trend_data['averages'][sub] = [avgs.get(e, 0) for e in exams]
+
+        return {'success': True, 'exams': exams, 'trend_data': trend_data}
+    except Exception as e: return {'success': True, 'exams': [], 'error': str(e)}
+
+
+def generate_unified_performance_response(history_df, selected_exams):
+    """Core Engine: 生成可视化对比数据"""
+    import numpy as np
+    import pandas as pd
+    if history_df.empty: return {'error': 'No data'}
+
+    # 🔥 获取该班级所有登记过的学生（包括初始名单的，防止缺考没名字）
+    students = history_df['Name'].dropna().unique().tolist()
+
+    # 过滤选中的考试，并且排除掉初始化的占位符 __ROSTER__
+    df_selected = history_df[history_df['Exam'].isin(selected_exams) & (history_df['Exam'] != ROSTER_EXAM)]
+    if df_selected.empty: return {'error': 'Selected exams not found or empty'}
+
+    all_subjects = [c for c in history_df.columns if c not in EXCLUDE_COLS]
+    valid_subjects = [sub for sub in all_subjects if sub in df_selected.columns and (pd.to_numeric(df_selected[sub], errors='coerce').fillna(0) != 0).any()]
+
+    max_scores = {}
+    for sub in valid_subjects:
+        try: max_scores[sub] = float(pd.to_numeric(history_df[sub], errors='coerce').max())
+        except: max_scores[sub] = 100
 
     bar_series = []
     radar_series = []
     student_details = {stu: {} for stu in students}
     class_averages = {}
 
-    # 按照最后选择的一场考试的总分，给全班学生排个序（降序）
+    def exam_scores(exam):
+        """某场考试 学生 × 科目 的分数表 (按 students 顺序，缺考为 NaN)"""
+        df_exam = df_selected[df_selected['Exam'] == exam].drop_duplicates('Name', keep='first').set_index('Name')
+        return df_exam[valid_subjects].apply(pd.to_numeric, errors='coerce').reindex(students)
+
+    # 按最后一场考试总分降序排序 (稳定排序，同分保持名单顺序)
     if selected_exams:
-        last_exam = selected_exams[-1]
-        df_last = df_selected[df_selected['Exam'] == last_exam]
-        sorting_totals = []
-        for stu in students:
-            row = df_last[df_last['Name'] == stu]
-            sorting_totals.append(sum(float(row.iloc[0][sub]) for sub in valid_subjects) if not row.empty else 0)
-        
-        # 绑定学生和分数并排序
-        sorted_pairs = sorted(zip(students, sorting_totals), key=lambda x: x[1], reverse=True)
-        students = [p[0] for p in sorted_pairs]
-
-    # 遍历每场被选中的考试，生成对比序列
+        last_totals = exam_scores(selected_exams[-1]).fillna(0).sum(axis=1).to_numpy()
+        students = [students[i] for i in np.argsort(-last_totals, kind='stable')]
+
     for exam in selected_exams:
         df_exam = df_selected[df_selected['Exam'] == exam]
         if df_exam.empty: continue
 
-        # 1. 雷达图：该场考试平均分
-        avgs = [round(float(df_exam[sub].mean()), 2) if not df_exam[sub].empty else 0 for sub in valid_subjects]
+        avgs = []
+        for sub in valid_subjects:
+            val = pd.to_numeric(df_exam[sub], errors='coerce').mean()
+            avgs.append(round(float(val), 2) if pd.notna(val) else 0)
+
         class_averages[exam] = avgs
-        radar_series.append({'value': avgs, 'name': f"{exam} 平均分"})
-
-        # 2. 柱状图：每个学生在该场考试的总分
-        totals = []
-        for stu in students:
-            row = df_exam[df_exam['Name'] == stu]
-            if not row.empty:
-                totals.append(round(sum(float(row.iloc[0][sub]) for sub in valid_subjects), 2))
-                student_details[stu][exam] = {sub: float(row.iloc[0][sub]) for sub in valid_subjects}
-            else:
-                totals.append(0)  # 缺考算作0
-                student_details[stu][exam] = {sub: 0 for sub in valid_subjects}
+        radar_series.append({'value': avgs, 'name': f"{exam} Avg"})
+
+        scores = exam_scores(exam)
+        present = scores.notna().any(axis=1).to_numpy()
+        scores = scores.fillna(0)
+        totals = np.where(present, scores.sum(axis=1).round(2).to_numpy(), 0).tolist()
+        for stu, row in zip(students, scores.to_dict('records')):
+            student_details[stu][exam] = row
 
         bar_series.append({
             'name': exam, 'type': 'bar', 'data': totals,
@@ -68,96 +161,3 @@ def generate_unified_response(history_df, selected_exams):
         'bar_series': bar_series, 'radar_series': radar_series,
         'student_details': student_details, 'class_averages': class_averages
     }
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-# 获取历史考试列表与全局趋势
-@app.route('/api/exams', methods=['GET'])
-def get_exams():
-    if os.path.exists(HISTORY_FILE):
-        df = pd.read_csv(HISTORY_FILE)
-        exams = df['Exam'].dropna().unique().tolist()
-        if not exams:
-            return jsonify({'success': True, 'exams': []})
-            
-        # 计算全局趋势
-        exclude_cols = ['Name', 'Exam', 'Total']
-        all_subjects = [c for c in df.columns if c not in exclude_cols]
-        trend_data = {'exams': exams, 'averages': {}}
-        
-        for sub in all_subjects:
-            if (df[sub] != 0).any():
-                trend_data['averages'][sub] = df.groupby('Exam', sort=False)[sub].mean().round(2).tolist()
-                
-        return jsonify({'success': True, 'exams': exams, 'trend_data': trend_data})
-    return jsonify({'success': True, 'exams': []})
-
-# 删除特定的历史考试
-@app.route('/api/delete_exam', methods=['POST'])
-def delete_exam():
-    exam_name = request.json.get('exam_name')
-    if os.path.exists(HISTORY_FILE):
-        df = pd.read_csv(HISTORY_FILE)
-        df = df[df['Exam'] != exam_name]
-        
-        if df.empty:
-            os.remove(HISTORY_FILE)
-        else:
-            df.to_csv(HISTORY_FILE, index=False)
-        return jsonify({'success': True})
-    return jsonify({'error': '未找到历史数据'})
-
-# 接收多个考试名称进行对比
-@app.route('/api/compare_exams', methods=['POST'])
-def compare_exams():
-    exam_names = request.json.get('exam_names', [])
-    if not os.path.exists(HISTORY_FILE): return jsonify({'error': '没有历史数据'})
-    if not exam_names: return jsonify({'error': '未选择任何考试'})
-    
-    history_df = pd.read_csv(HISTORY_FILE)
-    return jsonify(generate_unified_response(history_df, exam_names))
-
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    if 'file' not in request.files: return jsonify({'error': '没有找到文件'})
-    file = request.files['file']
-    filename = file.filename
-    exam_name = request.form.get('exam_name', '未命名考试').strip()
-    
-    if filename == '': return jsonify({'error': '未选择文件'})
-    try:
-        if filename.endswith('.csv'): df = pd.read_csv(file)
-        elif filename.endswith('.xlsx') or filename.endswith('.xls'): df = pd.read_excel(file, engine='openpyxl')
-        else: return jsonify({'error': '不支持的文件格式'})
-        
-        df = df.fillna(0)
-        
-        # 智能重命名第一列为Name
-        df.rename(columns={df.columns[0]: 'Name'}, inplace=True)
-        subjects = [col for col in df.columns if col != 'Name']
-        
-        # 强制将成绩转换为数字，非数字转为0
-        for sub in subjects:
-            df[sub] = pd.to_numeric(df[sub], errors='coerce').fillna(0)
-
-        df_history_entry = df.copy()
-        df_history_entry['Exam'] = exam_name
-        
-        # 保存并覆盖同名旧数据
-        if os.path.exists(HISTORY_FILE):
-            history_df = pd.read_csv(HISTORY_FILE)
-            history_df = history_df[history_df['Exam'] != exam_name]
-            history_df = pd.concat([history_df, df_history_entry], ignore_index=True).fillna(0)
-        else:
-            history_df = df_history_entry
-            
-        history_df.to_csv(HISTORY_FILE, index=False)
-        return jsonify(generate_unified_response(history_df, [exam_name]))
-        
-    except Exception as e:
-        return jsonify({'error': f'处理文件时出错: {str(e)}'})
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,211 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+ROSTER_EXAM = '__ROSTER__'
+
+# 每个班级文件一把锁：同进程内用 threading.Lock，跨进程 (多 worker) 再加一把文件锁。
+# 不同班级之间互不阻塞。
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        lock = _path_locks.get(key)
+        if lock is None:
+            lock = _path_locks[key] = threading.Lock()
+        return lock
+
+
+def _journal_path(path):
+    return path + '.journal'
+
+
+@contextmanager
+def class_file_lock(path):
+    """持有班级文件的独占写锁；进入时先完成上次中断的提交"""
+    with _thread_lock(path):
+        with open(path + '.lock', 'a+b') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                recover_class_file(path)
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _fsync_dir(directory):
+    if fcntl is None:
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def recover_class_file(path):
+    """
+    预写日志恢复 (须在持锁时调用)：日志只在临时文件完整落盘后写入，
+    因此日志存在且临时文件还在 => 重做 os.replace；临时文件已不在 => 替换已完成，清掉日志即可。
+    删除班级的日志同理，重做删除。
+    """
+    journal = _journal_path(path)
+    if not os.path.exists(journal):
+        return
+    try:
+        with open(journal, encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        # 日志本身没写完：提交尚未开始，原文件完好
+        entry = {}
+    op = entry.get('op')
+    tmp_path = entry.get('tmp')
+    if op == 'replace' and tmp_path and os.path.exists(tmp_path):
+        os.replace(tmp_path, path)
+    elif op == 'delete' and os.path.exists(path):
+        os.remove(path)
+    os.remove(journal)
+
+
+def _write_journal(path, entry):
+    journal = _journal_path(path)
+    with open(journal, 'w', encoding='utf-8') as f:
+        json.dump(entry, f)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_dir(os.path.dirname(journal) or '.')
+
+
+def read_class_history(path):
+    import pandas as pd
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def write_class_history(path, history):
+    """
+    原子提交 (须在持锁时调用)：写临时文件并 fsync -> 写日志 -> os.replace -> 删除日志。
+    读者永远看不到写了一半的 CSV；中途崩溃由 recover_class_file 收尾。
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            history.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        _write_journal(path, {'op': 'replace', 'tmp': tmp_path})
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+        os.remove(_journal_path(path))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if os.path.exists(_journal_path(path)):
+            os.remove(_journal_path(path))
+        raise
+
+
+def update_class_history(path, mutate, create=False, on_commit=None):
+    """
+    读取-修改-写入作为一次加锁事务：mutate(history) 返回新的 DataFrame (返回 None 表示不写)。
+    文件不存在且 create=False 时返回 None；成功时返回写入后的历史。
+    on_commit(history) 在写入之后、释放锁之前调用 (同步学生索引)，
+    看到的文件一定就是这次写入的版本，并发写入不会把别人的版本号配上自己的数据。
+    """
+    with class_file_lock(path):
+        history = read_class_history(path)
+        if history is None and not create:
+            return None
+        updated = mutate(history)
+        if updated is None:
+            return history
+        write_class_history(path, updated)
+        if on_commit:
+            on_commit(updated)
+        return updated
+
+
+def create_class_file(path, history, on_commit=None):
+    """新建班级文件；已存在时返回 False，不覆盖"""
+    with class_file_lock(path):
+        if os.path.exists(path):
+            return False
+        write_class_history(path, history)
+        if on_commit:
+            on_commit(history)
+        return True
+
+
+def delete_class_file(path):
+    with class_file_lock(path):
+        if not os.path.exists(path):
+            return False
+        _write_journal(path, {'op': 'delete'})
+        os.remove(path)
+        os.remove(_journal_path(path))
+    # .lock 文件保留：其他进程可能正阻塞在它上面，删掉会让两个写者各锁一个 inode
+    return True
+
+
+def normalize_exam_frame(df, mapping=None):
+    """
+    第一列作为 Name，其余列全部转成数值 (非数字记 0)。
+    mapping 来自列映射档案：{'name': 姓名列, 'subjects': [科目列]}，只保留这些列。
+    """
+    import pandas as pd
+    df = df.fillna(0)
+    if mapping and mapping.get('name'):
+        if mapping.get('subjects'):
+            df = df[[mapping['name']] + [c for c in mapping['subjects'] if c != mapping['name']]]
+        else:
+            df = df[[mapping['name']] + [c for c in df.columns if c != mapping['name']]]
+    df = df.rename(columns={df.columns[0]: 'Name'})
+    for sub in [col for col in df.columns if col != 'Name']:
+        df[sub] = pd.to_numeric(df[sub], errors='coerce').fillna(0)
+    return df
+
+
+def append_exam(path, df_exam, exam_name, on_commit=None):
+    """
+    把一场考试写入班级历史：同名考试先整体移除再追加，
+    读取-合并-写入在班级锁内作为一次提交完成。返回合并后的历史。
+    """
+    import pandas as pd
+    df_exam = df_exam.copy()
+    df_exam['Exam'] = exam_name
+
+    def merge(history):
+        if history is None:
+            return df_exam
+        history = history[history['Exam'] != exam_name]
+        return pd.concat([history, df_exam], ignore_index=True).fillna(0)
+
+    return update_class_history(path, merge, create=True, on_commit=on_commit)
+
+
+def delete_exam(path, exam_name, on_commit=None):
+    """从班级历史中移除一场考试；文件不存在时返回 None"""
+    return update_class_history(path, lambda history: history[history['Exam'] != exam_name], on_commit=on_commit)
@@ -0,0 +1,352 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from services.library_service import get_db_connection
+
+
+DEFAULT_HEADERS = ['Task Name', 'Priority', 'Notes']
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+# 新建看板时请求体的上限 (名称 / 列名 / 排序列的长度、列数、随看板一起提交的任务数)
+MAX_TEXT_LENGTH = 200
+MAX_HEADERS = 50
+MAX_CREATE_TASKS = 5000
+
+
+def _board_to_dict(row, tasks=None):
+    board = {
+        "id": row["id"],
+        "name": row["name"],
+        "headers": json.loads(row["headers"]),
+        "sortBy": row["sort_by"],
+        "sortOrder": row["sort_order"] or 'desc',
+        "version": row["version"],
+    }
+    if tasks is not None:
+        board["tasks"] = tasks
+    return board
+
+
+def _task_to_dict(row):
+    return {
+        "id": row["id"],
+        "data": json.loads(row["data"]),
+        "archived": bool(row["archived"]),
+        "version": row["version"],
+    }
+
+
+def _owned_board(cursor, board_id, user_id):
+    cursor.execute("SELECT * FROM planner_boards WHERE id = ? AND user_id = ?", (board_id, user_id))
+    return cursor.fetchone()
+
+
+def _owned_task(cursor, task_id, user_id):
+    cursor.execute('''
+        SELECT t.* FROM planner_tasks t
+        JOIN planner_boards b ON b.id = t.board_id
+        WHERE t.id = ? AND b.user_id = ?
+    ''', (task_id, user_id))
+    return cursor.fetchone()
+
+
+# ===========================
+# 1. Boards
+# ===========================
+def list_boards(user_id):
+    """一次查询取出该用户的所有看板与任务"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM planner_boards WHERE user_id = ? ORDER BY id", (user_id,))
+    boards = cursor.fetchall()
+    cursor.execute('''
+        SELECT t.* FROM planner_tasks t
+        JOIN planner_boards b ON b.id = t.board_id
+        WHERE b.user_id = ? ORDER BY t.id
+    ''', (user_id,))
+    tasks_by_board = {}
+    for row in cursor.fetchall():
+        tasks_by_board.setdefault(row["board_id"], []).append(_task_to_dict(row))
+    conn.close()
+    return [_board_to_dict(row, tasks_by_board.get(row["id"], [])) for row in boards]
+
+
+def get_board(board_id, user_id, include_tasks=True):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    row = _owned_board(cursor, board_id, user_id)
+    if not row:
+        conn.close()
+        return None
+    tasks = None
+    if include_tasks:
+        cursor.execute("SELECT * FROM planner_tasks WHERE board_id = ? ORDER BY id", (board_id,))
+        tasks = [_task_to_dict(t) for t in cursor.fetchall()]
+    conn.close()
+    return _board_to_dict(row, tasks)
+
+
+def create_board(user_id, name, headers=None, tasks=None, sort_by=None, sort_order='desc'):
+    headers = [str(h) for h in (headers or DEFAULT_HEADERS)]
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now()
+    cursor.execute('''
+        INSERT INTO planner_boards (user_id, name, headers, sort_by, sort_order, version, updated_at)
+        VALUES (?, ?, ?, ?, ?, 1, ?)
+    ''', (user_id, name, json.dumps(headers), sort_by, sort_order, now))
+    board_id = cursor.lastrowid
+    if tasks:
+        cursor.executemany(
+            "INSERT INTO planner_tasks (board_id, data, archived, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+            [(board_id, json.dumps(t.get("data", {})), 1 if t.get("archived") else 0, now) for t in tasks]
+        )
+    conn.commit()
+    conn.close()
+    return get_board(board_id, user_id)
+
+
+def update_board(board_id, user_id, changes, expected_version):
+    """
+    乐观并发：只有版本号一致时才写入。
+    返回 ("ok", board) / ("conflict", 当前 board) / ("missing", None)
+    """
+    fields = {}
+    if "name" in changes and str(changes["name"]).strip():
+        fields["name"] = str(changes["name"]).strip()
+    if "headers" in changes and isinstance(changes["headers"], list):
+        fields["headers"] = json.dumps([str(h) for h in changes["headers"]])
+    if "sortBy" in changes:
+        fields["sort_by"] = changes["sortBy"]
+    if "sortOrder" in changes and changes["sortOrder"] in ('asc', 'desc'):
+        fields["sort_order"] = changes["sortOrder"]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    row = _owned_board(cursor, board_id, user_id)
+    if not row:
+        conn.close()
+        return "missing", None
+    # 没有可写的字段也要核对版本号，不能让过期的客户端以为自己的版本仍是最新
+    if row["version"] != expected_version:
+        conn.close()
+        return "conflict", _board_to_dict(row)
+    if fields:
+        assignments = ", ".join(f"{col} = ?" for col in fields)
+        cursor.execute(
+            f"UPDATE planner_boards SET {assignments}, version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+            (*fields.values(), datetime.now(), board_id, expected_version)
+        )
+        if cursor.rowcount == 0:
+            conn.close()
+            return "conflict", get_board(board_id, user_id, include_tasks=False)
+        conn.commit()
+    conn.close()
+    return "ok", get_board(board_id, user_id, include_tasks=False)
+
+
+def delete_board(board_id, user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _owned_board(cursor, board_id, user_id):
+        conn.close()
+        return False
+    cursor.execute("DELETE FROM planner_tasks WHERE board_id = ?", (board_id,))
+    cursor.execute("DELETE FROM planner_boards WHERE id = ?", (board_id,))
+    conn.commit()
+    conn.close()
+    return True
+
+
+def delete_all_boards(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM planner_tasks WHERE board_id IN (SELECT id FROM planner_boards WHERE user_id = ?)", (user_id,))
+    cursor.execute("DELETE FROM planner_boards WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+
+# ===========================
+# 2. Tasks (incremental saves)
+# ===========================
+def add_task(board_id, user_id, data, archived=False):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _owned_board(cursor, board_id, user_id):
+        conn.close()
+        return None
+    cursor.execute(
+        "INSERT INTO planner_tasks (board_id, data, archived, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+        (board_id, json.dumps(data or {}), 1 if archived else 0, datetime.now())
+    )
+    task_id = cursor.lastrowid
+    conn.commit()
+    cursor.execute("SELECT * FROM planner_tasks WHERE id = ?", (task_id,))
+    task = _task_to_dict(cursor.fetchone())
+    conn.close()
+    return task
+
+
+def update_task(task_id, user_id, changes, expected_version):
+    """
+    只提交改动的字段 (data 按列合并)，并用 version 做乐观锁。
+    返回 ("ok", task) / ("conflict", 当前 task) / ("missing", None)
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    row = _owned_task(cursor, task_id, user_id)
+    if not row:
+        conn.close()
+        return "missing", None
+    if row["version"] != expected_version:
+        conn.close()
+        return "conflict", _task_to_dict(row)
+
+    data = json.loads(row["data"])
+    if isinstance(changes.get("data"), dict):
+        data.update({str(k): v for k, v in changes["data"].items()})
+    archived = row["archived"]
+    if "archived" in changes:
+        archived = 1 if changes["archived"] else 0
+
+    cursor.execute(
+        "UPDATE planner_tasks SET data = ?, archived = ?, version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+        (json.dumps(data), archived, datetime.now(), task_id, expected_version)
+    )
+    if cursor.rowcount == 0:
+        current = _owned_task(cursor, task_id, user_id)
+        conn.close()
+        return "conflict", _task_to_dict(current) if current else None
+    conn.commit()
+    cursor.execute("SELECT * FROM planner_tasks WHERE id = ?", (task_id,))
+    task = _task_to_dict(cursor.fetchone())
+    conn.close()
+    return "ok", task
+
+
+def delete_task(task_id, user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _owned_task(cursor, task_id, user_id):
+        conn.close()
+        return False
+    cursor.execute("DELETE FROM planner_tasks WHERE id = ?", (task_id,))
+    conn.commit()
+    conn.close()
+    return True
+
+
+def delete_tasks(board_id, user_id, task_ids):
+    """task_ids 须是整数列表 (由路由校验)"""
+    ids = list(task_ids)
+    if not ids:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _owned_board(cursor, board_id, user_id):
+        conn.close()
+        return 0
+    placeholders = ", ".join("?" for _ in ids)
+    cursor.execute(f"DELETE FROM planner_tasks WHERE board_id = ? AND id IN ({placeholders})", (board_id, *ids))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+# ===========================
+# 3. Bulk Import / Export (streamed rows)
+# ===========================
+def iter_csv_rows(stream):
+    """逐行读取上传的 CSV，不把整个文件读入内存"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.reader(text):
+            yield row
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(stream):
+    """openpyxl read_only 模式按行迭代第一个工作表"""
+    from openpyxl import load_workbook
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        for row in ws.iter_rows(values_only=True):
+            yield ["" if v is None else str(v) for v in row]
+    finally:
+        wb.close()
+
+
+def import_rows(board_id, user_id, rows, replace=True):
+    """
+    第一行作为表头，其余行分批 executemany 写入，整个导入在一个事务中完成。
+    返回导入后的 board（不含任务），失败返回 None。
+    """
+    rows = iter(rows)
+    headers = None
+    for first in rows:
+        if any(str(c).strip() for c in first):
+            headers = [str(c).strip() for c in first]
+            break
+    if not headers:
+        return None
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _owned_board(cursor, board_id, user_id):
+        conn.close()
+        return None
+    now = datetime.now()
+    try:
+        if replace:
+            cursor.execute("DELETE FROM planner_tasks WHERE board_id = ?", (board_id,))
+        cursor.execute(
+            "UPDATE planner_boards SET headers = ?, version = version + 1, updated_at = ? WHERE id = ?",
+            (json.dumps(headers), now, board_id)
+        )
+        batch = []
+        for values in rows:
+            if not any(str(v).strip() for v in values):
+                continue
+            data = {h: (str(values[i]).strip() if i < len(values) else "") for i, h in enumerate(headers)}
+            batch.append((board_id, json.dumps(data), now))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                cursor.executemany("INSERT INTO planner_tasks (board_id, data, archived, version, updated_at) VALUES (?, ?, 0, 1, ?)", batch)
+                batch = []
+        if batch:
+            cursor.executemany("INSERT INTO planner_tasks (board_id, data, archived, version, updated_at) VALUES (?, ?, 0, 1, ?)", batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+    conn.close()
+    return get_board(board_id, user_id, include_tasks=False)
+
+
+def iter_export_rows(board_id, user_id):
+    """先产出表头，再用 fetchmany 分批产出任务行"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    board = _owned_board(cursor, board_id, user_id)
+    if not board:
+        conn.close()
+        return
+    headers = json.loads(board["headers"])
+    try:
+        yield headers
+        cursor.execute("SELECT data FROM planner_tasks WHERE board_id = ? ORDER BY id", (board_id,))
+        while True:
+            chunk = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not chunk:
+                break
+            for row in chunk:
+                data = json.loads(row["data"])
+                yield [data.get(h, "") for h in headers]
+    finally:
+        conn.close()
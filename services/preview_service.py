@@ -0,0 +1,242 @@
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+try:
+    import fitz  # PyMuPDF，可选：没有时 PDF 不提供预览
+except ImportError:
+    fitz = None
+
+
+# 资料预览：后台线程池把 pdf / docx / pptx / txt 渲染成逐页的小文件 (PDF 为 PNG，其余为 HTML 片段)，
+# 按文件内容哈希存在磁盘缓存里，总大小超过上限时按最近访问时间淘汰。
+# 浏览资料只需按页取几张小图 / 几段 HTML，不必下载整个文件。
+# docx / pptx 直接读 zip 里的 XML，只用标准库；PDF 需要可选依赖 PyMuPDF。
+PREVIEW_WORKERS = int(os.environ.get("BANG_PREVIEW_WORKERS", 2))
+PREVIEW_CACHE_BYTES = int(os.environ.get("BANG_PREVIEW_CACHE_MB", 256)) * 1024 * 1024
+MAX_PREVIEW_PAGES = 50
+TXT_PAGE_LINES = 200
+DOCX_PAGE_CHARS = 4000
+PDF_ZOOM = 1.25
+DIGEST_CACHE_SIZE = 1024
+PDF_PREVIEW_HINT = "PDF preview needs the PyMuPDF package on the server (pip install PyMuPDF)"
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+_executor = None
+_executor_guard = threading.Lock()
+_pending = {}
+_pending_guard = threading.Lock()
+# 路径 -> ((大小, 修改时间), sha1)，LRU，多个请求线程共用
+_digest_cache = OrderedDict()
+_digest_guard = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_guard:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="preview")
+        return _executor
+
+
+def previewable(file_path):
+    ext = os.path.splitext(file_path)[1].lower()
+    return ext in {'.docx', '.pptx', '.txt'} or (ext == '.pdf' and fitz is not None)
+
+
+def unavailable_reason(file_path):
+    """不能预览时给前端的提示：PDF 是缺少 PyMuPDF，其余是类型不支持"""
+    if os.path.splitext(file_path)[1].lower() == '.pdf' and fitz is None:
+        return PDF_PREVIEW_HINT
+    return "Preview is not available for this file type"
+
+
+def file_digest(file_path):
+    """文件内容 sha1，按 (路径, 大小, 修改时间) 记住，同一文件不重复读"""
+    stat = os.stat(file_path)
+    marker = (stat.st_size, stat.st_mtime_ns)
+    with _digest_guard:
+        cached = _digest_cache.get(file_path)
+        if cached and cached[0] == marker:
+            _digest_cache.move_to_end(file_path)
+            return cached[1]
+    # 读文件算哈希不持锁，同一文件偶尔被两个线程各算一遍也无妨
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _digest_guard:
+        _digest_cache[file_path] = (marker, digest)
+        _digest_cache.move_to_end(file_path)
+        if len(_digest_cache) > DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+    return digest
+
+
+# ===========================
+# Renderers: file -> [(后缀, bytes)]
+# ===========================
+def _html_page(paragraphs):
+    return "".join(f"<p>{html.escape(p)}</p>" for p in paragraphs).encode('utf-8')
+
+
+def render_txt(file_path):
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    for encoding in ('utf-8-sig', 'gb18030'):
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = raw.decode('utf-8', errors='replace')
+    lines = text.splitlines()
+    return [('html', f"<pre>{html.escape(chr(10).join(lines[i:i + TXT_PAGE_LINES]))}</pre>".encode('utf-8'))
+            for i in range(0, max(len(lines), 1), TXT_PAGE_LINES)]
+
+
+def render_docx(file_path):
+    """word/document.xml 的段落文本，按字数分页 (docx 本身没有固定分页)"""
+    with zipfile.ZipFile(file_path) as z:
+        root = ElementTree.fromstring(z.read('word/document.xml'))
+    pages, current, size = [], [], 0
+    for para in root.iter(f'{_W}p'):
+        text = ''.join(t.text or '' for t in para.iter(f'{_W}t'))
+        if not text.strip():
+            continue
+        current.append(text)
+        size += len(text)
+        if size >= DOCX_PAGE_CHARS:
+            pages.append(('html', _html_page(current)))
+            current, size = [], 0
+    if current or not pages:
+        pages.append(('html', _html_page(current)))
+    return pages
+
+
+def render_pptx(file_path):
+    """每张幻灯片一页：ppt/slides/slideN.xml 里每个段落的文本"""
+    with zipfile.ZipFile(file_path) as z:
+        slides = sorted((n for n in z.namelist() if re.fullmatch(r'ppt/slides/slide\d+\.xml', n)),
+                        key=lambda n: int(re.search(r'(\d+)\.xml$', n).group(1)))
+        pages = []
+        for name in slides[:MAX_PREVIEW_PAGES]:
+            root = ElementTree.fromstring(z.read(name))
+            paragraphs = [''.join(t.text or '' for t in p.iter(f'{_A}t')) for p in root.iter(f'{_A}p')]
+            pages.append(('html', _html_page(p for p in paragraphs if p.strip())))
+    return pages or [('html', b'')]
+
+
+def render_pdf(file_path):
+    pages = []
+    with fitz.open(file_path) as doc:
+        for page in doc.pages(0, min(doc.page_count, MAX_PREVIEW_PAGES)):
+            pages.append(('png', page.get_pixmap(matrix=fitz.Matrix(PDF_ZOOM, PDF_ZOOM)).tobytes('png')))
+    return pages
+
+
+RENDERERS = {'.txt': render_txt, '.docx': render_docx, '.pptx': render_pptx, '.pdf': render_pdf}
+
+
+# ===========================
+# Disk Cache
+# ===========================
+def _entry_dir(cache_dir, digest):
+    return os.path.join(cache_dir, digest)
+
+
+def load_manifest(cache_dir, digest):
+    try:
+        with open(os.path.join(_entry_dir(cache_dir, digest), 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _render_to_cache(cache_dir, digest, file_path):
+    """渲染到临时目录，完成后整体改名成缓存目录，读的一方看不到渲染了一半的预览"""
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp_')
+    try:
+        try:
+            pages = RENDERERS[os.path.splitext(file_path)[1].lower()](file_path)[:MAX_PREVIEW_PAGES]
+            manifest = {"status": "ready", "pages": [f"{i + 1:04d}.{ext}" for i, (ext, _) in enumerate(pages)]}
+        except Exception as e:
+            # 文件损坏等：记成失败，不反复重试
+            pages, manifest = [], {"status": "failed", "error": str(e), "pages": []}
+        for name, (_, data) in zip(manifest["pages"], pages):
+            with open(os.path.join(tmp_dir, name), 'wb') as f:
+                f.write(data)
+        manifest["bytes"] = sum(len(data) for _, data in pages)
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        target = _entry_dir(cache_dir, digest)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        with _pending_guard:
+            _pending.pop(digest, None)
+    evict(cache_dir)
+
+
+def evict(cache_dir, limit=None):
+    """缓存总大小超过上限时，按最近访问时间 (manifest 的 mtime) 从旧到新删除整条预览"""
+    limit = PREVIEW_CACHE_BYTES if limit is None else limit
+    entries, total = [], 0
+    for digest in os.listdir(cache_dir):
+        path = _entry_dir(cache_dir, digest)
+        if digest.startswith('.') or not os.path.isdir(path):
+            continue
+        try:
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(os.path.join(path, 'manifest.json')), size, path))
+        except OSError:
+            continue
+        total += size
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def request_preview(cache_dir, file_path):
+    """
+    返回 (digest, manifest)。已有缓存时刷新访问时间并直接返回；
+    否则交给后台线程池渲染 (同一文件只排一次队)，manifest 为 {"status": "rendering"}。
+    """
+    digest = file_digest(file_path)
+    manifest = load_manifest(cache_dir, digest)
+    if manifest is not None:
+        try:
+            os.utime(os.path.join(_entry_dir(cache_dir, digest), 'manifest.json'))
+        except OSError:
+            pass
+        return digest, manifest
+    with _pending_guard:
+        if digest not in _pending:
+            _pending[digest] = _pool().submit(_render_to_cache, cache_dir, digest, file_path)
+    return digest, {"status": "rendering", "pages": []}
+
+
+def page_path(cache_dir, digest, manifest, page):
+    """第 page 页 (从 1 开始) 的缓存文件路径；越界时返回 None"""
+    if not 1 <= page <= len(manifest.get("pages", [])):
+        return None
+    return os.path.join(_entry_dir(cache_dir, digest), manifest["pages"][page - 1])
@@ -0,0 +1,213 @@
+import re
+
+from services.text_scoring import best_similarity
+
+
+# 评分规则：每道题在建题库索引时编译一次成匹配器，批改时只对每题"不同的作答"各算一次得分比例，
+# 再按作答编码 (codes) 广播到所有学生，所以规则再复杂也和精确比对一样是 O(不同作答数)。
+#
+# 标准答案单元格 (已经过 clean_ans 清洗，大写)：
+#   "B"                    精确匹配
+#   "COLOUR|COLOR"         多个可接受答案，任一即可
+#   "COLOUR|COLR=0.5"      备选答案带得分比例 (0~1)
+# 题库的 Rule / Scoring 列 (可选，不区分大小写)：
+#   exact                  默认
+#   set                    多选 / 不计顺序："ABD" = "D,B,A"
+#   partial                多选部分得分：每选对一项得相应比例，选了错误项整题 0 分
+#   partial:A=2,B=1,D=1    同上，按选项权重分配分值
+#   numeric / numeric:0.5 / numeric:5%   数值比较，可带绝对或相对容差
+#   text / text:0.9,0.6    简答题相似度评分 (见 text_scoring)：相似度 ≥ 0.9 得满分，< 0.6 得 0 分，
+#                          中间的按相似度给建议分并列入待复核，由老师确认
+RULE_KINDS = ('exact', 'set', 'partial', 'numeric', 'text')
+TEXT_ACCEPT = 0.9
+TEXT_REJECT = 0.6
+OPTION_SEPARATORS = re.compile(r'[\s,;/、，；]+')
+_WEIGHTED = re.compile(r'^(.*?)\s*=\s*([0-9]*\.?[0-9]+)$')
+_CREDIT = re.compile(r'^(.*?)\s*=\s*(0?\.[0-9]+|[01](?:\.0+)?)$')
+
+
+class ScoringRuleError(ValueError):
+    """题库里的评分规则写法不正确，消息直接返回给前端"""
+
+
+def _alternatives(answer):
+    """
+    'COLOUR|COLR=0.5' -> {'COLOUR': 1.0, 'COLR': 0.5}。
+    只有带 | 的答案才识别 "=比例"，单独的 "X=5" 仍按原样比对。
+    """
+    accepted = {}
+    parts = str(answer).split('|')
+    for part in parts:
+        part = part.strip()
+        credit = 1.0
+        weighted = _CREDIT.match(part) if len(parts) > 1 else None
+        if weighted and weighted.group(1):
+            part, credit = weighted.group(1).strip(), float(weighted.group(2))
+        if part:
+            accepted[part] = max(credit, accepted.get(part, 0.0))
+    return accepted
+
+
+def option_set(text, single_letters):
+    """
+    作答 -> 选项集合。有分隔符时按分隔符切开；
+    选项都是单个字母的题目 (ABCD) 里，连写的 "ABD" 按字母拆开。
+    """
+    parts = [p for p in OPTION_SEPARATORS.split(str(text).strip()) if p]
+    if single_letters and all(p.isalpha() for p in parts):
+        return frozenset(c for p in parts for c in p)
+    return frozenset(parts)
+
+
+def _single_letters(answers):
+    """标准答案是否都由单字母选项组成 ("ABD" / "A,B,D")"""
+    for answer in answers:
+        parts = [p for p in OPTION_SEPARATORS.split(answer) if p]
+        if not parts or not all(p.isalpha() for p in parts):
+            return False
+        if len(parts) > 1 and any(len(p) > 1 for p in parts):
+            return False
+    return True
+
+
+def _parse_number(text):
+    try:
+        return float(str(text).replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def compile_rule(answer, rule=None, q_id=''):
+    """
+    标准答案 + 规则 -> 匹配器 (kind, 参数)。只用元组 / 字典，方便随标准答案一起传给子进程。
+    """
+    rule = str(rule or '').strip()
+    kind, _, arg = rule.partition(':')
+    kind = kind.strip().lower() or 'exact'
+    arg = arg.strip()
+    if kind not in RULE_KINDS:
+        raise ScoringRuleError(f"Unknown scoring rule '{rule}' for question {q_id}")
+    accepted = _alternatives(answer)
+
+    if kind == 'exact':
+        return ('exact', accepted)
+
+    if kind == 'set':
+        single = _single_letters(accepted)
+        return ('set', {option_set(a, single): credit for a, credit in accepted.items()}, single)
+
+    if kind == 'partial':
+        if arg:
+            weights = {}
+            for item in OPTION_SEPARATORS.split(arg.replace(',', ' ')):
+                weighted = _WEIGHTED.match(item)
+                if not weighted:
+                    raise ScoringRuleError(f"Bad option weight '{item}' for question {q_id}")
+                weights[weighted.group(1).strip().upper()] = float(weighted.group(2))
+        else:
+            answer = next(iter(accepted), '')
+            key_options = option_set(answer, _single_letters([answer]))
+            weights = {o: 1.0 for o in key_options}
+        total = sum(weights.values())
+        if total <= 0:
+            raise ScoringRuleError(f"Partial-credit rule for question {q_id} has no options")
+        single = all(len(o) == 1 for o in weights)
+        return ('partial', {o: w / total for o, w in weights.items()}, single)
+
+    if kind == 'text':
+        try:
+            thresholds = [float(t) for t in arg.split(',')] if arg else [TEXT_ACCEPT, TEXT_REJECT]
+        except ValueError:
+            raise ScoringRuleError(f"Bad text thresholds '{arg}' for question {q_id}") from None
+        accept, reject = (thresholds + [TEXT_REJECT])[:2]
+        if not 0 <= reject <= accept <= 1:
+            raise ScoringRuleError(f"Text thresholds for question {q_id} must satisfy 0 <= reject <= accept <= 1")
+        return ('text', accepted, accept, reject)
+
+    # numeric
+    targets = [_parse_number(a) for a in accepted]
+    if not targets or any(t is None for t in targets):
+        raise ScoringRuleError(f"Numeric rule for question {q_id} needs a numeric answer")
+    relative = arg.endswith('%')
+    try:
+        tolerance = float(arg.rstrip('%')) if arg else 0.0
+    except ValueError:
+        raise ScoringRuleError(f"Bad numeric tolerance '{arg}' for question {q_id}") from None
+    return ('numeric', dict(zip(targets, accepted.values())), tolerance / 100 if relative else tolerance, relative)
+
+
+def score_vocab(matcher, vocab):
+    """对一题的作答词表 (不同的清洗后作答) 逐项算得分比例，返回 float 数组"""
+    import numpy as np
+    kind = matcher[0]
+    if kind == 'exact':
+        accepted = matcher[1]
+        if len(accepted) == 1 and next(iter(accepted.values())) == 1.0:
+            answer = next(iter(accepted))
+            return np.array([v == answer for v in vocab], dtype=float)
+        return np.array([accepted.get(v, 0.0) for v in vocab], dtype=float)
+
+    if kind == 'set':
+        _, accepted, single = matcher
+        return np.array([accepted.get(option_set(v, single), 0.0) if v else 0.0 for v in vocab], dtype=float)
+
+    if kind == 'partial':
+        _, weights, single = matcher
+        credits = []
+        for v in vocab:
+            chosen = option_set(v, single)
+            credits.append(0.0 if not chosen or chosen - weights.keys() else sum(weights[o] for o in chosen))
+        return np.minimum(np.array(credits, dtype=float), 1.0)
+
+    if kind == 'text':
+        return text_review(matcher, vocab)[1]
+
+    _, targets, tolerance, relative = matcher
+    credits = []
+    for v in vocab:
+        value = _parse_number(v) if v else None
+        best = 0.0
+        if value is not None:
+            for target, credit in targets.items():
+                allowed = abs(target) * tolerance if relative else tolerance
+                if abs(value - target) <= allowed + 1e-9:
+                    best = max(best, credit)
+        credits.append(best)
+    return np.array(credits, dtype=float)
+
+
+def text_review(matcher, vocab):
+    """
+    简答题：返回 (相似度, 建议得分比例, 待复核) 三个数组。
+    高于 accept 直接满分 (乘以该参考答案的比例)，低于 reject 记 0，中间按相似度给建议分。
+    """
+    import numpy as np
+    _, references, accept, reject = matcher
+    sims, credits, uncertain = [], [], []
+    for v in vocab:
+        sim, credit = best_similarity(references, v) if v else (0.0, 0.0)
+        sims.append(sim)
+        if sim >= accept:
+            credits.append(credit)
+            uncertain.append(False)
+        elif sim < reject:
+            credits.append(0.0)
+            uncertain.append(False)
+        else:
+            credits.append(round(sim * credit, 2))
+            uncertain.append(True)
+    return np.array(sims, dtype=float), np.array(credits, dtype=float), np.array(uncertain, dtype=bool)
+
+
+def compile_rules(answers, rules=None, q_ids=None):
+    """整份题库的匹配器列表；rules 为 None 时全部按精确匹配 (含 | 备选答案)"""
+    rules = rules if rules is not None else [None] * len(answers)
+    q_ids = q_ids if q_ids is not None else [''] * len(answers)
+    return [compile_rule(a, r, q) for a, r, q in zip(answers, rules, q_ids)]
+
+
+def key_matchers(key):
+    """标准答案里的匹配器；旧会话里保存的 key 没有时按精确匹配现编"""
+    if key.get("matchers") is None:
+        key["matchers"] = compile_rules(key["answers"])
+    return key["matchers"]
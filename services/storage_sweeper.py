@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from services.library_service import get_db_connection, material_size
+
+
+# 资料库磁盘清理：后台线程定期把数据库和磁盘对一遍账，
+#   1. 分批扫 materials 表，按磁盘上的实际大小修正 size_bytes (空间配额以它为准)；
+#   2. 删除 library/User_Uploads 里没有任何记录引用的文件 (删除资料时没删掉的、上传中途失败留下的)，
+#      库里还没有引用 User_Uploads 的资料时整步跳过 (新库 / 库和目录对不上)；
+#   3. 删除 library/audio/u<id>/ 下超过保留期的生成音频。
+# 只动这两个目录：分类目录里的官方资料、.gz 预压缩文件 (原文件还在时) 和预览缓存都不碰。
+# 每批之间停顿一下，单次只占用很短的数据库连接，不阻塞请求。
+# 多个 worker 各有一个清理线程，通过 maintenance_runs 表里的租约保证每个周期只有一个真正执行。
+SWEEP_INTERVAL = int(os.environ.get("BANG_SWEEP_INTERVAL", 3600))  # 秒，0 表示不启动后台清理
+SWEEP_BATCH = 500
+SWEEP_PAUSE = 0.05
+# 比这更新的文件不动：上传是先写文件再登记，音频是先写临时文件再改名
+ORPHAN_GRACE = timedelta(hours=1)
+AUDIO_RETENTION = timedelta(days=int(os.environ.get("BANG_AUDIO_RETENTION_DAYS", 7)))
+UPLOAD_DIR_NAME = "User_Uploads"
+AUDIO_DIR_NAME = "audio"
+LEASE_NAME = "storage_sweep"
+
+_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+_thread = None
+_thread_guard = threading.Lock()
+
+
+def _in_upload_dir(path):
+    return bool(path) and os.path.basename(os.path.dirname(path)) == UPLOAD_DIR_NAME
+
+
+def reconcile_materials(batch=SWEEP_BATCH):
+    """
+    按 id 分批核对资料记录：修正与磁盘不符的 size_bytes，统计文件已丢失的记录。
+    返回 (User_Uploads 里被引用的文件名集合, 统计)。按文件名比对，资料库目录整体搬迁后也不会误删。
+    """
+    referenced, report = set(), {"checked": 0, "resized": 0, "missing": 0}
+    last_id = 0
+    while True:
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("SELECT id, file_path, cover_path, size_bytes FROM materials WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, batch)).fetchall()
+            updates = []
+            for row in rows:
+                for path in (row["file_path"], row["cover_path"]):
+                    if _in_upload_dir(path):
+                        referenced.add(os.path.basename(path))
+                if not row["file_path"] or not os.path.exists(row["file_path"]):
+                    report["missing"] += 1
+                size = material_size(row["file_path"], row["cover_path"])
+                if size != row["size_bytes"]:
+                    updates.append((size, row["id"]))
+            if updates:
+                conn.executemany("UPDATE materials SET size_bytes = ? WHERE id = ?", updates)
+                conn.commit()
+        finally:
+            conn.close()
+        report["checked"] += len(rows)
+        report["resized"] += len(updates)
+        if len(rows) < batch:
+            return referenced, report
+        last_id = rows[-1]["id"]
+        time.sleep(SWEEP_PAUSE)
+
+
+def _remove(entry, report):
+    try:
+        size = entry.stat().st_size
+        os.remove(entry.path)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        logging.warning(f"Storage sweeper could not remove {entry.path}: {e}")
+        report["failed"] += 1
+        return
+    report["removed"] += 1
+    report["freed_bytes"] += size
+
+
+def first_upload_time():
+    """库里最早一份上传资料的时间；没有任何资料时返回 None"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT MIN(upload_time) FROM materials").fetchone()
+    conn.close()
+    return datetime.fromisoformat(row[0]) if row[0] else None
+
+
+def purge_orphans(upload_dir, referenced, since, now=None, batch=SWEEP_BATCH):
+    """
+    删除 User_Uploads 里没有被引用的文件，只删 since (库里最早的上传时间) 之后、宽限期之前出现的：
+    仓库自带的示例文件、换了新库后的旧文件都早于 since，不会被当成孤立文件。
+    被引用文件的 .gz 预压缩版本保留。
+    """
+    report = {"removed": 0, "failed": 0, "freed_bytes": 0}
+    if not os.path.isdir(upload_dir) or since is None or not referenced:
+        return report
+    earliest = since.timestamp()
+    cutoff = ((now or datetime.now()) - ORPHAN_GRACE).timestamp()
+    with os.scandir(upload_dir) as entries:
+        for i, entry in enumerate(entries, 1):
+            if i % batch == 0:
+                time.sleep(SWEEP_PAUSE)
+            name = entry.name
+            if name in referenced or (name.endswith('.gz') and name[:-3] in referenced):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                if not entry.is_file(follow_symlinks=False) or not earliest <= mtime < cutoff:
+                    continue
+            except OSError:
+                continue
+            _remove(entry, report)
+    return report
+
+
+def purge_audio(audio_dir, now=None, batch=SWEEP_BATCH):
+    """删除 audio/u<id>/ 下超过保留期的生成音频和中途失败留下的临时文件；audio 根目录里的共享音频不动"""
+    report = {"removed": 0, "failed": 0, "freed_bytes": 0}
+    if not os.path.isdir(audio_dir):
+        return report
+    now = now or datetime.now()
+    expired_before = (now - AUDIO_RETENTION).timestamp()
+    stale_before = (now - ORPHAN_GRACE).timestamp()
+    seen = 0
+    with os.scandir(audio_dir) as owners:
+        owner_dirs = [entry.path for entry in owners if re.fullmatch(r'u\d+', entry.name) and entry.is_dir(follow_symlinks=False)]
+    for owner_dir in owner_dirs:
+        with os.scandir(owner_dir) as entries:
+            for entry in entries:
+                seen += 1
+                if seen % batch == 0:
+                    time.sleep(SWEEP_PAUSE)
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if entry.name.startswith('.tmp_'):
+                    expired = mtime < stale_before
+                else:
+                    expired = entry.name.endswith('.mp3') and mtime < expired_before
+                if expired:
+                    _remove(entry, report)
+    return report
+
+
+def sweep(library_path):
+    """完整清理一轮，返回统计"""
+    started = time.perf_counter()
+    referenced, materials = reconcile_materials()
+    uploads = purge_orphans(os.path.join(library_path, UPLOAD_DIR_NAME), referenced, first_upload_time())
+    audio = purge_audio(os.path.join(library_path, AUDIO_DIR_NAME))
+    return {
+        "materials": materials,
+        "uploads": uploads,
+        "audio": audio,
+        "freed_bytes": uploads["freed_bytes"] + audio["freed_bytes"],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ===========================
+# Lease & Background Thread
+# ===========================
+def acquire_lease(min_gap):
+    """距上一轮开始已超过 min_gap 秒时占下本轮，返回是否由本进程执行"""
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT OR IGNORE INTO maintenance_runs (name) VALUES (?)", (LEASE_NAME,))
+        cursor = conn.execute(
+            "UPDATE maintenance_runs SET holder = ?, started_at = ?, finished_at = NULL "
+            "WHERE name = ? AND (started_at IS NULL OR started_at <= ?)",
+            (_HOLDER, now, LEASE_NAME, now - timedelta(seconds=min_gap)))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def _finish_lease(report):
+    conn = get_db_connection()
+    conn.execute("UPDATE maintenance_runs SET finished_at = ?, report = ? WHERE name = ? AND holder = ?",
+                 (datetime.now(), json.dumps(report), LEASE_NAME, _HOLDER))
+    conn.commit()
+    conn.close()
+
+
+def run_sweep(library_path, force=False):
+    """
+    租约到期时清理一轮并记录结果，返回统计；本周期已由其他 worker 执行过时返回 None。
+    force=True (命令行手动触发) 时不检查间隔。
+    """
+    if not acquire_lease(0 if force else SWEEP_INTERVAL):
+        return None
+    report = sweep(library_path)
+    _finish_lease(report)
+    return report
+
+
+def _loop(library_path):
+    # 启动时错开一段随机时间，避免所有 worker 同时抢租约、也不拖慢启动
+    time.sleep(random.uniform(30, 90))
+    while True:
+        try:
+            report = run_sweep(library_path)
+            if report and (report["freed_bytes"] or report["materials"]["resized"]):
+                logging.info(f"Storage sweep freed {report['freed_bytes']} bytes: {report}")
+        except Exception as e:
+            logging.error(f"Storage Sweep Error: {e}")
+        time.sleep(SWEEP_INTERVAL)
+
+
+def start_sweeper(library_path):
+    """启动本进程的后台清理线程 (每个进程只启动一个)；SWEEP_INTERVAL 为 0 时不启动"""
+    global _thread
+    if SWEEP_INTERVAL <= 0:
+        return None
+    with _thread_guard:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, args=(library_path,), name="storage-sweeper", daemon=True)
+            _thread.start()
+        return _thread
@@ -0,0 +1,123 @@
+import json
+
+from services.library_service import get_db_connection
+from services.http_cache import file_version
+
+
+# 表里 student 列同时存学生行和两条保留行 (班级 meta、名单)。学生行一律加 STUDENT_PREFIX，
+# 叫 "__META__" 之类的学生也不会和保留行撞上。
+META_KEY = '__META__'
+STUDENTS_KEY = '__STUDENTS__'
+STUDENT_PREFIX = 's:'
+# 索引的存储格式，改动行键 / 记录结构时加 1，旧格式的索引在下次查询时重建
+INDEX_FORMAT = 2
+ROSTER_EXAM = '__ROSTER__'
+EXCLUDE_COLS = ['Name', 'Exam', 'Total']
+
+
+def _student_key(name):
+    return STUDENT_PREFIX + str(name)
+
+
+def build_student_index(history_df):
+    """
+    一次向量化计算整个班级的学生时间序列，返回 (meta, 名单, {学生: [记录]})。
+    每条记录为 {exam, scores: {科目: 分数}, total, rank, percentile, class_size}，考试按上传顺序排列；
+    科目分数单独放在 scores 里，科目叫 total / rank 之类也不会盖掉汇总字段。
+    """
+    import pandas as pd
+    if history_df is None or history_df.empty or 'Exam' not in history_df.columns:
+        return {"exams": [], "subjects": []}, [], {}
+
+    subjects = [c for c in history_df.columns if c not in EXCLUDE_COLS]
+    df = history_df[history_df['Exam'] != ROSTER_EXAM].dropna(subset=['Name', 'Exam'])
+    roster = history_df['Name'].dropna().astype(str).unique().tolist()
+    exams = df['Exam'].astype(str).unique().tolist()
+    if df.empty:
+        return {"exams": [], "subjects": subjects}, roster, {}
+
+    # 汇总列不写回 df：科目列可能正好叫 _total 这类名字
+    order = df['Exam'].astype(str).map({e: i for i, e in enumerate(exams)}).sort_values(kind='stable').index
+    names = df['Name'].astype(str)
+    exam_col = df['Exam'].astype(str)
+    scores = df[subjects].apply(pd.to_numeric, errors='coerce').fillna(0) if subjects else pd.DataFrame(index=df.index)
+    totals = scores.sum(axis=1).round(2)
+    by_exam = totals.groupby(exam_col, sort=False)
+    ranks = by_exam.rank(method='min', ascending=False).astype(int)
+    pcts = (by_exam.rank(method='max', pct=True) * 100).round(1)
+    sizes = by_exam.transform('size')
+
+    records = {}
+    score_rows = scores.loc[order].round(2).to_dict('records')
+    for name, exam, total, rank, pct, size, subject_scores in zip(
+            names[order], exam_col[order], totals[order], ranks[order], pcts[order], sizes[order], score_rows):
+        records.setdefault(name, []).append({
+            "exam": exam, "scores": subject_scores, "total": float(total),
+            "rank": int(rank), "percentile": float(pct), "class_size": int(size)
+        })
+    return {"exams": exams, "subjects": subjects}, roster, records
+
+
+def refresh_student_index(user_id, class_id, history_df, source_version=None):
+    """班级数据每次写入后调用：整体替换该班级的索引行，source_version 为对应 CSV 的 file_version"""
+    meta, roster, records = build_student_index(history_df)
+    meta["source_version"] = list(source_version) if source_version else None
+    meta["format"] = INDEX_FORMAT
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM performance_student_index WHERE user_id = ? AND class_id = ?", (user_id, class_id))
+    rows = [(user_id, class_id, META_KEY, json.dumps(meta)), (user_id, class_id, STUDENTS_KEY, json.dumps(roster))]
+    rows += [(user_id, class_id, _student_key(name), json.dumps(recs)) for name, recs in records.items()]
+    cursor.executemany(
+        "INSERT INTO performance_student_index (user_id, class_id, student, records) VALUES (?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def drop_student_index(user_id, class_id):
+    conn = get_db_connection()
+    conn.execute("DELETE FROM performance_student_index WHERE user_id = ? AND class_id = ?", (user_id, class_id))
+    conn.commit()
+    conn.close()
+
+
+def _fetch(user_id, class_id, keys):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in keys)
+    cursor.execute(
+        f"SELECT student, records FROM performance_student_index WHERE user_id = ? AND class_id = ? AND student IN ({placeholders})",
+        (user_id, class_id, *keys)
+    )
+    rows = {row["student"]: json.loads(row["records"]) for row in cursor.fetchall()}
+    conn.close()
+    return rows
+
+
+def _lookup(user_id, class_id, path, key):
+    """
+    一次主键查询取出班级 meta 和 key 对应的行，与班级人数无关。
+    索引缺失、格式过旧或 CSV 被外部修改过 (文件版本不一致) 时先重建：
+    版本在读文件之前取，读的过程中文件又被替换时版本对不上，下次查询会再重建一次。
+    """
+    import pandas as pd
+    version = file_version(path)
+    if version is None:
+        return None
+    rows = _fetch(user_id, class_id, [META_KEY, key])
+    meta = rows.get(META_KEY)
+    if meta is None or meta.get("format") != INDEX_FORMAT or meta.get("source_version") != list(version):
+        refresh_student_index(user_id, class_id, pd.read_csv(path), version)
+        rows = _fetch(user_id, class_id, [META_KEY, key])
+        meta = rows.get(META_KEY)
+    return {"meta": meta, "records": rows.get(key)}
+
+
+def get_student_history(user_id, class_id, path, student):
+    return _lookup(user_id, class_id, path, _student_key(student))
+
+
+def get_class_students(user_id, class_id, path):
+    history = _lookup(user_id, class_id, path, STUDENTS_KEY)
+    return (history["records"] or []) if history else None
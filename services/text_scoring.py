@@ -0,0 +1,73 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+
+# 简答题的离线相似度评分：不联网、不需要 GPU，纯 Python。
+# 相似度取 "归一化编辑距离" 与 "词集合 Dice 系数" 中较高的一个：
+#   编辑距离容忍拼写错误 ("recieve" / "receive")，
+#   词集合容忍多一个少一个虚词或语序不同 ("went to school" / "Went to the school")。
+# 同一题同一作答只算一次：调用方按作答词表去重，这里再按 (参考答案, 作答) 缓存，
+# 多个班级 / 多个分片里重复出现的作答不会重复计算。
+SIMILARITY_CACHE_SIZE = 65536
+# 超长作答只比较前这么多个字符，编辑距离是 O(m × n)
+MAX_COMPARE_CHARS = 200
+
+_TOKEN_RE = re.compile(r'[0-9A-Z]+|[一-鿿]')
+
+
+def normalize_text(text):
+    """NFKC + 大写 + 去掉标点，词之间只留一个空格"""
+    return ' '.join(tokenize(text))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(unicodedata.normalize('NFKC', str(text)).upper())
+
+
+def edit_similarity(a, b):
+    """1 - Levenshtein 距离 / 较长字符串长度"""
+    a, b = a[:MAX_COMPARE_CHARS], b[:MAX_COMPARE_CHARS]
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1.0 - previous[-1] / len(a)
+
+
+def token_similarity(a_tokens, b_tokens):
+    """词集合的 Dice 系数 2|A∩B| / (|A| + |B|)"""
+    a, b = set(a_tokens), set(b_tokens)
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+@lru_cache(maxsize=SIMILARITY_CACHE_SIZE)
+def similarity(reference, response):
+    """参考答案与作答的相似度 (0~1)"""
+    ref_tokens, resp_tokens = tokenize(reference), tokenize(response)
+    if not ref_tokens or not resp_tokens:
+        return 0.0
+    return max(edit_similarity(' '.join(ref_tokens), ' '.join(resp_tokens)),
+               token_similarity(ref_tokens, resp_tokens))
+
+
+def best_similarity(references, response):
+    """
+    多个参考答案 {答案: 得分比例} 中与作答最接近的一个：返回 (相似度, 该答案的得分比例)
+    """
+    best = (0.0, 0.0)
+    for reference, credit in references.items():
+        score = similarity(reference, response)
+        if (score, credit) > best:
+            best = (score, credit)
+    return best